@@ -3,22 +3,17 @@
 
 import sys
 import math
+import numpy
 import ete3
 import os
 import subprocess
+import multiprocessing
 from ete3 import Tree, SeqGroup
 from subprocess import call
-from scipy.optimize import fmin
-from scipy.optimize import fmin_powell
-from scipy.optimize import fmin_l_bfgs_b
-from scipy.optimize import fmin_tnc
-from scipy import stats
-import matplotlib.pyplot as plt
-from subprocess import call
-from nexus import NexusReader
-from ete3 import NodeStyle
+from nexus import NexusTreeReader
 import datetime
 import re
+import json
 
 class um_tree:
 	def __init__(self, tree, fileextension=None, unique=None):
@@ -32,7 +27,13 @@ class um_tree:
 		internal_node = []
 		cnt = 0
 		for n in self.nodes:
-			node_age = n.get_distance(self.tree)
+			"""the branch lengths up to the root, summed as n.get_distance(self.tree)
+			does but without its search of the whole tree for every node"""
+			node_age = 0.0
+			curr = n
+			while curr is not self.tree:
+				node_age += curr.dist
+				curr = curr.up
 			n.add_feature("age", node_age)
 			if not n.is_leaf():
 				n.add_feature("id", cnt)
@@ -139,6 +140,141 @@ class um_tree:
 		for wt in wt_list:
 			wt.count_num_lines()
 
+		self._set_species(coa_roots)
+		return wt_list, num_spe
+
+
+	def sweep_thresholds(self, select = None):
+		"""(threshold node, tree_time) for every node of self.nodes in order,
+		or only for the node indices in select,
+		the same likelihood as tree_time(*get_waiting_times(node)). The waiting
+		times are the intervals between the node ages and do not depend on the
+		threshold. Every node before the threshold is a speciation event, a
+		later node starts a coalescent if its parent is above the threshold
+		and joins the coalescent of its parent otherwise. Moving the threshold
+		one node down turns it into a speciation event and splits its
+		coalescent into the ones of its children, only those nodes change"""
+		nodes = self.nodes
+		num = len(nodes)
+		ppos, kept, kept_lengths = self._node_index()
+		ppos = list(ppos)
+
+		"""spe_delta: change of the speciation lineages at every node,
+		rank: size of the coalescent of a node before it joins, 0 if none"""
+		spe_delta = numpy.zeros(num, dtype = numpy.int64)
+		rank = numpy.zeros(num, dtype = numpy.int64)
+		group = [0] * num
+		members = {}
+		for j in range(num):
+			if ppos[j] < 0:
+				group[j] = j
+				members[j] = [j]
+				spe_delta[j] = -1
+			else:
+				group[j] = group[ppos[j]]
+				members[group[j]].append(j)
+			rank[j] = len(members[group[j]])
+
+		for t in range(num):
+			if select != None and t not in select:
+				self._split_threshold(t, ppos, spe_delta, rank, group, members)
+				continue
+			spe_n = 2 + numpy.concatenate(([0], numpy.cumsum(spe_delta)[:-1]))
+			events = numpy.flatnonzero(rank)
+			"""a node changes the coalescents from the next kept waiting time on"""
+			idx = numpy.searchsorted(kept, events + 1)
+			valid = idx < len(kept)
+			idx = idx[valid]
+			r = rank[events[valid]].astype(numpy.float64)
+			old = r > 1
+			coa_idx = numpy.concatenate((idx, idx[old]))
+			coa_c = numpy.concatenate(((r + 1.0) * r, (r * (r - 1.0))[old]))
+			coa_sign = numpy.concatenate((numpy.ones(len(r)), -1.0 * numpy.ones(int(old.sum()))))
+			num_coa_event = int(numpy.count_nonzero(events < kept[-1]))
+			arrays = (kept_lengths, spe_n[kept], coa_idx, coa_c, coa_sign, num_coa_event)
+			yield nodes[t], tree_time(None, 2 + t, arrays = arrays)
+			self._split_threshold(t, ppos, spe_delta, rank, group, members)
+
+
+	def _node_index(self):
+		"""position of the parent of every node in self.nodes (-1 below the
+		root), the waiting times longer than 1e-8, waiting time i ends at
+		node i, and their lengths"""
+		pos = {}
+		for i in range(len(self.nodes)):
+			pos[self.nodes[i].id] = i
+		ppos = []
+		ages = []
+		for node in self.nodes:
+			if node.up.is_root():
+				ppos.append(-1)
+			else:
+				ppos.append(pos[node.up.id])
+			ages.append(node.age)
+		lengths = numpy.diff(numpy.array([0.0] + ages))
+		kept = numpy.flatnonzero(lengths > 0.00000001)
+		return numpy.array(ppos, dtype = numpy.int64), kept, lengths[kept]
+
+
+	def threshold_arrays(self, coa, group_of = None, num_groups = 1, index = None):
+		"""tree_time arrays of any split of self.nodes into speciation and
+		coalescent nodes (coa, a boolean array in the order of self.nodes),
+		with the threshold group of every coalescent change for
+		multi_tree_time. A coalescent node whose parent is a speciation node
+		starts a coalescent, the others join the one of their parent"""
+		if index == None:
+			index = self._node_index()
+		ppos, kept, kept_lengths = index
+		num = len(coa)
+		if group_of is None:
+			group_of = numpy.zeros(num, dtype = numpy.int64)
+		parent_coa = numpy.where(ppos >= 0, coa[numpy.maximum(ppos, 0)], False)
+		spe_delta = numpy.where(coa, numpy.where(parent_coa, 0, -1), 1)
+		spe_n = 2 + numpy.concatenate(([0], numpy.cumsum(spe_delta)[:-1]))
+
+		"""root of the coalescent of every node by pointer jumping, the rank
+		of a node is its place in the coalescent ordered by age"""
+		ptr = numpy.where(coa & parent_coa, ppos, numpy.arange(num))
+		while True:
+			nxt = ptr[ptr]
+			if numpy.array_equal(nxt, ptr):
+				break
+			ptr = nxt
+		events = numpy.flatnonzero(coa)
+		order = numpy.argsort(ptr[events], kind = "stable")
+		roots = ptr[events][order]
+		rank = numpy.empty(len(events), dtype = numpy.int64)
+		rank[order] = numpy.arange(len(events)) - numpy.searchsorted(roots, roots) + 1
+
+		idx = numpy.searchsorted(kept, events + 1)
+		valid = idx < len(kept)
+		idx = idx[valid]
+		r = rank[valid].astype(numpy.float64)
+		g = group_of[events[valid]]
+		old = r > 1
+		coa_idx = numpy.concatenate((idx, idx[old]))
+		coa_c = numpy.concatenate(((r + 1.0) * r, (r * (r - 1.0))[old]))
+		coa_sign = numpy.concatenate((numpy.ones(len(r)), -1.0 * numpy.ones(int(old.sum()))))
+		coa_group = numpy.concatenate((g, g[old]))
+		num_coa_event = numpy.bincount(group_of[events[events < kept[-1]]], minlength = num_groups)
+		return kept_lengths, spe_n[kept], coa_idx, coa_c, coa_sign, coa_group, num_coa_event
+
+
+	def set_coalescent(self, coa):
+		"""species of a split of self.nodes into speciation and coalescent
+		nodes, as get_waiting_times() leaves them for one threshold"""
+		pos = {}
+		for j in range(len(self.nodes)):
+			pos[self.nodes[j].id] = j
+		coa_roots = []
+		for j in range(len(self.nodes)):
+			node = self.nodes[j]
+			if coa[j] and (node.up.is_root() or not coa[pos[node.up.id]]):
+				coa_roots.append(node)
+		self._set_species(coa_roots)
+
+
+	def _set_species(self, coa_roots):
 		self.species_list = []
 		all_coa_leaves = []
 		self.coa_roots = coa_roots
@@ -152,7 +288,21 @@ class um_tree:
 			if leaf not in all_coa_leaves:
 				self.species_list.append([leaf])
 
-		return wt_list, num_spe
+
+	def _split_threshold(self, t, ppos, spe_delta, rank, group, members):
+		"""node t becomes a speciation event, its children start coalescents"""
+		spe_delta[t] = 1
+		rank[t] = 0
+		split = members.pop(t)
+		for j in split[1:]:
+			if ppos[j] == t:
+				group[j] = j
+				members[j] = [j]
+				spe_delta[j] = -1
+			else:
+				group[j] = group[ppos[j]]
+				members[group[j]].append(j)
+			rank[j] = len(members[group[j]])
 
 
 	def show(self, wt_list):
@@ -176,6 +326,8 @@ class um_tree:
 		for leaf in self.tree.get_leaves():
 			all_taxa_name.append(leaf.name)
 
+		"""the treeview (Qt) is only loaded when the species are styled for the plot"""
+		from ete3 import NodeStyle
 		style0 = NodeStyle()
 		style0["fgcolor"] = "#000000"
 		style0["vt_line_color"] = "#0000aa"
@@ -297,6 +449,7 @@ class um_tree:
 			nl_list.append(wt.get_num_branches())
 			times.append(last_time)
 			last_time = wt.length + last_time
+		import matplotlib.pyplot as plt
 		plt.plot(times, nl_list)
 		plt.ylabel('Number of lineages')
 		plt.xlabel('Time')
@@ -306,6 +459,7 @@ class um_tree:
 
 class lh_ratio_test:
 	def __init__(self, null_llh, llh, df):
+		from scipy import stats
 		self.lr = 2.0 * (llh - null_llh)
 		self.p = 1 - stats.chi2.cdf(self.lr, df)
 
@@ -544,90 +698,211 @@ class waiting_time:
 
 
 class tree_time:
-	def __init__(self, wtimes, num_spe):
+	"""Likelihood of one threshold. The waiting times are kept as arrays:
+	lengths, number of speciation lineages and the changes of the coalescent
+	groups, the n(n-1) of a group enters (coa_sign 1) or leaves (-1) the
+	coalescent rate from waiting time coa_idx on. The likelihood and its
+	derivatives in spe_p and coa_p are computed without per object loops.
+	wtimes is None when the arrays come from um_tree.sweep_thresholds()"""
+	def __init__(self, wtimes, num_spe, arrays = None):
 		self.w_time_list = wtimes
-		self.llh = 0
-		self.spe_rate = 0.001
-		self.spe_p = 1
-		self.coa_rate = 0.001
-		self.coa_p = 1
+		if arrays == None:
+			arrays = self._wtimes_arrays(wtimes)
+		lengths, spe_n, coa_idx, coa_c, coa_sign, num_coa_event = arrays
+		self.lengths = numpy.asarray(lengths, dtype = numpy.float64)
+		self.spe_n = numpy.asarray(spe_n, dtype = numpy.float64)
+		self.coa_idx = numpy.asarray(coa_idx, dtype = numpy.int64)
+		self.coa_c = numpy.asarray(coa_c, dtype = numpy.float64)
+		self.coa_sign = numpy.asarray(coa_sign, dtype = numpy.float64)
+		"""log n of the lineage counts, 0 where there is no speciation lineage"""
+		self.has_spe = self.spe_n > 0
+		self.log_spe_n = numpy.log(numpy.where(self.has_spe, self.spe_n, 1.0))
+		self.log_coa_c = numpy.log(self.coa_c)
 		self.num_species = num_spe
 		self.numSpeEvent = self.num_species - 1
-		last_wc = self.w_time_list[-1]
-		self.numCoaEvent = 0
-		for coa in last_wc.coas.coa_list:
-			self.numCoaEvent = self.numCoaEvent + coa.getNumDivEvent()
-		spe_rate_dn = 0
-		coa_rate_dn = 0
-		for w_time in self.w_time_list:
-			spe_rate_dn = spe_rate_dn + w_time.scaleSpeBranchL()
-			coa_rate_dn = coa_rate_dn + w_time.scaleCoaBranchL()
+		self.numCoaEvent = num_coa_event
+		self.llh = 0
+		self.spe_p = None
+		self.coa_p = None
+		self.update(1, 1)
+
+
+	def _wtimes_arrays(self, wtimes):
+		lengths = []
+		spe_n = []
+		coa_idx = []
+		coa_c = []
+		coa_sign = []
+		last = {}
+		for i in range(len(wtimes)):
+			wt = wtimes[i]
+			lengths.append(wt.length)
+			spe_n.append(wt.spe_n)
+			curr = {}
+			for coa in wt.coas.coa_list:
+				c = coa.num_individual * (coa.num_individual - 1.0)
+				curr[c] = curr.get(c, 0) + 1
+			for c in set(curr) | set(last):
+				diff = curr.get(c, 0) - last.get(c, 0)
+				for j in range(abs(diff)):
+					coa_idx.append(i)
+					coa_c.append(c)
+					coa_sign.append(1.0 if diff > 0 else -1.0)
+			last = curr
+		num_coa_event = 0
+		for coa in wtimes[-1].coas.coa_list:
+			num_coa_event = num_coa_event + coa.getNumDivEvent()
+		return lengths, spe_n, coa_idx, coa_c, coa_sign, num_coa_event
 
-		if spe_rate_dn == 0:
-			self.spe_rate = 0
-		else:
-			self.spe_rate = self.numSpeEvent/spe_rate_dn
-
-		if coa_rate_dn == 0:
-			self.coa_rate = 0
-		else:
-			self.coa_rate = self.numCoaEvent/coa_rate_dn
 
 	def show(self):
 		print("This is tree_time with spe event: " + repr(self.numSpeEvent) + ", coa event: " + repr(self.numCoaEvent))
 
 
 	def sum_llh(self):
-
-		self.llh = 0.0
-		for w_time in self.w_time_list:
-			logl = w_time.logl()
-			if logl == None:
-				self.llh = -sys.float_info.max
-				print("wtime logl infinity!!")
-				break
-			else:
-				self.llh = self.llh + logl
-
 		return self.llh
 
+
 	def update(self, spe_p, coa_p):
+		"""ML rates for the given exponents, the log likelihood and its gradient"""
+		if spe_p == self.spe_p and coa_p == self.coa_p:
+			return
 		self.spe_p = spe_p
 		self.coa_p = coa_p
-
-		for w_time in self.w_time_list:
-			w_time.update_p(spe_p, coa_p)
-		spe_rate_dn = 0
-		coa_rate_dn = 0
-		for w_time in self.w_time_list:
-			spe_rate_dn = spe_rate_dn + w_time.scaleSpeBranchL()
-			coa_rate_dn = coa_rate_dn + w_time.scaleCoaBranchL()
+		x = self.lengths
+		num_wt = len(x)
+
+		"""waiting times without speciation lineages add nothing to the rate,
+		also at spe_p = 0 where math.pow(0, 0) used to count them once"""
+		spe_b = numpy.where(self.has_spe, numpy.power(self.spe_n, spe_p), 0.0)
+		spe_db = spe_b * self.log_spe_n
+		spe_rate_dn = numpy.dot(spe_b, x)
+		spe_rate_ddn = numpy.dot(spe_db, x)
+
+		coa_scale = self.coa_sign * numpy.power(self.coa_c, coa_p)
+		coa_b = numpy.cumsum(numpy.bincount(self.coa_idx, weights = coa_scale, minlength = num_wt))
+		coa_db = numpy.cumsum(numpy.bincount(self.coa_idx, weights = coa_scale * self.log_coa_c, minlength = num_wt))
+		coa_rate_dn = numpy.dot(coa_b, x)
+		coa_rate_ddn = numpy.dot(coa_db, x)
 
 		if spe_rate_dn == 0:
 			self.spe_rate = 0
+			spe_drate = 0.0
 		else:
-			self.spe_rate = self.numSpeEvent/spe_rate_dn
+			self.spe_rate = float(self.numSpeEvent/spe_rate_dn)
+			spe_drate = -1.0 * self.spe_rate * spe_rate_ddn / spe_rate_dn
 
 		if coa_rate_dn == 0:
-			self.coa_rate =0
+			self.coa_rate = 0
+			coa_drate = 0.0
 		else:
-			self.coa_rate = self.numCoaEvent/coa_rate_dn
+			self.coa_rate = float(self.numCoaEvent/coa_rate_dn)
+			coa_drate = -1.0 * self.coa_rate * coa_rate_ddn / coa_rate_dn
 
+		b = self.spe_rate * spe_b + self.coa_rate * coa_b
+		prob = b * numpy.exp(-1.0 * b * x)
+		if numpy.any(prob <= 0):
+			print("wtime logl infinity!!")
+			self.llh = -sys.float_info.max
+			self.grad_spe = 0.0
+			self.grad_coa = 0.0
+			return
+		self.llh = float(numpy.sum(numpy.log(prob)))
+
+		"""d log(b exp(-bx)) = db (1/b - x)"""
+		w = 1.0 / b - x
+		self.grad_spe = float(numpy.dot(spe_drate * spe_b + self.spe_rate * spe_db, w))
+		self.grad_coa = float(numpy.dot(coa_drate * coa_b + self.coa_rate * coa_db, w))
 
-		for w_time in self.w_time_list:
-			w_time.update_rate(self.spe_rate, self.coa_rate)
 
 	def bprime_spe(self):
-		bp = 0.0
-		for wt in self.w_time_list:
-			bp = bp + wt.bprime_spe()
-		return bp
+		"""derivative of the log likelihood in spe_p"""
+		return self.grad_spe
+
 
 	def bprime_coa(self):
-		bp = 0.0
-		for wt in self.w_time_list:
-			bp = bp + wt.bprime_coa()
-		return bp
+		"""derivative of the log likelihood in coa_p"""
+		return self.grad_coa
+
+
+class multi_tree_time:
+	"""Likelihood of a delimitation with several thresholds, the arrays of
+	um_tree.threshold_arrays(). The speciation process is shared, every
+	threshold group has its own coalescent rate and exponent, coa_group is
+	the group of every coalescent change"""
+	def __init__(self, arrays, num_spe, num_groups):
+		lengths, spe_n, coa_idx, coa_c, coa_sign, coa_group, num_coa_event = arrays
+		self.lengths = numpy.asarray(lengths, dtype = numpy.float64)
+		self.spe_n = numpy.asarray(spe_n, dtype = numpy.float64)
+		self.coa_c = numpy.asarray(coa_c, dtype = numpy.float64)
+		self.coa_sign = numpy.asarray(coa_sign, dtype = numpy.float64)
+		self.coa_group = numpy.asarray(coa_group, dtype = numpy.int64)
+		self.num_groups = num_groups
+		"""index of the (waiting time, group) cell of every coalescent change"""
+		self.coa_cell = numpy.asarray(coa_idx, dtype = numpy.int64) * num_groups + self.coa_group
+		self.has_spe = self.spe_n > 0
+		self.log_spe_n = numpy.log(numpy.where(self.has_spe, self.spe_n, 1.0))
+		self.log_coa_c = numpy.log(self.coa_c)
+		self.num_species = num_spe
+		self.numSpeEvent = self.num_species - 1
+		self.numCoaEvent = numpy.asarray(num_coa_event, dtype = numpy.float64)
+		self.llh = 0
+		self.para = None
+		self.update(1, [1] * num_groups)
+
+
+	def _group_sums(self, weights):
+		num_wt = len(self.lengths)
+		cells = numpy.bincount(self.coa_cell, weights = weights, minlength = num_wt * self.num_groups)
+		return numpy.cumsum(cells.reshape(num_wt, self.num_groups), axis = 0)
+
+
+	def update(self, spe_p, coa_p):
+		"""ML rates for the exponents (coa_p one per group), the log
+		likelihood and its gradient, as tree_time.update()"""
+		para = (spe_p,) + tuple(coa_p)
+		if para == self.para:
+			return
+		self.para = para
+		x = self.lengths
+
+		spe_b = numpy.where(self.has_spe, numpy.power(self.spe_n, spe_p), 0.0)
+		spe_db = spe_b * self.log_spe_n
+		spe_rate_dn = numpy.dot(spe_b, x)
+		spe_rate_ddn = numpy.dot(spe_db, x)
+		if spe_rate_dn == 0:
+			self.spe_rate = 0
+			spe_drate = 0.0
+		else:
+			self.spe_rate = float(self.numSpeEvent/spe_rate_dn)
+			spe_drate = -1.0 * self.spe_rate * spe_rate_ddn / spe_rate_dn
+
+		coa_scale = self.coa_sign * numpy.power(self.coa_c, numpy.asarray(coa_p, dtype = numpy.float64)[self.coa_group])
+		coa_b = self._group_sums(coa_scale)
+		coa_db = self._group_sums(coa_scale * self.log_coa_c)
+		coa_rate_dn = numpy.dot(x, coa_b)
+		coa_rate_ddn = numpy.dot(x, coa_db)
+		has_coa = coa_rate_dn > 0
+		dn = numpy.where(has_coa, coa_rate_dn, 1.0)
+		self.coa_rate = numpy.where(has_coa, self.numCoaEvent / dn, 0.0)
+		coa_drate = -1.0 * self.coa_rate * coa_rate_ddn / dn
+
+		b = self.spe_rate * spe_b + numpy.dot(coa_b, self.coa_rate)
+		prob = b * numpy.exp(-1.0 * b * x)
+		if numpy.any(prob <= 0):
+			self.llh = -sys.float_info.max
+			self.grad_spe = 0.0
+			self.grad_coa = numpy.zeros(self.num_groups)
+			return
+		self.llh = float(numpy.sum(numpy.log(prob)))
+
+		w = 1.0 / b - x
+		self.grad_spe = float(numpy.dot(spe_drate * spe_b + self.spe_rate * spe_db, w))
+		self.grad_coa = numpy.dot(w, coa_drate * coa_b + self.coa_rate * coa_db)
+
+
+	def sum_llh(self):
+		return self.llh
 
 
 class null_model:
@@ -636,27 +911,23 @@ class null_model:
 		nodes = tree.get_leaves()
 		self.num_speEvent = len(nodes) - 1
 		self.wt_list = wt_list
+		for wt in wt_list:
+			if wt.num_lines < 0:
+				wt.num_lines = 0
+		self.lengths = numpy.array([wt.length for wt in wt_list], dtype = numpy.float64)
+		self.num_lines = numpy.array([wt.num_lines for wt in wt_list], dtype = numpy.float64)
 		self.p = 1.0
 		self.rate = 0.0
 
 	def logl(self, p = 1.0):
 		self.p = p
-		br_de = 0.0
-		for wt in self.wt_list:
-			if wt.num_lines < 0:
-				wt.num_lines = 0
-			try:
-				br_de = br_de + wt.length * math.pow(wt.num_lines, self.p)
-			except ValueError:
-				pass
+		scale = numpy.power(self.num_lines, self.p)
+		br_de = numpy.dot(self.lengths, scale)
 		self.rate = self.num_speEvent / br_de
-		logl = 0
-		for wt in self.wt_list:
-			try:
-				logl = logl + math.log(self.rate * math.pow(wt.num_lines, self.p) * math.exp(self.rate * math.pow(wt.num_lines, self.p) * wt.length * -1.0))
-			except ValueError:
-				pass
-		return logl
+		b = self.rate * scale
+		prob = b * numpy.exp(b * self.lengths * -1.0)
+		"""waiting times with zero probability are left out, as math.log(0) was"""
+		return float(numpy.sum(numpy.log(prob[prob > 0])))
 
 
 def tar_fun(x, *args):
@@ -675,10 +946,11 @@ def prime_fun(x, *args):
 	spe_p = x[0]
 	coa_p = x[1]
 	args[0].update(spe_p, coa_p)
-	return [args[0].bprime_spe() * (-1.0) , args[0].bprime_coa() * (-1.0)]
+	return numpy.array([args[0].bprime_spe() * (-1.0) , args[0].bprime_coa() * (-1.0)])
 
 
 def optimize_null_model(umtree):
+	from scipy.optimize import fmin_l_bfgs_b
 	min_change = 0.1
 	max_iters = 100
 	wt_list, num_spe = umtree.get_waiting_times(threshold_node_idx = 0)
@@ -695,51 +967,362 @@ def optimize_null_model(umtree):
 	return last_llh
 
 
-def gmyc(tree, print_detail = False, show_tree = False, show_llh = False, show_lineages = False, print_species = False, print_species_spart = False, save_file = ".", pv = 0.01 ):
-	llh_list = []
+def fit_threshold(tt):
+	"""Fit one threshold, module level so it can be sent to a process pool.
+	Returns (num_spe, llh, spe_rate, coa_rate, spe_p, coa_p)"""
+	from scipy.optimize import fmin_l_bfgs_b
 	min_change = 0.1
 	max_iters = 100
+	last_llh = float("-inf")
+	change = float("inf")
+	cnt = 0
+	while change > min_change and cnt < max_iters:
+		cnt = cnt + 1
+		para, nn, cc = fmin_l_bfgs_b(tar_fun, [1, 1], fprime = prime_fun, args = tuple([tt]), bounds = [[0, 10], [0, 10]])
+		#para, nn, cc = fmin_tnc(tar_fun, [0, 0], args = [tt], disp = False, bounds = [[0, 10], [0, 10]], approx_grad = True)
+		tt.update(para[0], para[1])
+		logl = tt.sum_llh()
+		change = abs(logl - last_llh)
+		last_llh = logl
+	return tt.num_species, tt.sum_llh(), tt.spe_rate, tt.coa_rate, tt.spe_p, tt.coa_p
+
+
+def _fit_selected(utree, select, fits, pool, batch_size):
+	"""fit the thresholds in select (all if None) into fits, a batch of
+	tree_time objects at a time so they are not all kept in memory"""
+	pos = {}
+	for i in range(len(utree.nodes)):
+		pos[utree.nodes[i].id] = i
+	batch = []
+	sweep = utree.sweep_thresholds(select = select)
+	while True:
+		item = next(sweep, None)
+		if item != None:
+			batch.append((pos[item[0].id], item[1]))
+		if len(batch) > 0 and (item == None or len(batch) == batch_size):
+			tts = [tt for i, tt in batch]
+			if pool == None:
+				results = [fit_threshold(tt) for tt in tts]
+			else:
+				results = pool.map(fit_threshold, tts, chunksize = 1)
+			for j in range(len(batch)):
+				fits[batch[j][0]] = results[j]
+			batch = []
+		if item == None:
+			break
+
+
+def scan_thresholds(utree, processes = 1, coarse = 0, refine = 3):
+	"""Fit every threshold node of utree, in the order of utree.nodes. With
+	coarse = k > 1 only every k-th threshold is fitted first, then all
+	thresholds between the coarse neighbours of the refine best ones, the
+	others are left None. Returns the fits and the number of fits skipped"""
+	num = len(utree.nodes)
+	fits = [None] * num
+	pool = None
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+	try:
+		batch_size = max(processes, 1) * 16
+		if coarse > 1:
+			select = set(range(0, num, coarse))
+			select.add(num - 1)
+			_fit_selected(utree, select, fits, pool, batch_size)
+			fitted = [i for i in range(num) if fits[i] != None]
+			fitted.sort(key = lambda i: fits[i][1], reverse = True)
+			select = set()
+			for i in fitted[:refine]:
+				for j in range(max(0, i - coarse + 1), min(num, i + coarse)):
+					if fits[j] == None:
+						select.add(j)
+			_fit_selected(utree, select, fits, pool, batch_size)
+		else:
+			_fit_selected(utree, None, fits, pool, batch_size)
+	finally:
+		if pool != None:
+			pool.close()
+			pool.join()
+	skipped = fits.count(None)
+	return fits, skipped
+
+
+def tar_fun_multi(x, *args):
+	args[0].update(x[0], x[1:])
+	return args[0].sum_llh() * (-1.0)
+
+
+def prime_fun_multi(x, *args):
+	args[0].update(x[0], x[1:])
+	return numpy.concatenate(([args[0].grad_spe * (-1.0)], args[0].grad_coa * (-1.0)))
+
+
+def fit_multi(tt, start):
+	"""Fit a multi_tree_time from the exponents start, returns the exponents"""
+	from scipy.optimize import fmin_l_bfgs_b
+	min_change = 0.1
+	max_iters = 100
+	para = list(start)
+	last_llh = float("-inf")
+	change = float("inf")
+	cnt = 0
+	while change > min_change and cnt < max_iters:
+		cnt = cnt + 1
+		para, nn, cc = fmin_l_bfgs_b(tar_fun_multi, para, fprime = prime_fun_multi, args = tuple([tt]), bounds = [[0, 10]] * len(para))
+		tt.update(para[0], para[1:])
+		change = abs(tt.sum_llh() - last_llh)
+		last_llh = tt.sum_llh()
+	return [float(p) for p in para]
+
+
+class multi_threshold:
+	"""Multiple threshold GMYC delimitation. Group 0 is the whole tree with
+	the single threshold t0, every further group is a clade of the tree with
+	its own threshold and coalescent process. The positions are the ones of
+	utree.nodes, a node is coalescent from the threshold of its group on"""
+	def __init__(self, utree, t0, fit):
+		self.utree = utree
+		self.index = utree._node_index()
+		self.num = len(utree.nodes)
+		self.positions = numpy.arange(self.num)
+		self.roots = [-1]
+		self.thresholds = [t0]
+		self.group_of = numpy.zeros(self.num, dtype = numpy.int64)
+		num_spe, llh, spe_rate, coa_rate, spe_p, coa_p = fit
+		self.num_spe = num_spe
+		self.llh = llh
+		self.para = [spe_p, coa_p]
+		self.children = [[] for j in range(self.num)]
+		for j in range(self.num):
+			if self.index[0][j] >= 0:
+				self.children[self.index[0][j]].append(j)
+		self.clades = {}
+
+
+	def coalescent(self, group_of = None, thresholds = None):
+		if group_of is None:
+			group_of = self.group_of
+			thresholds = self.thresholds
+		return self.positions >= numpy.array(thresholds)[group_of]
+
+
+	def clade(self, r):
+		"""positions of r and all nodes below it, in age order"""
+		if r not in self.clades:
+			clade = []
+			stack = [r]
+			while len(stack) > 0:
+				j = stack.pop()
+				clade.append(j)
+				stack.extend(self.children[j])
+			clade.sort()
+			self.clades[r] = numpy.array(clade, dtype = numpy.int64)
+		return self.clades[r]
+
+
+	def tree_time(self, group_of, thresholds):
+		coa = self.coalescent(group_of, thresholds)
+		arrays = self.utree.threshold_arrays(coa, group_of, len(thresholds), index = self.index)
+		return multi_tree_time(arrays, 2 + int(numpy.count_nonzero(~coa)), len(thresholds))
+
+
+	def candidates(self):
+		"""(clade root, threshold) of every delimitation one more threshold
+		can give: the root is a speciation node without other groups below
+		it, the clade becomes coalescent from the threshold on"""
+		coa = self.coalescent()
+		for r in range(self.num):
+			if coa[r] or r in self.roots or self.utree.nodes[r].is_leaf():
+				continue
+			clade = self.clade(r)
+			if numpy.any(self.group_of[clade] != self.group_of[r]):
+				continue
+			current = coa[clade]
+			for t in [r] + list(clade[1:]) + [self.num]:
+				if not numpy.array_equal(clade >= t, current):
+					yield r, int(t)
+
+
+	def add_group(self, r, t):
+		group_of = self.group_of.copy()
+		group_of[self.clade(r)] = len(self.thresholds)
+		return group_of, self.thresholds + [t]
+
+
+	def _fit_best(self, screen, num_fit):
+		"""fit the num_fit best scored (score, group_of, thresholds, start)
+		from the exponents start, returns the best fit as
+		(llh, group_of, thresholds, para, num_spe)"""
+		screen.sort(key = lambda c: c[0], reverse = True)
+		best = None
+		for score, group_of, thresholds, start in screen[:num_fit]:
+			tt = self.tree_time(group_of, thresholds)
+			para = fit_multi(tt, start)
+			if best == None or tt.sum_llh() > best[0]:
+				best = (tt.sum_llh(), group_of, thresholds, para, tt.num_species)
+		return best
+
+
+	def _set(self, best):
+		self.llh, self.group_of, self.thresholds, self.para, self.num_spe = best
+
+
+	def refine(self, num_fit = 3):
+		"""Move the threshold of every group to the best place with the
+		others fixed, until no move improves the likelihood. A threshold
+		stays below the parents of the groups nested in its group"""
+		moved = True
+		while moved:
+			moved = False
+			coa = self.coalescent()
+			for g in range(len(self.thresholds)):
+				members = numpy.flatnonzero(self.group_of == g)
+				low = 0
+				for r in self.roots[1:]:
+					if self.index[0][r] >= 0 and self.group_of[self.index[0][r]] == g:
+						low = max(low, self.index[0][r] + 1)
+				screen = []
+				for t in list(members[members >= low]) + [self.num]:
+					thresholds = self.thresholds[:g] + [int(t)] + self.thresholds[g + 1:]
+					if numpy.array_equal(self.coalescent(self.group_of, thresholds), coa):
+						continue
+					tt = self.tree_time(self.group_of, thresholds)
+					tt.update(self.para[0], self.para[1:])
+					screen.append((tt.sum_llh(), self.group_of, thresholds, self.para))
+				best = self._fit_best(screen, num_fit)
+				if best != None and best[0] > self.llh:
+					self._set(best)
+					coa = self.coalescent()
+					moved = True
+
+
+	def step(self, pv = 0.01, num_fit = 10):
+		"""Add the threshold that fits best if the likelihood ratio test
+		against the current model (3 more parameters: threshold, coalescent
+		rate and exponent) is significant at pv. Every candidate is scored
+		with the current exponents, the best threshold of the num_fit best
+		clades is fitted, then all thresholds are refined.
+		Returns the p-value, None if no threshold was added"""
+		clades = {}
+		for r, t in self.candidates():
+			group_of, thresholds = self.add_group(r, t)
+			"""the new group starts with the coalescent exponent of its parent group"""
+			start = self.para + [self.para[1 + self.group_of[r]]]
+			tt = self.tree_time(group_of, thresholds)
+			tt.update(start[0], start[1:])
+			if r not in clades or tt.sum_llh() > clades[r][0]:
+				clades[r] = (tt.sum_llh(), group_of, thresholds, start)
+		if len(clades) == 0:
+			return None
+		best = self._fit_best(list(clades.values()), num_fit)
+		current = (self.llh, self.group_of, self.thresholds, self.para, self.num_spe)
+		root = int(numpy.flatnonzero(best[1] == len(self.thresholds))[0])
+		self._set(best)
+		self.roots.append(root)
+		self.refine()
+		p = float(lh_ratio_test(null_llh = current[0], llh = self.llh, df = 3).get_p_value())
+		if not p < pv:
+			self._set(current)
+			self.roots.pop()
+			return None
+		return p
+
+
+def multi_threshold_search(utree, t0, fit, pv = 0.01, max_thresholds = 10, num_fit = 10):
+	"""Stepwise multiple threshold GMYC, starting from the single threshold
+	t0 with its fit from scan_thresholds(), thresholds are added while the
+	likelihood ratio test of each step is significant"""
+	mt = multi_threshold(utree, t0, fit)
+	while len(mt.thresholds) < max_thresholds:
+		p = mt.step(pv = pv, num_fit = num_fit)
+		if p == None:
+			break
+		print("Threshold " + repr(len(mt.thresholds)) + ": clade of " + repr(len(utree.nodes[mt.roots[-1]].get_leaves())) + " tips, llh " + repr(mt.llh) + ", p-value " + repr(p))
+	return mt
+
+
+class result_writer:
+	"""Fit records of the thresholds, kept in memory and written with one
+	open when the run is done. fmt is "txt" (result_details.txt as before),
+	"json" (result.json, with the summary) or "tsv" (result_details.tsv)"""
+	fields = ["threshold", "num_spe", "llh", "spe_lambda", "coa_lambda", "spe_p", "coa_p"]
+
+	def __init__(self, save_file = ".", fmt = "txt", prefix = ""):
+		self.save_file = save_file
+		self.fmt = fmt
+		self.prefix = prefix
+		self.records = []
+		self.summary = {}
+
+
+	def add(self, threshold, num_spe, llh, spe_rate, coa_rate, spe_p, coa_p):
+		self.records.append([int(threshold), int(num_spe), float(llh), float(spe_rate), float(coa_rate), float(spe_p), float(coa_p)])
+
+
+	def write(self):
+		"""the file of fmt, returns its name"""
+		if self.fmt == "json":
+			fout = os.path.join(self.save_file, self.prefix + "result.json")
+			result = {"summary": self.summary, "thresholds": [dict(zip(self.fields, r)) for r in self.records]}
+			with open(fout, "w") as f:
+				json.dump(result, f, indent = 1)
+		elif self.fmt == "tsv":
+			fout = os.path.join(self.save_file, self.prefix + "result_details.tsv")
+			lines = ["\t".join(self.fields)]
+			for r in self.records:
+				lines.append("\t".join([repr(v) for v in r]))
+			with open(fout, "w") as f:
+				f.write("\n".join(lines) + "\n")
+		else:
+			fout = os.path.join(self.save_file, self.prefix + "result_details.txt")
+			lines = []
+			for threshold, num_spe, llh, spe_rate, coa_rate, spe_p, coa_p in self.records:
+				lines.append("Num spe:" + repr(num_spe) + ": " + repr(llh))
+				lines.append("spe_lambda:" + repr(spe_rate))
+				lines.append("coa_lambda:" + repr(coa_rate))
+				lines.append("spe_p:" + repr(spe_p))
+				lines.append("coa_p:" + repr(coa_p))
+				lines.append("-----------------------------------------------------")
+			with open(fout, "a") as f:
+				f.write("".join([line + "\n" for line in lines]))
+		return fout
+
+
+def gmyc(tree, print_detail = False, show_tree = False, show_llh = False, show_lineages = False, print_species = False, print_species_spart = False, save_file = ".", pv = 0.01, processes = 1, coarse = 0, multi = False, max_thresholds = 10, detail_format = "txt", render = True):
+	llh_list = []
 	best_llh = float("-inf")
 	best_num_spe = -1
 	best_node = None
+	best_t = -1
 	utree = um_tree(tree)
-	for tnode in utree.nodes:
-
-		wt_list, num_spe = utree.get_waiting_times(threshold_node = tnode)
-		tt = tree_time(wt_list, num_spe)
-		last_llh = float("-inf")
-		change = float("inf")
-		cnt = 0
-
-		while change > min_change and cnt < max_iters:
-			cnt = cnt + 1
-			para, nn, cc = fmin_l_bfgs_b(tar_fun, [1, 1], args = tuple([tt]), bounds = [[0, 10], [0, 10]], approx_grad = True)
-			#para, nn, cc = fmin_tnc(tar_fun, [0, 0], args = [tt], disp = False, bounds = [[0, 10], [0, 10]], approx_grad = True)
-			tt.update(para[0], para[1])
-			logl = tt.sum_llh()
-			change = abs(logl - last_llh)
-			last_llh = logl
-   #	 f= open(os.path.join(save_file, self.unique+ "result_details.txt"), "a")
-			f= open(os.path.join(save_file, "result_details.txt"), "a")
-   
-		if print_detail:
-			print("Num spe:" + repr(num_spe) + ": " + repr(tt.sum_llh()), file= f)
-			print("spe_lambda:" + repr(tt.spe_rate), file= f)
-			print("coa_lambda:" + repr(tt.coa_rate), file= f)
-			print("spe_p:" + repr(tt.spe_p), file= f)
-			print("coa_p:" + repr(tt.coa_p), file= f)
-			print("-----------------------------------------------------", file= f)
-		f.close()
-		final_llh = tt.sum_llh()
+	fits, skipped = scan_thresholds(utree, processes = processes, coarse = coarse)
+	if coarse > 1:
+		print("Coarse threshold scan: " + repr(len(fits) - skipped) + " of " + repr(len(fits)) + " thresholds fitted, " + repr(skipped) + " skipped")
+	writer = result_writer(save_file = save_file, fmt = detail_format)
+	for i in range(len(fits)):
+		if fits[i] == None:
+			"""skipped by the coarse scan"""
+			llh_list.append(float("nan"))
+			continue
+		num_spe, final_llh, spe_rate, coa_rate, spe_p, coa_p = fits[i]
+		writer.add(i, num_spe, final_llh, spe_rate, coa_rate, spe_p, coa_p)
 		if final_llh > best_llh:
 			best_llh = final_llh
 			best_num_spe = num_spe
-			best_node = tnode
+			best_node = utree.nodes[i]
+			best_t = i
 		llh_list.append(final_llh)
 
 	null_logl = optimize_null_model(utree)
 
 	wt_list, num_spe = utree.get_waiting_times(threshold_node = best_node)
+	if multi:
+		mt = multi_threshold_search(utree, best_t, fits[best_t], pv = pv, max_thresholds = max_thresholds)
+		num_t = len(mt.thresholds)
+		multi_p = 1.0
+		if num_t > 1:
+			multi_p = float(lh_ratio_test(null_llh = best_llh, llh = mt.llh, df = 3 * (num_t - 1)).get_p_value())
+			"""the species of the multiple threshold model replace the single threshold ones"""
+			utree.set_coalescent(mt.coalescent())
 	one_spe, spes = utree.get_species()
 	lrt = lh_ratio_test(null_llh = null_logl, llh = best_llh, df = 2)
 #	file2= open(os.path.join(save_file, self.unique+ "result_summary.txt"), "w+")
@@ -748,11 +1331,22 @@ def gmyc(tree, print_detail = False, show_tree = False, show_llh = False, show_l
 	print("Num spe:" + repr(best_num_spe), file= file2)
 	print("Null llh:" + repr(null_logl), file= file2)
 	print("P-value:" + repr(lrt.get_p_value()), file= file2)
+	if multi:
+		print("Multiple thresholds llh:" + repr(mt.llh), file= file2)
+		print("Num thresholds:" + repr(num_t), file= file2)
+		print("Num spe multiple thresholds:" + repr(mt.num_spe), file= file2)
+		print("P-value multiple vs single threshold:" + repr(multi_p), file= file2)
 	file2.close()
+	if print_detail:
+		writer.summary = {"llh": float(best_llh), "num_spe": int(best_num_spe), "null_llh": float(null_logl), "p_value": float(lrt.get_p_value())}
+		if multi:
+			writer.summary.update({"multi_llh": float(mt.llh), "num_thresholds": num_t, "multi_num_spe": int(mt.num_spe), "multi_p_value": multi_p})
+		writer.write()
 	if show_lineages:
 		utree.num_lineages(wt_list, save_file)
 
 	if show_llh:
+		import matplotlib.pyplot as plt
 		plt.plot(llh_list)
 		plt.ylabel('Log likelihood')
 		plt.xlabel('Time')
@@ -767,7 +1361,7 @@ def gmyc(tree, print_detail = False, show_tree = False, show_llh = False, show_l
 
 	if show_tree:
 		utree.tree.show()
-	else:
+	elif render:
 
 #		utree.tree.render(os.path.join(save_file, self.unique+ "myoutput.png"))
  #	   utree.tree.render(os.path.join(save_file,  self.unique+ "myoutput.pdf"))
@@ -780,35 +1374,22 @@ def gmyc(tree, print_detail = False, show_tree = False, show_llh = False, show_l
 		return spes
 
 
-def gmyc_func(tree, taxa_order, print_detail = False, show_tree = False, show_llh = False, show_lineages = True, print_species = True, print_species_spart = True, pv = 0.01):
+def gmyc_func(tree, taxa_order, print_detail = False, show_tree = False, show_llh = False, show_lineages = True, print_species = True, print_species_spart = True, pv = 0.01, processes = 1, coarse = 0):
 	llh_list = []
-	min_change = 0.1
-	max_iters = 100
 	best_llh = float("-inf")
 	best_num_spe = -1
 	best_node = None
 	utree = um_tree(tree)
-	for tnode in utree.nodes:
-		wt_list, num_spe = utree.get_waiting_times(threshold_node = tnode)
-		tt = tree_time(wt_list, num_spe)
-		last_llh = float("-inf")
-		change = float("inf")
-		cnt = 0
-
-		while change > min_change and cnt < max_iters:
-			cnt = cnt + 1
-			para, nn, cc = fmin_l_bfgs_b(tar_fun, [1, 1], args = tuple(tt), bounds = [[0, 10], [0, 10]], approx_grad = True)
-			#para, nn, cc = fmin_tnc(tar_fun, [0, 0], args = tuple(tt), disp = False, bounds = [[0, 10], [0, 10]], approx_grad = True)
-			tt.update(para[0], para[1])
-			logl = tt.sum_llh()
-			change = abs(logl - last_llh)
-			last_llh = logl
-
-		final_llh = tt.sum_llh()
+	fits, skipped = scan_thresholds(utree, processes = processes, coarse = coarse)
+	for i in range(len(fits)):
+		if fits[i] == None:
+			llh_list.append(float("nan"))
+			continue
+		num_spe, final_llh, spe_rate, coa_rate, spe_p, coa_p = fits[i]
 		if final_llh > best_llh:
 			best_llh = final_llh
 			best_num_spe = num_spe
-			best_node = tnode
+			best_node = utree.nodes[i]
 		llh_list.append(final_llh)
 
 	null_logl = optimize_null_model(utree)
@@ -827,6 +1408,161 @@ def gmyc_func(tree, taxa_order, print_detail = False, show_tree = False, show_ll
 
 
 
+def read_nexus_trees(fname, burnin = 0, thinning = 1, limit = 0):
+	"""newick strings of the trees of a NEXUS file after skipping burnin trees
+	(a fraction if below 1) and keeping every thinning-th one, taxa translated
+	and comments ([&R], [&rate=...] of BEAST) removed, at most limit trees
+	(0 for all)"""
+	trees = []
+	for tree in NexusTreeReader(fname, burnin = burnin, thinning = thinning, limit = limit):
+		trees.append(re.sub(r"\[[^\]]*\]", "", tree))
+	return trees
+
+
+def _posterior_job(job):
+	"""GMYC partition of one posterior tree, module level for the process pool"""
+	tree, taxa_order, pv, coarse = job
+	return gmyc_func(tree, taxa_order, pv = pv, coarse = coarse)
+
+
+class posterior_partitions:
+	"""GMYC partitions of a sample of trees, one row of labels per tree in
+	taxa_order. co[i, j] is the fraction of trees in which the taxa i and j
+	are in the same species"""
+	def __init__(self, taxa_order, partitions):
+		self.taxa_order = taxa_order
+		self.partitions = numpy.array(partitions, dtype = numpy.int64)
+		self.num = self.partitions.shape[0]
+		num_taxa = len(taxa_order)
+		co = numpy.zeros((num_taxa, num_taxa), dtype = numpy.int64)
+		for row in self.partitions:
+			co += row[:, None] == row[None, :]
+		self.co = co / float(self.num)
+		self.num_species = numpy.array([len(numpy.unique(row)) for row in self.partitions])
+
+
+	def species_counts(self):
+		"""(number of species, number of trees) in increasing number of species"""
+		values, counts = numpy.unique(self.num_species, return_counts = True)
+		return [(int(values[i]), int(counts[i])) for i in range(len(values))]
+
+
+	def best_partition(self):
+		"""index of the sampled partition that agrees best with the
+		co-assignment support, the sum of 2 co[i, j] - 1 over the pairs of
+		taxa it puts together"""
+		weight = 2.0 * self.co - 1.0
+		scores = [float(numpy.sum(weight[row[:, None] == row[None, :]])) for row in self.partitions]
+		return int(numpy.argmax(scores))
+
+
+	def subset_support(self, row):
+		"""fraction of trees with exactly each species of row, in the order of the labels"""
+		support = []
+		for label in numpy.unique(row):
+			members = numpy.flatnonzero(row == label)
+			first = self.partitions[:, members[0]]
+			together = numpy.all(self.partitions[:, members] == first[:, None], axis = 1)
+			size = numpy.sum(self.partitions == first[:, None], axis = 1)
+			support.append(float(numpy.mean(together & (size == len(members)))))
+		return support
+
+
+	def taxon_support(self, row):
+		"""mean agreement of every taxon with the co-assignment support:
+		co[i, j] for the taxa j in its species, 1 - co[i, j] for the others"""
+		same = row[:, None] == row[None, :]
+		agree = numpy.where(same, self.co, 1.0 - self.co)
+		num_taxa = len(row)
+		if num_taxa == 1:
+			return [1.0]
+		return ((agree.sum(axis = 1) - numpy.diag(agree)) / (num_taxa - 1)).tolist()
+
+
+	def print_summary(self, save_file):
+		best = self.best_partition()
+		file2 = open(os.path.join(save_file, "posterior_summary.txt"), "w+")
+		print("Num trees:" + repr(self.num), file= file2)
+		print("Mean num spe:" + repr(float(numpy.mean(self.num_species))), file= file2)
+		ordered = numpy.sort(self.num_species)
+		low = int(ordered[int(math.floor(0.025 * (self.num - 1)))])
+		high = int(ordered[int(math.ceil(0.975 * (self.num - 1)))])
+		print("Num spe 95% interval:" + repr(low) + "-" + repr(high), file= file2)
+		print("Summary partition: tree " + repr(best + 1) + ", num spe " + repr(int(self.num_species[best])), file= file2)
+		print("Num spe\tNum trees\tFrequency", file= file2)
+		for k, count in self.species_counts():
+			print(repr(k) + "\t" + repr(count) + "\t" + repr(count / float(self.num)), file= file2)
+		file2.close()
+
+		file3 = open(os.path.join(save_file, "posterior_coassignment.txt"), "w+")
+		print("\t" + "\t".join(self.taxa_order), file= file3)
+		for i in range(len(self.taxa_order)):
+			print(self.taxa_order[i] + "\t" + "\t".join(["{0:.4f}".format(c) for c in self.co[i]]), file= file3)
+		file3.close()
+
+
+	def print_spart(self, save_file, fileextension = None):
+		"""the summary partition with the support of its species and taxa"""
+		row = self.partitions[self.best_partition()]
+		subsets = self.subset_support(row)
+		taxa = self.taxon_support(row)
+		labels = {}
+		for label in numpy.unique(row):
+			labels[int(label)] = len(labels) + 1
+		if fileextension: directory, file= os.path.split(fileextension)
+		else : file = "spart output"
+		file= re.sub(r'[^A-Za-z0-9_]', '_', file)
+		io= re.compile(r"[^A-Za-z0-9]")
+		names = [io.sub('_', str(name).strip()) for name in self.taxa_order]
+
+		fo_bestpar = open(os.path.join(save_file, "partition_gmyc_posterior.spart"), "w+")
+		fo_bestpar.write("begin spart;\n\n")
+		fo_bestpar.write(f"Project_name = {file};\n")
+		fo_bestpar.write(f'Date = {datetime.datetime.now().astimezone().isoformat()};\n')
+		fo_bestpar.write(f"N_spartitions = 1 : {file}_GMYC_posterior;\n")
+		fo_bestpar.write(f'N_individuals = {len(names)};\n')
+		fo_bestpar.write(f'N_subsets = {len(subsets)} : {",".join([str(round(s, 3)) for s in subsets])};\n')
+		fo_bestpar.write(f"[Generated by GMYC on {self.num} posterior trees]\n")
+		fo_bestpar.write("[WARNING: The sample names below may have been changed to fit SPART specification (only alphanumeric characters and _ )]\n")
+		fo_bestpar.write("Individual_assignment = \n")
+		ll = [names[i] + ":" + str(labels[int(row[i])]) for i in range(len(names))]
+		fo_bestpar.writelines([x+"\n" for x in ll[0:-1]])
+		fo_bestpar.write(f"{ll[-1]};\n\n")
+		fo_bestpar.write("Individual_score = \n")
+		ll = [names[i] + ":" + str(round(taxa[i], 3)) for i in range(len(names))]
+		fo_bestpar.writelines([x+"\n" for x in ll[0:-1]])
+		fo_bestpar.write(f"{ll[-1]};\n\n")
+		fo_bestpar.write("Subset_score_type = posterior probability;\n")
+		fo_bestpar.write("Individual_score_type = mean co-assignment support;\n")
+		fo_bestpar.write("\nend;\n")
+		fo_bestpar.close()
+
+
+def gmyc_posterior(trees, save_file = ".", pv = 0.01, processes = 1, coarse = 0, sample = 0, seed = None, fileextension = None):
+	"""GMYC on every tree of a posterior sample (newick strings), or on a
+	random subsample of sample trees, the trees are run in processes
+	processes. Writes the species number distribution, the co-assignment
+	support and a summary spart, returns the posterior_partitions"""
+	if sample > 0 and sample < len(trees):
+		import random
+		trees = random.Random(seed).sample(trees, sample)
+	taxa_order = Tree(trees[0], format = 1).get_leaf_names()
+	jobs = [(tree, taxa_order, pv, coarse) for tree in trees]
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+		try:
+			partitions = pool.map(_posterior_job, jobs, chunksize = 1)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		partitions = [_posterior_job(job) for job in jobs]
+	pp = posterior_partitions(taxa_order, partitions)
+	pp.print_summary(save_file)
+	pp.print_spart(save_file, fileextension = fileextension)
+	return pp
+
+
 def print_options():
 	print("usage: ./GMYC.py -t example/gmyc_example.tre -st")
 	#print("usage: ./GMYC.py -a example/query.afa -st")
@@ -838,15 +1574,30 @@ def print_options():
 	print("	-st							  Plot the delimited species on the tree.(default not show)\n")
 	print("	-ps							  Print delimited species on the screen.(default not show)\n")
 	print("	-pd							  Print optimization details.(default not)\n")
+	print("	-pdformat txt|json|tsv			 Format of the optimization details: result_details.txt, result.json with")
+	print("									 the summary, or result_details.tsv.(default txt)\n")
+	print("	-norender						 Do not draw the tree to myoutput.png and myoutput.pdf.(default draw)\n")
 	print("	-sl							  Show the log likelihood value plot.(default not)\n")
 	print("	-sn							  Show lineages through time plot. (default not)\n")
+	print("	-threads N						 Fit the thresholds in N processes.(default 1)\n")
+	print("	-coarse K						  Fit every K-th threshold first, then only the thresholds around the best ones.")
+	print("									 The skipped thresholds are reported.(default 0, fit all thresholds)\n")
+	print("	-multi							Multiple threshold GMYC: add thresholds for clades of the tree while the")
+	print("									 likelihood ratio test of each step is significant at -pvalue.(default not)\n")
+	print("	-maxt N						  Maximum number of thresholds of -multi.(default 10)\n")
+	print("	-posterior						Run GMYC on every tree of a NEXUS posterior sample (BEAST, r8s) in -threads")
+	print("									 processes and summarise the species numbers and co-assignment support.(default first tree only)\n")
+	print("	-sample N						  With -posterior, run on a random subsample of N trees.(default all trees)\n")
+	print("	-seed S							With -sample, the random seed.\n")
+	print("	-burnin B						  Skip the first B trees of a NEXUS file, or a fraction of them if B < 1.(default 0)\n")
+	print("	-thin N							Use every N-th tree of a NEXUS file after the burn-in.(default 1)\n")
 
 
 if __name__ == "__main__":
 	print("This is pGMYC - a python implementation of GMYC model for species delimitation.")
 	print("Version 1.1 released by Jiajie Zhang on 10-11-2013\n")
 	print("This program will delimit species on a rooted ultrametric tree, ")
-	print("using single threshold GMYC model.")
+	print("using single threshold GMYC model (-multi for multiple thresholds).")
 	print("The input tree should be in Newick format and must be ultrametric.")
 	print("Some common programs to infer ultrametric tree are: BEAST, DPPDIV and r8s." )
 	print("pGMYC needs scipy and matplotlib packages to be installed.\n")
@@ -872,6 +1623,17 @@ if __name__ == "__main__":
 	ssave_file = "."
 	p_value = 0.01
 	salignment = ""
+	sprocesses = 1
+	scoarse = 0
+	smulti = False
+	smax_thresholds = 10
+	sdetail_format = "txt"
+	srender = True
+	sposterior = False
+	ssample = 0
+	sseed = None
+	sburnin = 0
+	sthinning = 1
 	
 	for i in range(len(sys.argv)):
 		if sys.argv[i] == "-t":
@@ -898,6 +1660,36 @@ if __name__ == "__main__":
 		elif sys.argv[i] == "-a":
 			i = i + 1
 			salignment = sys.argv[i]
+		elif sys.argv[i] == "-threads":
+			i = i + 1
+			sprocesses = int(sys.argv[i])
+		elif sys.argv[i] == "-coarse":
+			i = i + 1
+			scoarse = int(sys.argv[i])
+		elif sys.argv[i] == "-multi":
+			smulti = True
+		elif sys.argv[i] == "-maxt":
+			i = i + 1
+			smax_thresholds = int(sys.argv[i])
+		elif sys.argv[i] == "-pdformat":
+			i = i + 1
+			sdetail_format = sys.argv[i]
+		elif sys.argv[i] == "-norender":
+			srender = False
+		elif sys.argv[i] == "-posterior":
+			sposterior = True
+		elif sys.argv[i] == "-sample":
+			i = i + 1
+			ssample = int(sys.argv[i])
+		elif sys.argv[i] == "-seed":
+			i = i + 1
+			sseed = int(sys.argv[i])
+		elif sys.argv[i] == "-burnin":
+			i = i + 1
+			sburnin = float(sys.argv[i])
+		elif sys.argv[i] == "-thin":
+			i = i + 1
+			sthinning = int(sys.argv[i])
 		elif i == 0:
 			pass
 		elif sys.argv[i].startswith("-"):
@@ -914,13 +1706,18 @@ if __name__ == "__main__":
 	try:
 		treetest = open(stree)
 		l1 = treetest.readline()
-		if l1.strip() == "#NEXUS":
-			nexus = NexusReader(stree)
-			nexus.blocks['trees'].detranslate()
-			stree = nexus.trees.trees[0]
 		treetest.close()
+		if sposterior:
+			if l1.strip() != "#NEXUS":
+				print("-posterior needs a NEXUS tree file.")
+				sys.exit()
+			pp = gmyc_posterior(read_nexus_trees(stree, burnin = sburnin, thinning = sthinning), save_file = ssave_file, pv = p_value, processes = sprocesses, coarse = scoarse, sample = ssample, seed = sseed, fileextension = stree)
+			print("Number of species by GMYC on " + repr(pp.num) + " trees: " + ", ".join([repr(k) + " (" + repr(count) + ")" for k, count in pp.species_counts()]))
+			sys.exit()
+		if l1.strip() == "#NEXUS":
+			stree = read_nexus_trees(stree, burnin = sburnin, limit = 1)[0]
 
-		sp = gmyc(tree = stree, print_detail = sprint_detail, show_tree = sshow_tree, show_llh = sshow_llh, show_lineages = sshow_lineages, print_species = sprint_species, print_species_spart = sprint_species_spart, save_file= ssave_file, pv = p_value)
+		sp = gmyc(tree = stree, print_detail = sprint_detail, show_tree = sshow_tree, show_llh = sshow_llh, show_lineages = sshow_lineages, print_species = sprint_species, print_species_spart = sprint_species_spart, save_file= ssave_file, pv = p_value, processes = sprocesses, coarse = scoarse, multi = smulti, max_thresholds = smax_thresholds, detail_format = sdetail_format, render = srender)
 		print("Final number of estimated species by GMYC: " +  repr(len(sp)) )
 	except ete3.parser.newick.NewickError:
 		print("Unexisting tree file or Malformed newick tree structure.")
@@ -9,6 +9,9 @@ import re
 import sys, os
 from PyQt5.uic import loadUiType
 from GMYC import *
+"""GMYC imports these only where it needs them"""
+from scipy.optimize import fmin_l_bfgs_b
+import matplotlib.pyplot as plt
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtGui import *
 import time
@@ -86,9 +89,7 @@ class Main(QMainWindow, FORM_CLASS):    # create class instance
             is_nexus = (l1.strip() == "#NEXUS")
             treetest.close()
             if is_nexus:
-                nexus = NexusReader(open_file)
-                nexus.blocks['trees'].detranslate()
-                newick_tree = nexus.trees.trees[0]
+                newick_tree = next(iter(NexusTreeReader(open_file, limit = 1)))
                 stree = newick_tree
                 stree = newick_tree
             if not is_nexus:
@@ -101,32 +102,24 @@ class Main(QMainWindow, FORM_CLASS):    # create class instance
             best_num_spe = -1
             best_node = None
             utree = um_tree(stree, open_file, self.unique)
-            for tnode in utree.nodes:
+            writer = result_writer(save_file = save_file, prefix = self.unique)
+            for tnode, tt in utree.sweep_thresholds():
                 QApplication.processEvents()
 
-                wt_list, num_spe = utree.get_waiting_times(threshold_node = tnode)
-                tt = tree_time(wt_list, num_spe)
+                num_spe = tt.num_species
                 last_llh = float("-inf")
                 change = float("inf")
                 cnt = 0
 
                 while change > min_change and cnt < max_iters:
                     cnt = cnt + 1
-                    para, nn, cc = fmin_l_bfgs_b(tar_fun, [1, 1], args = tuple([tt]), bounds = [[0, 10], [0, 10]], approx_grad = True)
+                    para, nn, cc = fmin_l_bfgs_b(tar_fun, [1, 1], fprime = prime_fun, args = tuple([tt]), bounds = [[0, 10], [0, 10]])
                     #para, nn, cc = fmin_tnc(tar_fun, [0, 0], args = [tt], disp = False, bounds = [[0, 10], [0, 10]], approx_grad = True)
                     tt.update(para[0], para[1])
                     logl = tt.sum_llh()
                     change = abs(logl - last_llh)
                     last_llh = logl
-                f= open(os.path.join(save_file, self.unique+ "result_details.txt"), "a")
-                if print_detail:
-                    print("Num spe:" + repr(num_spe) + ": " + repr(tt.sum_llh()), file= f)
-                    print("spe_lambda:" + repr(tt.spe_rate), file= f)
-                    print("coa_lambda:" + repr(tt.coa_rate), file= f)
-                    print("spe_p:" + repr(tt.spe_p), file= f)
-                    print("coa_p:" + repr(tt.coa_p), file= f)
-                    print("-----------------------------------------------------", file= f)
-                f.close()
+                writer.add(len(llh_list), num_spe, tt.sum_llh(), tt.spe_rate, tt.coa_rate, tt.spe_p, tt.coa_p)
                 final_llh = tt.sum_llh()
                 if final_llh > best_llh:
                     best_llh = final_llh
@@ -148,6 +141,8 @@ class Main(QMainWindow, FORM_CLASS):    # create class instance
             print("Null llh:" + repr(null_logl), file= file2)
             print("P-value:" + repr(lrt.get_p_value()), file= file2)
             file2.close()
+            if print_detail:
+                writer.write()
             if show_lineages:
                 utree.num_lineages(wt_list, save_file)
 
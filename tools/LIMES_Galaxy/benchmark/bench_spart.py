@@ -0,0 +1,86 @@
+"""
+Génère des fichiers Spart de taille paramétrable, façon balayage ASAP : 'k
+spartitions de 'n échantillons, du plus grand nombre d'espèces au plus petit,
+puis mesure le débit de lecture (Reader_spart) et d'écriture
+(Writer_spart_flux), et la mémoire maximale du processus.
+
+    % python bench_spart.py [-n 'nb...] [-k 'nbpart] [-s 'graine] [-S] [-o 'fich]
+
+Avec -o, écrit simplement le fichier 'fich (première valeur de -n) sans
+mesure. Avec -S, les spartitions comprennent des scores (N_spartitions,
+N_subsets, Individual_score).
+"""
+
+import sys,os,time,argparse,random,resource,tempfile
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limes.spart import Reader_spart,Writer_spart_flux
+
+"""
+Ecrit dans 'fich le fichier Spart de 'n échantillons et 'k spartitions. Les
+échantillons sont rangés dans un ordre aléatoire ; la spartition de rang 'j
+regroupe en une même espèce les échantillons consécutifs dans cet ordre, avec
+un nombre d'espèces décroissant de 'n à 1 avec 'j. Environ 1% des
+échantillons ne sont pas affectés dans chaque spartition.
+"""
+def genere(fich,n,k,graine,scores):
+    rng=random.Random(graine)
+    noms=["seq%d"%i for i in range(n)]
+    ordre=list(range(n))
+    rng.shuffle(ordre)
+    with Writer_spart_flux(fich,"bench_spart n=%d k=%d"%(n,k),noms) as w:
+        for j in range(k):
+            nbesp=max(1,round(n*(1-j/k)))
+            codes=[(None if rng.random()<0.01 else r*nbesp//n+1)
+                   for r in ordre]
+            attrs={}
+            if scores:
+                attrs["score"]=round(rng.random(),4)
+                attrs["Subset_score"]=[round(rng.random(),3)
+                                       for e in range(len(set(codes)-{None}))]
+                attrs["Individual_score"]=[(None if c is None
+                                            else round(rng.random(),3))
+                                           for c in codes]
+                attrs["Spartition_score_type"]="bench"
+            w.add("sweep_%d"%(j+1),codes,**attrs)
+
+def maxrss():
+    r=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r/1024 if sys.platform!="darwin" else r/1024/1024
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Benchmark des fichiers Spart",
+                                   prog="python bench_spart.py")
+    parser.add_argument("-n",dest="tailles",nargs="+",type=int,
+                        default=[1000,10000,100000],
+                        help="Nombre d'échantillons")
+    parser.add_argument("-k",dest="nbpart",type=int,default=20,
+                        help="Nombre de spartitions")
+    parser.add_argument("-s",dest="graine",type=int,default=1234,
+                        help="Graine aléatoire")
+    parser.add_argument("-S",dest="scores",action="store_true",
+                        help="Ajoute des scores")
+    parser.add_argument("-o",dest="fich",help="Fichier Spart à produire")
+    args=parser.parse_args()
+    if args.fich:
+        genere(args.fich,args.tailles[0],args.nbpart,args.graine,args.scores)
+        sys.exit(0)
+    print("échantillons\tspartitions\tMo\técriture Mo/s\tlecture Mo/s\t"
+          "mémoire max Mo")
+    for n in args.tailles:
+        fd,fich=tempfile.mkstemp(suffix=".spart")
+        os.close(fd)
+        try:
+            t=time.time()
+            genere(fich,n,args.nbpart,args.graine,args.scores)
+            tecr=time.time()-t
+            mo=os.path.getsize(fich)/1e6
+            t=time.time()
+            for m in Reader_spart(fich).iter_methodes():
+                pass
+            tlec=time.time()-t
+        finally:
+            os.unlink(fich)
+        print("%d\t%d\t%.1f\t%.1f\t%.1f\t%.0f"%(n,args.nbpart,mo,mo/tecr,
+                                                  mo/tlec,maxrss()))
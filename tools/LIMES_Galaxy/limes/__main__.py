@@ -2,14 +2,18 @@
 from __future__ import annotations
 
 usage_fr="""
-    % limes -I -m -n 'fich...
+    % limes -I -m -n [-j 'nb] [-x 'export] 'fich...
     % limes -O -n -c [-s 'sep] 'fmt ['titre] 'fich...
     % limes -C 'fich
     % limes
     % limes -hh
 
 Dans la première forme (-I), charge l'ensemble des fichier 'fich et affiche
-les indices calculés sur lensemble des méthodes.
+les indices calculés sur lensemble des méthodes. Si l'option -x est fournie,
+les indices de tous les couples de méthodes sont de plus écrits dans le
+fichier 'export : fichier NumPy si son extension est ".npz" (Ctax et match
+ratio), fichier CSV sinon (Ctax, ou match ratio avec -m). L'option -x
+nécessite le module numpy.
 
 Dans la deuxième forme (-O), charge l'ensemble des fichiers 'fich et produit
 le fichier fusionné au format 'fmt. 'fmt a l'une des valeurs suivantes :
@@ -25,6 +29,13 @@ Sans argument (quatrième forme), lance l'interface graphique.
 Par défaut, si aucune des options -IOC n'est fournie et que des arguments sont
 présents, l'option -C est prise en compte.
 
+Avec l'option -k, ou si la variable d'environnement LIMES_CACHE est définie,
+le résultat du chargement de chaque fichier est conservé dans le répertoire
+'rep (créé si besoin), identifié par le nom et le contenu du fichier : un
+nouvel appel sur le même fichier, même copié dans un autre répertoire, ne le
+relit pas.
+Le bilan d'utilisation du cache est affiché sur la sortie d'erreur.
+
 Dans tous les cas, le type du fichier est identifié par l'extension :
     .spart      Format Spart
     .xls, .xlsx Format Excel
@@ -50,7 +61,14 @@ Options :
         (éventuellement après normalisation si l'option -n est fournie). Option
         forcée implicitement avec -I.
     s   Précise le séparateur 'sep. Seulement si 'fmt vaut "csv". Virgule par
-        défaut.
+        défaut. Avec -I et -x, séparateur du fichier CSV 'export.
+    j   Calcule les indices de tous les couples de méthodes en 'nb processus
+        (avec numpy seulement). 1 par défaut.
+    x   Exporte les indices dans le fichier 'export (voir texte).
+    k   Conserve les fichiers chargés dans le cache 'rep (voir texte). Par
+        défaut, la valeur de la variable d'environnement LIMES_CACHE.
+    K   Taille maximale du cache en Mo. 256 par défaut. Au-delà, les fichiers
+        du cache les moins récemment utilisés sont supprimés.
     h   Affiche cette aide. En anglais si répétée.
 
 Auteur : J.Ducasse, février 2019
@@ -62,14 +80,17 @@ Auteur : J.Ducasse, février 2019
 """
 
 usage_en="""
-    % limes -I -m -n 'file...
+    % limes -I -m -n [-j 'nb] [-x 'export] 'file...
     % limes -O -n -c [-s 'sep] 'fmt ['title] 'file...
     % limes -C 'file
     % limes
     % limes -hh
 
 In the first form (-I), loads the set of 'file files and displays the indices
-calculated on all the methods.
+calculated on all the methods. If the -x option is provided, the indices of
+all the couples of methods are also written to the file 'export: a NumPy file
+if its extension is ".npz" (Ctax and match ratio), a CSV file otherwise (Ctax,
+or match ratio with -m). The -x option requires the numpy module.
 
 In the second form (-O), loads all the 'file files and produces the merged file
 in 'fmt format. 'fmt has one of the following values:
@@ -85,6 +106,12 @@ Without argument (fourth form), launches the graphical interface.
 By default, if none of the -IOC options are provided and arguments are present,
 the -C option is taken into account.
 
+With the -k option, or if the LIMES_CACHE environment variable is set, the
+result of the loading of every file is kept in the directory 'dir (created if
+needed), identified by the name and the content of the file: a new call on
+the same file, even copied to another directory, does not read it again. The
+cache usage is reported on the standard error.
+
 In all cases, the file type is identified by the extension:
     .spart      Spart format
     .xls, .xlsx Excel format
@@ -110,6 +137,14 @@ Options :
         normalization if the -n option is provided). Option forced implicitly
         with -I.
     s   Specifies the separator 'sep. Only if 'fmt is 'csv'. Comma by default.
+        With -I and -x, separator of the CSV file 'export.
+    j   Calculates the indices of all the couples of methods in 'nb processes
+        (with numpy only). 1 by default.
+    x   Exports the indices to the file 'export (see text).
+    k   Keeps the loaded files in the cache 'dir (see text). By default, the
+        value of the LIMES_CACHE environment variable.
+    K   Maximum size of the cache in MB. 256 by default. Beyond that, the
+        least recently used files of the cache are removed.
     h   Displays this help. In English if repeated.
 
 Author: J.Ducasse, feb 2019
@@ -129,11 +164,13 @@ from .kagedlib import print_error
 from .core import get_text,set_langue
 
 from typing import List,Optional,Tuple,TYPE_CHECKING,Union
+if TYPE_CHECKING:
+    from .cache import Cache
 
 def usage(arg: Optional[Exception]=None) -> None:
     if isinstance(arg,Exception):
         print_error(arg)
-    print("Usage: limes -I -m -n 'file...\n"
+    print("Usage: limes -I -m -n [-j 'nb] [-x 'export] 'file...\n"
           "       limes -O -n -c [-s 'sep] 'fmt ['titre] 'file...\n"
           "       limes -C 'file\n"
           "       limes\n"
@@ -177,12 +214,30 @@ def arg2type(file: str) -> Tuple[str,str,Optional[str]]:
     return (os.path.join(dir,fich),type,extra)
 """ hack for galaxy. can only process spart files now """
 """
-Lit le fichier 'fich et rend la Source correspondant. Celle-ci est chargée.
+Cache des Source chargées par load() (voir le module cache), ou None si les
+Source ne sont pas mises en cache.
+"""
+sources_cache: Optional[Cache] =None
+
+"""
+Lit le fichier 'fich et rend la Source correspondant. Celle-ci est chargée,
+éventuellement depuis le cache sources_cache.
 Le type est déterminé par l'extension, éventuellement complétée de son extra.
 Génère une exception si erreur.
 """
 def load(fich: str) -> core.Source:
     fich,type,extra=arg2type(fich)
+    if sources_cache is None:
+        return load_type(fich,type,extra)
+    return sources_cache.load(fich,(type,extra),
+                              lambda: load_type(fich,type,extra))
+
+"""
+Lit le fichier 'fich de type 'type et de donnée extra 'extra (voir
+arg2type()) et rend la Source correspondant. Celle-ci est chargée.
+Génère une exception si erreur.
+"""
+def load_type(fich: str,type: str,extra: Optional[str]) -> core.Source:
     src: core.Source
     if type=="csv":
         from . import calc
@@ -222,8 +277,25 @@ def make_espace(args: List[str],norm: bool,common: bool) -> core.Espace:
         meths.extend(load(f).methodes)
     return core.Espace(meths,common=common,strict=not norm)
 
-def run_indices(args: List[str],algo: int,norm: bool) -> None:
-    espace=make_espace(args,norm,True)
+def run_indices(args: List[str],algo: int,norm: bool,processus: int =1,
+                export: Optional[str] =None,separ: str =",") -> None:
+    try:
+        from . import matrice
+    except ImportError:
+        if export is not None: raise
+        espace=make_espace(args,norm,True)
+    else:
+        # Les indices n'ont pas besoin des pMethode : l'EspaceCompact, bien
+        # moins gourmand en mémoire, suffit.
+        meths: List[core.Methode] =[]
+        for f in args:
+            meths.extend(load(f).methodes)
+        espace=matrice.EspaceCompact(meths,common=True,strict=not norm)
+        # Tous les couples sont de toute façon affichés : autant les
+        # calculer en bloc.
+        espace.tables(processus)
+        if export is not None:
+            espace.exporte(export,algo,separ)
     pr=core.Printer(espace)
     print()
     if pr.pralias():
@@ -265,12 +337,17 @@ def run_interface():
 
 algo=core.ALGO_CTAX
 try:
-    opt,arg=getopt.getopt(sys.argv[1:],"IOCmncs:h")
+    opt,arg=getopt.getopt(sys.argv[1:],"IOCmncs:j:x:k:K:h")
 except getopt.GetoptError as e:
     usage(e)
 opt_IOC=None
 opt_c=opt_m=opt_n=opt_s=False
 separ=","
+processus=1
+export: Optional[str] =None
+rep_cache=os.environ.get("LIMES_CACHE") or None
+taille_cache=256
+opt_K=False
 opt_h=0
 for o,a in opt:
     if o=="-m":
@@ -283,6 +360,17 @@ for o,a in opt:
         if len(a)!=1: usage()
         separ=a
         opt_s=True
+    elif o=="-j":
+        try: processus=int(a)
+        except ValueError: usage()
+        if processus<1: usage()
+    elif o=="-x": export=a
+    elif o=="-k": rep_cache=a
+    elif o=="-K":
+        try: taille_cache=int(a)
+        except ValueError: usage()
+        if taille_cache<1: usage()
+        opt_K=True
     else:
         if opt_IOC and opt_IOC!=o: usage()
         opt_IOC=o
@@ -298,14 +386,23 @@ else:
     if opt_IOC is None: opt_IOC="-C"
     if opt_m and opt_IOC!="-I" or \
        (opt_n or opt_c) and opt_IOC=="-C" or \
-       opt_s and opt_IOC!="-O":
+       opt_s and opt_IOC not in ("-O","-I") or \
+       opt_s and opt_IOC=="-I" and export is None or \
+       (processus>1 or export is not None) and opt_IOC!="-I" or \
+       opt_K and not rep_cache:
         usage()
+    if rep_cache:
+        from .cache import Cache
+        try:
+            sources_cache=Cache(rep_cache,taille_cache*1024*1024)
+        except OSError as e:
+            print_error(e)
     try:
         if opt_IOC=="-C":
             if len(arg)>1: usage()
             run_controle(arg[0])
         elif opt_IOC=="-I":
-            run_indices(arg,algo,opt_n)
+            run_indices(arg,algo,opt_n,processus,export,separ)
         else: # "-O"
             fmt=arg[0]
             if fmt=="spart":
@@ -318,6 +415,9 @@ else:
                 usage()
     except Exception as e:
         print_error(e,titre=True)
-        sys.exit(1)
+        ret=1
     else:
-        sys.exit(0)
+        ret=0
+    if sources_cache is not None:
+        print(sources_cache.rapport(),file=sys.stderr)
+    sys.exit(ret)
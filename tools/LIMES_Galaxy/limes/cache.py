@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+"""
+Cache disque des Source chargées par la ligne de commande (voir __main__).
+
+Définit les classes suivantes :
+
+    Cache(rep,taille_max)
+    Source_cache(fich,type)
+
+Le chargement d'un fichier (CSV, Excel, Spart, mono-format) peut être long,
+notamment pour les fichiers .xlsx lus par openpyxl. Le Cache conserve dans le
+répertoire 'rep le résultat du chargement sous une forme binaire compacte
+(marshal compressé par zlib), identifié par l'empreinte SHA-256 du contenu du
+fichier, de son nom et des paramètres de lecture. Un nouveau chargement du
+même fichier, par exemple dans une autre étape d'un workflow Galaxy, se
+contente alors de relire ce résultat.
+"""
+
+import os,sys,hashlib,marshal,zlib,datetime
+from array import array
+
+from .core import Source,Methode,Echantillon,get_text
+
+from typing import Callable,Dict,Any,List,Tuple,Hashable
+
+VERSION=1
+# Version du format des fichiers du cache. A incrémenter à chaque modification
+# de _encode() et _decode(), ou des attributs des Source produites par les
+# readers.
+
+EXT=".lmc"
+
+# Attributs des Source conservés dans le cache, s'ils sont présents.
+ATTRS_SOURCE=("titre","date","separ","feuille")
+
+"""
+Source_cache(fich,type)
+
+Source reconstituée à partir du cache. Elle dispose des mêmes attributs que la
+Source d'origine : .type, .fich, .methodes, .echantillons, et selon le type
+.titre et .date (Spart), .separ (CSV) ou .feuille (Excel). Les Methode ont les
+mêmes attributs que celles d'origine (voir par exemple spart.Reader_spart).
+"""
+class Source_cache(Source):
+    def __init__(self,fich: str,type: str):
+        self.fich=fich
+        self.type=type
+
+    def load(self) -> List[Methode]:
+        return self.methodes
+
+"""
+Rend la représentation binaire de la Source chargée 'src. Les échantillons
+sont représentés par leur rang dans src.echantillons. Les attributs des
+Methode de type dictionnaire (Individual_score) sont indexés par Echantillon ;
+leur nom est préfixé par '@'.
+Génère une exception ValueError si un attribut n'est pas sérialisable.
+"""
+def _encode(src: Source) -> bytes:
+    rang=dict((e,i) for i,e in enumerate(src.echantillons))
+    meths=[]
+    for m in src.methodes:
+        attrs: Dict[str,Any] ={}
+        for a,v in vars(m).items():
+            if a in ("nom","source","especes"): continue
+            if isinstance(v,dict):
+                a="@"+a
+                v=(array('i',(rang[e] for e in v)).tobytes(),list(v.values()))
+            attrs[a]=v
+        meths.append((m.nom,array('i',(rang[e] for e in m)).tobytes(),
+                      list(m.values()),attrs))
+    sattrs: Dict[str,Any] ={}
+    for a in ATTRS_SOURCE:
+        v=getattr(src,a,None)
+        if v is not None:
+            sattrs[a]=v.isoformat() if isinstance(v,datetime.datetime) else v
+    return zlib.compress(marshal.dumps((VERSION,src.type,sattrs,
+                                        [e.nom for e in src.echantillons],
+                                        meths)),1)
+
+"""
+Reconstitue la Source_cache du fichier 'fich à partir de sa représentation
+binaire 'data (voir _encode()).
+Génère une exception si 'data est invalide.
+"""
+def _decode(fich: str,data: bytes) -> Source_cache:
+    version,type,sattrs,noms,meths=marshal.loads(zlib.decompress(data))
+    if version!=VERSION:
+        raise ValueError("Version %d"%version)
+    src=Source_cache(fich,type)
+    for a,v in sattrs.items():
+        if a=="date": v=datetime.datetime.fromisoformat(v)
+        setattr(src,a,v)
+    echs=src.echantillons=[Echantillon(n) for n in noms]
+
+    def lech(ind: bytes) -> List[Echantillon]:
+        return [echs[i] for i in array('i',ind)]
+
+    src.methodes=[]
+    for nom,ind,codes,attrs in meths:
+        m=Methode(nom,lech(ind),codes,src)
+        for a,v in attrs.items():
+            if a.startswith("@"):
+                a=a[1:]
+                v=dict(zip(lech(v[0]),v[1]))
+            setattr(m,a,v)
+        src.methodes.append(m)
+    return src
+
+"""
+Cache(rep,taille_max)
+
+Cache des Source dans le répertoire 'rep, créé si besoin. 'taille_max est la
+taille maximale (en octets) de l'ensemble des fichiers du cache : au-delà, les
+fichiers les moins récemment utilisés sont supprimés.
+
+L'instance dispose des attributs et méthodes suivants :
+    .rep
+    .taille_max
+    .trouves    Nombre de Source trouvées dans le cache.
+    .absents    Nombre de Source absentes du cache (chargées par le reader).
+    .supprimes  Nombre de fichiers supprimés du cache.
+    .load(fich,params,loader)
+    .rapport()
+
+Les erreurs d'accès au cache (répertoire en lecture seule, fichier corrompu
+ou d'une autre version) ne sont jamais fatales : la Source est alors
+simplement chargée par le reader.
+"""
+class Cache:
+    def __init__(self,rep: str,taille_max: int):
+        self.rep=rep
+        self.taille_max=taille_max
+        self.trouves=self.absents=self.supprimes=0
+        os.makedirs(rep,exist_ok=True)
+
+    """
+    Rend la clé (empreinte hexadécimale) du fichier 'fich lu avec les
+    paramètres 'params.
+    Génère une exception OSError si le fichier ne peut être lu.
+    """
+    def cle(self,fich: str,params: Hashable) -> str:
+        h=hashlib.sha256(repr((VERSION,sys.version_info[:2],marshal.version,
+                               sys.byteorder,os.path.basename(fich),
+                               params)).encode())
+        with open(fich,"rb") as f:
+            for bloc in iter(lambda: f.read(1<<20),b""):
+                h.update(bloc)
+        return h.hexdigest()
+
+    """
+    Rend la Source du fichier 'fich lu avec les paramètres 'params (par
+    exemple le type et le séparateur), depuis le cache si elle s'y trouve.
+    Sinon, la charge par 'loader, fonction sans argument qui rend la Source
+    chargée, et la stocke dans le cache.
+    Génère une exception si 'loader en génère une.
+    """
+    def load(self,fich: str,params: Hashable,loader: Callable[[],Source]) \
+                                                                    -> Source:
+        try:
+            chemin=os.path.join(self.rep,self.cle(fich,params)+EXT)
+        except OSError:
+            return loader() # Le reader produira le message d'erreur.
+        try:
+            with open(chemin,"rb") as f:
+                src: Source =_decode(fich,f.read())
+        except FileNotFoundError:
+            pass
+        except Exception:
+            self.__supprime(chemin)
+        else:
+            self.trouves+=1
+            try: os.utime(chemin)
+            except OSError: pass
+            return src
+        self.absents+=1
+        src=loader()
+        try:
+            data=_encode(src)
+        except (ValueError,KeyError):
+            return src
+        tmp="%s.%d.tmp"%(chemin,os.getpid())
+        try:
+            with open(tmp,"wb") as f:
+                f.write(data)
+            os.replace(tmp,chemin)
+        except OSError:
+            try: os.remove(tmp)
+            except OSError: pass
+        else:
+            self.__purge()
+        return src
+
+    def __supprime(self,chemin: str) -> None:
+        try:
+            os.remove(chemin)
+        except OSError:
+            pass
+        else:
+            self.supprimes+=1
+
+    """
+    Supprime les fichiers du cache les moins récemment utilisés (date de
+    modification, mise à jour à chaque utilisation) jusqu'à ce que la taille
+    totale ne dépasse pas .taille_max.
+    """
+    def __purge(self) -> None:
+        lst: List[Tuple[float,int,str]] =[]
+        try:
+            with os.scandir(self.rep) as it:
+                for e in it:
+                    if e.name.endswith(EXT) and e.is_file():
+                        st=e.stat()
+                        lst.append((st.st_mtime,st.st_size,e.path))
+        except OSError:
+            return
+        total=sum(t for _,t,_ in lst)
+        for _,t,chemin in sorted(lst):
+            if total<=self.taille_max: break
+            self.__supprime(chemin)
+            total-=t
+
+    """
+    Rend le texte du bilan d'utilisation du cache.
+    """
+    def rapport(self) -> str:
+        return get_text("Cache %s : %d trouvé(s), %d absent(s), "
+                        "%d supprimé(s)",
+                        "Cache %s: %d hit(s), %d miss(es), %d evicted")%\
+               (self.rep,self.trouves,self.absents,self.supprimes)
@@ -162,7 +162,12 @@ class Methode(dict):
 ##        return self._especes
 
 class pEchantillon(Echantillon):
-    pass
+    def __init__(self,nom: str,num: int):
+        super().__init__(nom)
+        self.num=num
+        # Rang du pEchantillon dans Espace.echantillons : c'est l'indice du
+        # pEchantillon dans les listes pMethode.etiquettes.
+
     # Le pEchantillon doit tre hashable, et la comparaison base sur le nom,
     # pour la comparaison avec un RefEchantillon dans test_limes (par ex. :
     # test_partitions.exec_test()).
@@ -221,6 +226,10 @@ L'instance dispose des attributs et m
     .exclus     Liste des Echantillon de 'meth non repris dans la pMethode,
                 ou None s'il n'y en a pas. Des chantillons ont pu tre exclus
                 si l'Espace a t cr avec l'option common=True.
+    .etiquettes Liste donnant pour chaque pEchantillon de l'Espace, indexe
+                par son rang .num, le numro ( compter de 0) de son espce
+                dans la pMethode, ou -1 s'il est absent de la pMethode.
+                Calcule au premier accs.
     .ctax()
 
 Elle hrite galement de tous les attributs de la Methode 'meth, et notamment :
@@ -255,6 +264,18 @@ class pMethode(Methode):
         # Le dictionnaire est calcul au premier appel, puis stock.
 
     def __getattr__(self,attr):
+        if attr=="etiquettes":
+            etiq=[-1]*len(self.all)
+            numeros: Dict[CodeEspeceType,int] ={}
+            # code espce -> numro de l'espce, dans l'ordre de rencontre.
+            for pe,esp in self.items():
+                etiq[pe.num]=numeros.setdefault(esp,len(numeros))
+            self.etiquettes=etiq
+            return etiq
+        if attr=="especes":
+            return super().__getattr__(attr)
+            # Calcul sur les pEchantillon de l'instance (voir Methode), et
+            # non repris de 'meth.
         return getattr(self.meth,attr)
 
     # Les fonctions __eq__(), __ne__() et __hash__() sont ncessaires pour
@@ -373,49 +394,54 @@ de sp
 pMethode en arguments, soit fournir comme unique argument la liste des
 pMethode.
 
-Pour crer un paquet :
-    - On prend un chantillon non encore pris dans un paquet, et on le met dans
-        le nouveau paquet.
-    - On recherche dans chacune des mthodes l'espce qui inclut cet
-        chantillon.
-    - On ajoute dans le paquet tous les chantillons constituant cette espces.
-    - Quand on a parcouru toutes les mthodes, on recommence en considrant
-        chacun des chantillons qu'on a ajout au cycle prcdent, qui peuvent
-        ainsi attirer d'autres espces.
-    - On a fini le paquet quand le parcours des mthodes n'ajoute plus de
-        nouvel chantillon.
+Deux chantillons sont dans le mme paquet s'ils sont dans la mme espce pour
+au moins une des mthodes, directement ou de proche en proche (fermeture
+transitive). Les paquets sont donc les classes d'un union-find sur les rangs
+.num des pEchantillon :
+    - Pour chaque mthode, on parcourt ses .etiquettes et on runit chaque
+        chantillon au premier chantillon rencontr de la mme espce.
+    - Chaque classe contenant au moins un chantillon de la premire mthode
+        constitue un paquet.
+Le calcul est ainsi linaire en nombre de mthodes x nombre d'chantillons,
+au lieu de parcourir toutes les espces pour chaque chantillon.
 """
 def intersection(*ameths: Union[pMethode,list[pMethode]]) -> PaquetListeType:
     meths: list[pMethode] = _meths_arg(ameths)
-    pool=set(meths[0]) # pool = ensemble de tous les chantillons
-    inter: List[PaquetType] =[]
-    while pool:
-        paq=set()
-        paq.add(pool.pop())
-        # On prend un chantillon restant, on le place dans 'paq, puis on va
-        # chercher la fermeture transitive  partir de celui-ci.
-        nb=0
-        while nb!=len(paq):
-            # On reboucle sur les mthode tant que le traitement a ajout un
-            # chantillon -> fermeture transitive.
-            nb=len(paq)
-            for m in meths:
-                for e in list(paq): # list() car le 'paq est modifi ensuite.
-                    # Remarque : on reprend ici tous les chantillons dans le
-                    # paquet. En thorie, on pourrait optimiser en ne consid-
-                    # rant que les chantillons ajouts au cycle while
-                    # prcdent. Noter cependant que chaque mthode "profite"
-                    # des chantillons ajouts dans le mme cycle while pour
-                    # les mthodes prcdentes.
-                    for p in m.especes.values():
-                        if e in p:
-                            paq.update(p)
-                            break
-                            # break parce qu'un chantillon ne peut se trouver
-                            # que dans une espce et une seule.
-        inter.append(paq)
-        pool.difference_update(paq)
-    return inter
+    nb=len(meths[0].all)
+    parent=list(range(nb))
+    # parent[i] est le parent de l'chantillon de rang 'i dans l'union-find ;
+    # la racine d'une classe est son propre parent.
+
+    def racine(i: int) -> int:
+        while parent[i]!=i:
+            parent[i]=parent[parent[i]]
+            # Compression du chemin par moiti.
+            i=parent[i]
+        return i
+
+    for m in meths:
+        premier: Dict[int,int] ={}
+        # numro d'espce -> rang du premier chantillon de cette espce.
+        for i,esp in enumerate(m.etiquettes):
+            if esp>=0:
+                j=premier.setdefault(esp,i)
+                if j!=i:
+                    a=racine(i)
+                    b=racine(j)
+                    if a!=b:
+                        parent[max(a,b)]=min(a,b)
+
+    echs: List[Optional[pEchantillon]] =[None]*nb
+    for pe in meths[0].all:
+        echs[pe.num]=pe
+    departs=set(racine(pe.num) for pe in meths[0])
+    # Racines des classes comprenant un chantillon de la premire mthode.
+    paqs: DefaultDict[int,set] =defaultdict(set)
+    for i in range(nb):
+        r=racine(i)
+        if r in departs:
+            paqs[r].add(echs[i])
+    return list(paqs.values())
 
 """
 Rend la liste des espces communes  toutes les pMethode de la liste 'meths,
@@ -506,8 +532,21 @@ class Espace(tuple):
     def normalise(nom):
         return Espace.rex.sub("_",nom.lower())
 
-    def __new__(cls,meths: list[Methode],strict: bool=True,common: bool=False) \
-                                                                    -> Espace:
+    """
+    Analyse les noms des chantillons et des mthodes de la liste 'meths pour
+    la cration d'un Espace, avec les options 'strict et 'common. Rend le
+    quadruplet (andict,noms,effnoms,nbtot) :
+        andict  Dictionnaire {old: new} donnant le nom 'new (ventuellement
+                normalis) de l'chantillon de nom 'old.
+        noms    Liste trie des noms des chantillons retenus dans l'Espace.
+        effnoms Liste des noms des mthodes dans l'ordre de 'meths, aprs
+                renommage des noms redondants.
+        nbtot   Nombre d'chantillons avant exclusion des non communs.
+    Gnre une exception RedundantNameError ou EmptyMethodError (voir Espace).
+    """
+    @staticmethod
+    def prepare(meths: list[Methode],strict: bool,common: bool) \
+                                -> tuple[dict[str,str],list[str],list[str],int]:
         echs: DefaultDict[str,int] =defaultdict(int)
         # nouveau nom -> nombre de Methode contenant cet chantillon
         andict: dict[str,str]={}
@@ -530,11 +569,9 @@ class Espace(tuple):
                 mechs.add(new)
                 echs[new]+=1
         nbmeths=len(meths)
-        dictechs=dict((n,pEchantillon(n)) for n in sorted(echs)
-                      if not common or echs[n]==nbmeths)
-        # nouveau nom -> pEchantillon portant ce nom
-        # tous, ou seulement les communs si 'common==True
-        if not dictechs:
+        noms=[n for n in sorted(echs) if not common or echs[n]==nbmeths]
+        # tous les noms, ou seulement les communs si 'common==True
+        if not noms:
             raise EmptyMethodError(
                 get_text("Pas d'chantillons communs entre toutes les mthodes",
                          "No common samples between all methods"))
@@ -543,25 +580,31 @@ class Espace(tuple):
         redond=set(nom for nom,nb in cptmeth.items() if nb>1)
         names=set(m.nom for m in meths if m.nom not in redond)
         cptredond=dict((nom,0) for nom in redond)
-        lstpm: List[pMethode]=[]
+        effnoms: List[str]=[]
         for m in meths:
             nom=m.nom
             if nom in redond:
                 while True:
-                    cptredond[nom]+=1
-                    new=nom+"_"+str(cptredond[nom])
-                    if new not in names:
-                        names.add(new)
-                        pm=pMethode(m,dictechs,andict,eff_nom=new)
+                    cptredond[m.nom]+=1
+                    nom=m.nom+"_"+str(cptredond[m.nom])
+                    if nom not in names:
+                        names.add(nom)
                         break
-            else:
-                pm=pMethode(m,dictechs,andict)
-            lstpm.append(pm)
+            effnoms.append(nom)
+        return (andict,noms,effnoms,len(echs))
+
+    def __new__(cls,meths: list[Methode],strict: bool=True,common: bool=False) \
+                                                                    -> Espace:
+        andict,noms,effnoms,nbtot=Espace.prepare(meths,strict,common)
+        dictechs=dict((n,pEchantillon(n,i)) for i,n in enumerate(noms))
+        # nouveau nom -> pEchantillon portant ce nom
+        lstpm: List[pMethode]=[pMethode(m,dictechs,andict,eff_nom=nom)
+                               for m,nom in zip(meths,effnoms)]
 
         me=super().__new__(cls,cast(list,lstpm)) # cast ncessaire ?
         me.echantillons=list(dictechs.values())
         me.meth_modif=len([m for m in me if m.exclus])
-        me.exclus=len(echs)-len(dictechs)
+        me.exclus=nbtot-len(dictechs)
         return me
 
     @property
@@ -574,6 +617,13 @@ class Espace(tuple):
     def nbech(self) -> int:
         return len(self.echantillons)
 
+    """
+    Rend le nombre d'espces de la mthode 'meth.
+    """
+    @staticmethod
+    def nbesp(meth: pMethode) -> int:
+        return len(meth.especes)
+
     """
     Rend le Rtax de la mthode 'meth, sous la forme d'un triplet (a,b,c)
     comme suit :
@@ -734,7 +784,7 @@ class Printer:
 
         sz0=max(map(len,self.codes))
                 # Colonne 0 : longueur max d'un code ou nom de mthode.
-        szA1=len("%d"%max(map(len,map(attrgetter("especes"),espace))))
+        szA1=len("%d"%max(map(espace.nbesp,espace)))
                 # Long. max du nombre d'chantillons dans une espce.
         szA2=7  # Longueur max d'un rapport A/B. On suppose qu'il y aura au
                 # plus 999 chantillons -> 3+3+1 car.
@@ -832,7 +882,7 @@ class Printer:
             self.print("{:<{}}{}".format(cd,sizes[0][0]," "*sizes[0][1]))
             self.index(5)
             if fractions or not algo_ctax:
-                self.__pr(len(meth.especes),*sizes[1])
+                self.__pr(espace.nbesp(meth),*sizes[1])
             else:
                 self.__pr(espace.mctax(meth),*sizes[1])
             self.__pr(get_rapp(espace.rtax(meth)) if algo_ctax else "",
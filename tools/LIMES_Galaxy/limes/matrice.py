@@ -0,0 +1,440 @@
+from __future__ import annotations
+
+"""
+Définit les classes suivantes :
+
+    Matrice()
+    vMethode()
+    EspaceCompact()
+
+Représentation compacte d'un Espace pour les gros jeux de données (plusieurs
+dizaines de partitions de dizaines de milliers d'échantillons) : les
+échantillons sont des entiers, et chaque méthode est une colonne de numéros
+d'espèce dans une matrice d'entiers NumPy. Les paquets, Rtax, Ctax et match
+ratio sont calculés par des regroupements vectorisés, sans créer de pMethode.
+
+EspaceCompact présente la même interface que Espace pour le calcul et
+l'affichage des indices (Printer). Il ne convient pas aux exports (spart,
+csv), qui ont besoin des pMethode.
+
+Le module nécessite le package "numpy" : https://pypi.org/project/numpy/
+"""
+
+from itertools import combinations,permutations
+import numpy as np
+
+from .core import (Methode,Espace,IndiceType,NOM,CodeEspeceType,ALGO_CTAX,
+                   ALGO_MRATIO)
+
+from typing import Optional,List,Dict,Iterator,Sequence,Tuple,TextIO,Union,cast
+
+"""
+Matrice(meths,andict,noms)
+
+Matrice des numéros d'espèce des Methode de la liste 'meths. 'andict et 'noms
+sont ceux rendus par Espace.prepare() : 'noms est la liste des noms des
+échantillons retenus, 'andict donne pour chaque nom d'échantillon d'une
+Methode le nom correspondant dans 'noms.
+
+L'instance dispose des attributs et méthodes suivants :
+    .noms       La liste 'noms. Le rang d'un échantillon est son indice dans
+                cette liste.
+    .etiquettes Matrice (nombre d'échantillons x nombre de méthodes) d'int32 :
+                numéro (à compter de 0, dans l'ordre de rencontre) de l'espèce
+                de l'échantillon dans la méthode, -1 si l'échantillon est
+                absent de la méthode.
+    .nbesp      Tableau du nombre d'espèces de chaque méthode.
+    .codes      Pour chaque méthode, la liste des codes espèces d'origine,
+                indexée par le numéro d'espèce.
+    .exclus     Pour chaque méthode, la liste des Echantillon de la Methode
+                non retenus dans 'noms, ou None s'il n'y en a pas.
+    .nbpaquets()
+    .paquets()
+    .nbintersection()
+    .nbunion()
+    .nbidentiques()
+    .couple()
+    .tous_couples()
+"""
+class Matrice:
+    def __init__(self,meths: Sequence[Methode],andict: Dict[str,str],
+                 noms: List[str]):
+        rang=dict((n,i) for i,n in enumerate(noms))
+        self.noms=noms
+        self.etiquettes=np.full((len(noms),len(meths)),-1,dtype=np.int32)
+        self.codes: List[List[CodeEspeceType]] =[]
+        self.exclus: List[Optional[list]] =[]
+        for c,m in enumerate(meths):
+            numeros: Dict[CodeEspeceType,int] ={}
+            lignes=[]
+            etiq=[]
+            exclus=[]
+            for ech,esp in m.items():
+                i=rang.get(andict[ech.nom])
+                if i is None:
+                    exclus.append(ech)
+                else:
+                    lignes.append(i)
+                    etiq.append(numeros.setdefault(esp,len(numeros)))
+            self.etiquettes[lignes,c]=etiq
+            self.codes.append(list(numeros))
+            self.exclus.append(exclus or None)
+        self.nbesp=np.array([len(c) for c in self.codes],dtype=np.int64)
+        self.__paquets: Optional[np.ndarray] =None
+
+    """
+    Rend le tableau donnant pour chaque ligne de 'lignes (rangs d'échantillons)
+    le numéro de son groupe : deux échantillons sont dans le même groupe s'ils
+    ont la même espèce (ou sont absents) dans toutes les colonnes 'cols.
+    """
+    def groupes(self,cols: Sequence[int],lignes: np.ndarray) -> np.ndarray:
+        cle=np.zeros(len(lignes),dtype=np.int64)
+        for c in cols:
+            cle=cle*(self.nbesp[c]+1)+self.etiquettes[lignes,c]+1
+            _,cle=np.unique(cle,return_inverse=True)
+            # Renumérotation compacte à chaque colonne : la clef reste
+            # inférieure au nombre d'échantillons.
+        return cle.reshape(-1)
+
+    """
+    Rend le numéro de paquet de chaque échantillon de la première méthode
+    (voir core.union()), dans l'ordre de leurs rangs.
+    """
+    def paquets(self) -> np.ndarray:
+        if self.__paquets is None:
+            lignes=np.nonzero(self.etiquettes[:,0]>=0)[0]
+            self.__paquets=self.groupes(range(self.etiquettes.shape[1]),lignes)
+        return self.__paquets
+
+    def nbpaquets(self) -> int:
+        paq=self.paquets()
+        return int(paq.max())+1 if len(paq) else 0
+
+    """
+    Rend le nombre de paquets de l'intersection des méthodes 'i et 'j (voir
+    core.intersection()). Les espèces de 'i et de 'j partageant au moins un
+    échantillon sont reliées ; le nombre de paquets est le nombre de classes
+    connexes comprenant une espèce de 'i. Les classes sont obtenues par
+    propagation vectorisée du plus petit numéro d'espèce de 'i le long des
+    couples d'espèces, avec saut de pointeurs.
+    """
+    def nbintersection(self,i: int,j: int) -> int:
+        a=self.etiquettes[:,i].astype(np.int64)
+        b=self.etiquettes[:,j].astype(np.int64)
+        ni=int(self.nbesp[i])
+        nj=int(self.nbesp[j])
+        deux=(a>=0)&(b>=0)
+        couples=np.unique(a[deux]*nj+b[deux])
+        ea=couples//nj
+        eb=couples%nj
+        classe=np.arange(ni)
+        # classe[s] = plus petit numéro d'espèce de 'i connu relié à 's.
+        while True:
+            cj=np.full(nj,ni,dtype=np.int64)
+            np.minimum.at(cj,eb,classe[ea])
+            nouv=classe.copy()
+            np.minimum.at(nouv,ea,cj[eb])
+            nouv=nouv[nouv]
+            # Saut de pointeurs : nouv[s]<=s est relié à 's, sa propre classe
+            # l'est donc aussi.
+            if np.array_equal(nouv,classe):
+                break
+            classe=nouv
+        return len(np.unique(classe))
+
+    """
+    Rend le nombre de paquets de l'union des méthodes 'i et 'j (voir
+    core.union()).
+    """
+    def nbunion(self,i: int,j: int) -> int:
+        lignes=np.nonzero(self.etiquettes[:,i]>=0)[0]
+        return len(np.unique(self.groupes((i,j),lignes)))
+
+    """
+    Rend le nombre d'espèces identiques (mêmes échantillons) entre les
+    méthodes 'i et 'j. Un couple d'espèces (s,t) est identique si le nombre
+    d'échantillons communs à 's et 't est égal à la taille de 's et à celle
+    de 't.
+    """
+    def nbidentiques(self,i: int,j: int) -> int:
+        a=self.etiquettes[:,i].astype(np.int64)
+        b=self.etiquettes[:,j].astype(np.int64)
+        ni=int(self.nbesp[i])
+        nj=int(self.nbesp[j])
+        taillei=np.bincount(a[a>=0],minlength=ni)
+        taillej=np.bincount(b[b>=0],minlength=nj)
+        deux=(a>=0)&(b>=0)
+        couples,nb=np.unique(a[deux]*nj+b[deux],return_counts=True)
+        s=couples//nj
+        t=couples%nj
+        return int(np.count_nonzero((nb==taillei[s])&(nb==taillej[t])))
+
+    """
+    Rend le triplet (.nbintersection(i,j),.nbunion(i,j),.nbidentiques(i,j)).
+    """
+    def couple(self,i: int,j: int) -> Tuple[int,int,int]:
+        return (self.nbintersection(i,j),self.nbunion(i,j),
+                self.nbidentiques(i,j))
+
+    """
+    Calcule .couple() pour tous les couples de méthodes. Rend le triplet de
+    matrices carrées (inter,union,ident) où inter[i,j], union[i,j] et
+    ident[i,j] sont les valeurs de .couple(i,j). La diagonale donne le nombre
+    d'espèces de chaque méthode.
+    Les couples sont répartis par lots entre 'processus processus. Si aucun
+    échantillon n'est absent d'une méthode, les matrices sont symétriques et
+    seuls les couples i<j sont calculés.
+    """
+    def tous_couples(self,processus: int =1) \
+                                -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+        nb=self.etiquettes.shape[1]
+        symetrique=not (self.etiquettes<0).any()
+        couples=list((combinations if symetrique else permutations)
+                     (range(nb),2))
+        if processus>1 and len(couples)>1:
+            import multiprocessing
+            taille=max(1,len(couples)//(processus*4))
+            lots=[couples[k:k+taille] for k in range(0,len(couples),taille)]
+            with multiprocessing.Pool(processus,_init_couples,
+                                      (self.etiquettes,self.nbesp)) as pool:
+                res=[r for lot in pool.map(_calc_couples,lots) for r in lot]
+        else:
+            res=[self.couple(i,j) for i,j in couples]
+        tables=tuple(np.diag(self.nbesp) for k in range(3))
+        for (i,j),r in zip(couples,res):
+            for t,v in zip(tables,r):
+                t[i,j]=v
+                if symetrique: t[j,i]=v
+        return cast(Tuple[np.ndarray,np.ndarray,np.ndarray],tables)
+
+"""
+Fonctions des processus de Matrice.tous_couples(). La matrice des étiquettes
+n'est transmise qu'une fois par processus, à son initialisation.
+"""
+_matrice_couples: Optional[Matrice] =None
+
+def _init_couples(etiquettes: np.ndarray,nbesp: np.ndarray) -> None:
+    global _matrice_couples
+    _matrice_couples=Matrice([],{},[])
+    _matrice_couples.etiquettes=etiquettes
+    _matrice_couples.nbesp=nbesp
+
+def _calc_couples(lot: List[Tuple[int,int]]) -> List[Tuple[int,int,int]]:
+    mat=cast(Matrice,_matrice_couples)
+    return [mat.couple(i,j) for i,j in lot]
+
+"""
+vMethode(matrice,col,meth,nom)
+
+Vue sur la colonne 'col de la Matrice 'matrice, représentant la Methode 'meth
+dans un EspaceCompact sous le nom 'nom. Remplace la pMethode de Espace, sans
+dictionnaire des échantillons.
+
+L'instance dispose des attributs et méthodes suivants :
+    .nom        Le nom 'nom.
+    .col        Le numéro de colonne 'col.
+    .meth       La Methode 'meth.
+    .exclus     Liste des Echantillon de 'meth non repris, ou None.
+    .especes    Dictionnaire {code espèce: frozenset des noms d'échantillons},
+                calculé au premier accès seulement.
+    len()       Nombre d'échantillons de la méthode dans l'espace.
+Elle hérite également des attributs de la Methode 'meth (.source, etc).
+"""
+class vMethode:
+    def __init__(self,matrice: Matrice,col: int,meth: Methode,nom: str):
+        self.matrice=matrice
+        self.col=col
+        self.meth=meth
+        self.nom=nom
+        self.exclus=matrice.exclus[col]
+
+    def __getattr__(self,attr):
+        if attr=="especes":
+            etiq=self.matrice.etiquettes[:,self.col]
+            codes=self.matrice.codes[self.col]
+            noms=self.matrice.noms
+            self.especes=dict((codes[e],frozenset(noms[i] for i in
+                               np.nonzero(etiq==e)[0].tolist()))
+                              for e in range(len(codes)))
+            return self.especes
+        return getattr(self.meth,attr)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.matrice.etiquettes[:,self.col]>=0))
+
+    def __str__(self):
+        return self.nom
+
+    def __repr__(self):
+        return "%s(%s)"%(self.__class__.__name__,self.nom)
+
+"""
+EspaceCompact(meths,strict=True,common=False)
+
+Equivalent de Espace(meths,strict,common) construit sur une Matrice. Le
+tuple est celui des vMethode, dans l'ordre de 'meths. Les options et les
+exceptions sont celles de Espace.
+
+L'instance dispose des attributs et méthodes de Espace utiles au calcul des
+indices :
+    .matrice        La Matrice.
+    .echantillons   La liste des noms (str) des échantillons.
+    .nbech, .meth_modif, .exclus
+    .paquets        Liste des paquets (set des noms d'échantillons).
+    .nbesp(), .sorted(), .rtax(), .irtax(), .ctax(), .ictax(), .mctax(),
+    .match_ratio(), .imatch_ratio()
+Contrairement à Espace, .ctax() et .match_ratio() ne sont pas statiques : ils
+utilisent la Matrice de l'instance.
+
+Elle dispose en outre des méthodes suivantes, pour le calcul en bloc de tous
+les couples de méthodes :
+    .tables()
+    .ratios()
+    .exporte()
+"""
+class EspaceCompact(tuple):
+    matrice: Matrice
+    echantillons: List[str]
+    meth_modif: int
+    exclus: int
+
+    def __new__(cls,meths: List[Methode],strict: bool=True,
+                common: bool=False) -> EspaceCompact:
+        andict,noms,effnoms,nbtot=Espace.prepare(meths,strict,common)
+        mat=Matrice(meths,andict,noms)
+        me=super().__new__(cls,[vMethode(mat,c,m,nom) for c,(m,nom) in
+                                enumerate(zip(meths,effnoms))])
+        me.matrice=mat
+        me.echantillons=noms
+        me.meth_modif=len([m for m in me if m.exclus])
+        me.exclus=nbtot-len(noms)
+        me.__ctax={}
+        me.__tables=None
+        return me
+
+    """
+    Calcule au premier appel, en 'processus processus, les matrices
+    (inter,union,ident) de Matrice.tous_couples() et les conserve ; .ctax()
+    et .match_ratio() les utilisent ensuite. Rend les matrices.
+    """
+    def tables(self,processus: int =1) \
+                                -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+        if self.__tables is None:
+            self.__tables=self.matrice.tous_couples(processus)
+        return self.__tables
+
+    """
+    Rend la matrice des Ctax (algo==ALGO_CTAX) ou des match ratio
+    (algo==ALGO_MRATIO) de tous les couples de méthodes, dans l'ordre de
+    l'espace, sous la forme du couple (a,b) des matrices des numérateurs et
+    des dénominateurs (voir .ctax() et .match_ratio()).
+    """
+    def ratios(self,algo: int =ALGO_CTAX,processus: int =1) \
+                                            -> Tuple[np.ndarray,np.ndarray]:
+        inter,union,ident=self.tables(processus)
+        if algo==ALGO_MRATIO:
+            nbesp=self.matrice.nbesp
+            return (ident*2,nbesp[:,None]+nbesp[None,:])
+        return (inter-1,union-1)
+
+    """
+    Calcule (voir .tables()) et écrit dans le fichier 'fich les matrices des
+    indices de tous les couples de méthodes. Si 'fich se termine par ".npz",
+    il s'agit d'un fichier NumPy comprenant les tableaux "methodes" (noms des
+    méthodes), "nbesp", "ctax_a", "ctax_b", "mratio_a" et "mratio_b"
+    (numérateurs et dénominateurs, voir .ratios()). Sinon, 'fich est un
+    fichier CSV de séparateur 'separ donnant la table carrée des Ctax ou des
+    match ratio selon 'algo ; les valeurs sans objet valent "N/A". 'fich peut
+    être un objet file-like déjà ouvert (CSV seulement).
+    """
+    def exporte(self,fich: Union[TextIO,str],algo: int =ALGO_CTAX,
+                separ: str =',',processus: int =1) -> None:
+        if isinstance(fich,str) and fich.lower().endswith(".npz"):
+            ca,cb=self.ratios(ALGO_CTAX,processus)
+            ma,mb=self.ratios(ALGO_MRATIO,processus)
+            np.savez_compressed(fich,methodes=np.array([m.nom for m in self]),
+                                nbesp=self.matrice.nbesp,ctax_a=ca,ctax_b=cb,
+                                mratio_a=ma,mratio_b=mb)
+            return
+        a,b=self.ratios(algo,processus)
+        if isinstance(fich,str):
+            cm=open(fich,"w")
+        else:
+            from contextlib import nullcontext
+            cm=cast(TextIO,nullcontext(fich))
+        with cm as f:
+            f.write(separ.join([""]+[m.nom for m in self])+"\n")
+            for i,m in enumerate(self):
+                f.write(m.nom)
+                for j in range(len(self)):
+                    f.write(separ+("%.4f"%(a[i,j]/b[i,j]) if b[i,j]>0
+                                   else "N/A"))
+                f.write("\n")
+
+    @property
+    def paquets(self) -> List[set]:
+        mat=self.matrice
+        lignes=np.nonzero(mat.etiquettes[:,0]>=0)[0].tolist()
+        paqs: List[set] =[set() for i in range(mat.nbpaquets())]
+        for i,p in zip(lignes,mat.paquets().tolist()):
+            paqs[p].add(mat.noms[i])
+        return paqs
+
+    @property
+    def nbech(self) -> int:
+        return len(self.echantillons)
+
+    def nbesp(self,meth: vMethode) -> int:
+        return int(self.matrice.nbesp[meth.col])
+
+    def rtax(self,meth: vMethode) -> IndiceType:
+        n=self.nbesp(meth)-1
+        d=self.matrice.nbpaquets()-1
+        return (n,d,(n/d if d else None))
+
+    def sorted(self) -> Iterator[vMethode]:
+        yield from sorted(self,key=NOM)
+
+    def irtax(self) -> Iterator[tuple[vMethode,IndiceType]]:
+        for m in self.sorted():
+            yield (m,self.rtax(m))
+
+    def ctax(self,meth1: vMethode,meth2: vMethode) -> IndiceType:
+        cle=(meth1.col,meth2.col)
+        if self.__tables is not None:
+            i,u=(int(t[cle]) for t in self.__tables[:2])
+        else:
+            if cle not in self.__ctax:
+                mat=self.matrice
+                self.__ctax[cle]=(mat.nbintersection(*cle),mat.nbunion(*cle))
+            i,u=self.__ctax[cle]
+        ni=i-1
+        nu=u-1
+        return (ni,nu,(ni/nu if nu else None))
+
+    def ictax(self) -> Iterator[tuple[vMethode,vMethode,IndiceType]]:
+        for m1,m2 in combinations(self.sorted(),2):
+            yield (m1,m2,self.ctax(m1,m2))
+
+    def mctax(self,meth: vMethode) -> Optional[float]:
+        nb=0
+        sum=0.0
+        for meth2 in self:
+            if meth is not meth2:
+                _,_,c=self.ctax(meth,meth2)
+                if c is not None:
+                    nb+=1
+                    sum+=c
+        return sum/nb if nb else None
+
+    def match_ratio(self,meth1: vMethode,meth2: vMethode) -> IndiceType:
+        if self.__tables is not None:
+            a=int(self.__tables[2][meth1.col,meth2.col])*2
+        else:
+            a=self.matrice.nbidentiques(meth1.col,meth2.col)*2
+        b=self.nbesp(meth1)+self.nbesp(meth2)
+        return (a,b,a/b)
+
+    def imatch_ratio(self) -> Iterator[tuple[vMethode,vMethode,IndiceType]]:
+        for m1,m2 in combinations(self.sorted(),2):
+            yield (m1,m2,self.match_ratio(m1,m2))
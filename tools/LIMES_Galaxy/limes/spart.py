@@ -2,14 +2,18 @@
 from __future__ import annotations
 
 import re,datetime,sys
+from array import array
+from math import isnan
 from .core import (Echantillon,Methode,Source,RedundantNameError,get_text,
                    Espace)
 from .core import MLMsgType
 
 from operator import itemgetter
+from itertools import compress
 
 from typing import (Optional,Any,Pattern,Match,Set,Tuple,Type,Union,cast,
-                    TextIO,List,Callable,TypeVar,Dict,overload)
+                    TextIO,List,Callable,TypeVar,Dict,overload,Iterator,
+                    Iterable,Mapping,Sequence)
 
 # -----------------------------------------------------------
 # Utilitaires.
@@ -228,32 +232,26 @@ def ctrl_redond(sec: SectionType,num: NumligneType,nom: str,stock: Set[str],
 
 re_titre=re.compile(r"\s*(\w+)\s*=\s*(.*?)\s*",re.ASCII)
 
+msg_nontermine=("Dernier bloc non terminé par ';'",
+                "Last block not ended with ';'")
+
 """
-Lit le prochain bloc dans le fichier 'file. 'num est le numéro de la dernière
-ligne lue (utile pour les messages d'erreur ; donner 0 pour la lecture du
-premier bloc).
-Rend un triplet (num,tt,lst), où 'num est le numéro de la dernière ligne lue,
-'tt le titre du bloc, et 'lst la liste des couples (n,t) des lignes constituant
-le bloc ('n est le numéro de ligne et 't la ligne).
-Les lignes 't restituées ont les propriétés suivantes :
+Générateur des lignes utiles du fichier 'file. Rend pour chaque ligne un
+triplet (num,lg,fin), où 'num est le numéro de la ligne, 'lg la ligne, et 'fin
+vaut True si la ligne termine un bloc (';').
+Les lignes 'lg restituées ont les propriétés suivantes :
     - les commentaires ont été éliminés ; les commentaires inclus ont été
         remplacés par un blanc (ils sont donc séparateurs).
-    - les lignes vides (éventuellement après élimination des commentaires) ont
-        été éliminées.
+    - le ';' final a été éliminé.
     - les lignes sont stripées au début et à la fin.
-Cas particuliers :
-    - Rend (None,None,None) s'il n'y a plus de blocs dans le fichier.
-    - Rend (num,"begin",None) pour le bloc "begin spart".
-    - Rend (num,"end",None) pour le bloc "end".
-Génère une exception SyntaxError si erreur.
+Les lignes vides (éventuellement après élimination des commentaires) ne sont
+rendues que si elles terminent un bloc. Un commentaire ouvert et non fermé sur
+la ligne terminant un bloc est ignoré.
+Génère une exception SyntaxError si une ligne n'est pas vide après le ';'.
 """
-def read_bloc(file: TextIO,num: int) -> \
-                        Union[Tuple[None,None,None],
-                        Tuple[int,str,Optional[LignesType]]]:
-    lst=[]
+def lignes_utiles(file: TextIO) -> Iterator[Tuple[int,str,bool]]:
     outcomm=True
-    num+=1
-    for num,lg in enumerate(file,start=num):
+    for num,lg in enumerate(file,start=1):
         ll=[]
         while True:
             t,s,lg=lg.partition("]["[outcomm])
@@ -263,47 +261,95 @@ def read_bloc(file: TextIO,num: int) -> \
                 break
             outcomm=not outcomm
         lg=" ".join(ll)
-        end=';' in lg
-        if end:
+        fin=';' in lg
+        if fin:
+            outcomm=True # Un commentaire ouvert après le ';' est ignoré.
             lg,_,q=lg.partition(';')
             if q.strip():
                 raise SyntaxError(msgError(None,num,("Ligne non vide après ';'",
                                                      "Line not empty after ';'")))
         lg=lg.strip()
-        if lg:
-            lst.append((num,lg))
-        if end:
-            break
-    else:
-        if lst:
-            raise SyntaxError(get_text("Dernier bloc non terminé par ';'",
-                                       "Last block not ended with ';'"))
-        return (None,None,None)
-    if not lst:
-        raise SyntaxError(msgError(None,num,("Bloc vide","Empty block")))
-    # A partir d'ici, 'lst contient uniquement les lignes non vides, stripées,
-    # et débarassées des commentaires et du ';' final.
-
-    if len(lst)<=2:
-        lg=" ".join(" ".join(map(itemgetter(1),lst)).split())
-        if lg=="begin spart":
-            return (num,"begin",None)
-        if lg=="end":
-            return (num,"end",None)
-
-    n1,lg=lst.pop(0)
-    n2=None
-    if '=' not in lg and lst:
-        n2,lg2=lst.pop(0)
-        lg+=lg2
-    ma=match(None,n1,re_titre,lg,("Ligne de titre mal formée",
-                                  "Malformed title line"))
-    titre,q=ma.groups()
-    if q:
-        lst.insert(0,(n2 or n1,q))
-    if not lst:
-        raise SyntaxError(msgError(titre,num,("Bloc vide","Empty block")))
-    return (num,titre,lst)
+        if lg or fin:
+            yield (num,lg,fin)
+
+"""
+Générateur des blocs du fichier 'file. Rend pour chaque bloc un triplet
+(num,tt,lignes), où 'num est le numéro de la première ligne du bloc, 'tt le
+titre du bloc, et 'lignes un itérateur sur les couples (n,t) des lignes
+constituant le bloc ('n est le numéro de ligne et 't la ligne, voir
+lignes_utiles() ; les lignes vides sont éliminées).
+Les lignes du bloc sont lues dans le fichier au fur et à mesure que 'lignes
+est consommé : seul le bloc courant est en mémoire, ligne par ligne. Les
+lignes non consommées sont sautées au passage au bloc suivant.
+Cas particuliers :
+    - Rend (num,"begin",None) pour le bloc "begin spart".
+    - Rend (num,"end",None) pour le bloc "end".
+Génère une exception SyntaxError si erreur.
+"""
+def iter_blocs(file: TextIO) -> \
+                    Iterator[Tuple[int,str,Optional[Iterator[LigneType]]]]:
+    lignes=lignes_utiles(file)
+
+    def corps(tete: LignesType,fin: bool) -> Iterator[LigneType]:
+        yield from tete
+        if not fin:
+            for num,lg,fin in lignes:
+                if lg:
+                    yield (num,lg)
+                if fin:
+                    return
+            raise SyntaxError(get_text(*msg_nontermine))
+
+    num=0
+    while True:
+        # On lit d'avance au plus 3 lignes non vides : de quoi reconnaître les
+        # blocs "begin spart" et "end", et le titre.
+        tete: LignesType =[]
+        fin=False
+        for num,lg,fin in lignes:
+            if lg:
+                tete.append((num,lg))
+            if fin or len(tete)==3:
+                break
+        else:
+            if tete:
+                raise SyntaxError(get_text(*msg_nontermine))
+            return
+        if not tete:
+            raise SyntaxError(msgError(None,num,("Bloc vide","Empty block")))
+
+        if fin and len(tete)<=2:
+            lg=" ".join(" ".join(map(itemgetter(1),tete)).split())
+            if lg=="begin spart":
+                yield (num,"begin",None)
+                continue
+            if lg=="end":
+                yield (num,"end",None)
+                continue
+
+        n1,lg=tete.pop(0)
+        n2=None
+        if '=' not in lg and tete:
+            n2,lg2=tete.pop(0)
+            lg+=lg2
+        ma=match(None,n1,re_titre,lg,("Ligne de titre mal formée",
+                                      "Malformed title line"))
+        titre,q=ma.groups()
+        if q:
+            tete.insert(0,(n2 or n1,q))
+        if not tete and not fin:
+            for num,lg,fin in lignes:
+                if lg:
+                    tete.append((num,lg))
+                if fin or tete:
+                    break
+            else:
+                raise SyntaxError(get_text(*msg_nontermine))
+        if not tete:
+            raise SyntaxError(msgError(titre,num,("Bloc vide","Empty block")))
+        lst=corps(tete,fin)
+        yield (n1,titre,lst)
+        for _ in lst: pass
 
 # -----------------------------------------------------------
 # Lecture de chaque type de bloc.
@@ -413,63 +459,80 @@ T=TypeVar('T',Optional[int],ScoreType)
 """
 Traitement commun aux blocs Individual_assignment et Individual_score. 'fn est
 la fonction spécifique, appelée avec deux arguments : le numéro de ligne et
-un terme sous forme str ; elle doit rendre l'élément à restituer.
+la liste des termes de la ligne sous forme str ; elle doit rendre la liste des
+éléments à restituer.
+Générateur rendant, ligne par ligne, un couple (a,b) où 'a est le nom de
+l'échantillon et 'b la liste des éléments de cet échantillon pour chacune des
+spartitions. Les lignes 'lignes peuvent être un itérateur (voir iter_blocs()).
+Le nombre de spartitions doit être le même pour toutes les lignes ; il doit
+valoir 'nbpart si celui-ci est fourni.
+On a la garantie que les noms des échantillons sont uniques (casse non sensible).
+Génère une exception SyntaxError ou ValueError si erreur,
+RedundantNameError si un échantillon est redondant.
 """
-def read_Individual_common(sec: str,lst: LignesType,
-                           fn: Callable[[int,str],T]) -> \
-                           Tuple[int,List[Tuple[str,List[T]]]]:
-    output: List[Tuple[str,List[T]]]=[]
+def iter_Individual_common(sec: str,lignes: Iterable[LigneType],
+                           fn: Callable[[int,List[str]],List[T]],
+                           nbpart: Optional[int] =None) -> \
+                           Iterator[Tuple[str,List[T]]]:
     dejavu: Set[str] =set()
-    nbpart=0
-    for num,lg in lst:
+    for num,lg in lignes:
         ech,lg=split_2points(sec,num,lg,None)
         ech=is_sample_name(sec,num,ech)
         ctrl_redond(sec,num,ech,dejavu,("échantillon","sample"))
         llg=lg.split('/')
         n=len(llg)
-        if output:
-            if n!=nbpart:
-                raise ValueError(msgError(sec,num,
-                                          ("Nombre de méthodes <%d> incohérent",
-                                           "Inconsistent number of methods <%d>"),
-                                          n))
-        else:
+        if nbpart is None:
             nbpart=n
-        output.append((ech,[fn(num,s) for s in llg]))
-    return nbpart,output
+        elif n!=nbpart:
+            raise ValueError(msgError(sec,num,
+                                      ("Nombre de méthodes <%d> incohérent",
+                                       "Inconsistent number of methods <%d>"),
+                                      n))
+        yield (ech,fn(num,llg))
 
 """
-Lit un bloc "Individual_assignment" et rend un couple (a,b) où 'a est le nombre
-de spartitions et 'b la liste des affectations par échantillon. Chaque élément
-est un couple (c,d), où 'c est le nom de l'échantillon et 'd la liste des rangs
-de cet échantillon pour chacune des 'a spartitions. Chaque rang est un entier
->=0, ou None s'il n'y a pas d'affectation de cet échantillon pour cette
-spartition.
-On a la garantie que les noms des échantillons sont uniques (casse non sensible).
-Génère une exception SyntaxError ou ValueError si erreur,
-RedundantNameError si un échantillon est redondant.
+Lit un bloc "Individual_assignment" : générateur rendant pour chaque
+échantillon un couple (a,b) où 'a est le nom de l'échantillon et 'b la liste
+des rangs de cet échantillon pour chacune des spartitions. Chaque rang est un
+entier >=0, ou None s'il n'y a pas d'affectation de cet échantillon pour cette
+spartition. Voir iter_Individual_common() pour 'nbpart et les erreurs.
 """
-def read_Individual_assignment(sec: str,lst: LignesType) -> \
-                        Tuple[int,List[Tuple[str,List[Optional[int]]]]]:
-    def read_rank(num: int,rk: str) -> Optional[int]:
-        return get_int(sec,num,rk,("Rang invalide","Invalid rank"),interog=True)
-    return read_Individual_common(sec,lst,read_rank)
+def iter_Individual_assignment(sec: str,lignes: Iterable[LigneType],
+                               nbpart: Optional[int] =None) -> \
+                               Iterator[Tuple[str,List[Optional[int]]]]:
+    def read_ranks(num: int,llg: List[str]) -> List[Optional[int]]:
+        # Cas courants en premier : tous les rangs sont des entiers, >=0 faute
+        # de '-', éventuellement avec des "?".
+        if '-' not in "".join(llg):
+            try:
+                try:
+                    return cast(List[Optional[int]],list(map(int,llg)))
+                except ValueError:
+                    return [(None if rk.strip()=="?" else int(rk))
+                            for rk in llg]
+            except ValueError:
+                pass
+        return [get_int(sec,num,rk,("Rang invalide","Invalid rank"),
+                        interog=True)
+                for rk in llg]
+    return iter_Individual_common(sec,lignes,read_ranks,nbpart)
 
 """
-Lit un bloc "Individual_score" et rend un couple (a,b) où 'a est le nombre de
-spartitions et 'b la liste des scores par échantillon. Chaque élément est un
-couple (c,d), où 'c est le nom de l'échantillon et 'd la liste des scores de
-cet échantillon pour chacune des 'a spartitions. Chaque score est un float,
-ou None s'il n'y a pas de score pour cet échantillon et cette spartition.
-On a la garantie que les noms des échantillons sont uniques.
-Génère une exception SyntaxError ou ValueError si erreur,
-RedundantNameError si un échantillon est redondant.
+Lit un bloc "Individual_score" : générateur rendant pour chaque échantillon un
+couple (a,b) où 'a est le nom de l'échantillon et 'b la liste des scores de
+cet échantillon pour chacune des spartitions. Chaque score est un float, ou
+None s'il n'y a pas de score pour cet échantillon et cette spartition. Voir
+iter_Individual_common() pour 'nbpart et les erreurs.
 """
-def read_Individual_score(sec: str,lst: LignesType) -> \
-                        Tuple[int,List[Tuple[str,List[ScoreType]]]]:
-    def read_score(num: int,sc: str) -> ScoreType:
-        return get_score(sec,num,sc)
-    return read_Individual_common(sec,lst,read_score)
+def iter_Individual_score(sec: str,lignes: Iterable[LigneType],
+                          nbpart: Optional[int] =None) -> \
+                          Iterator[Tuple[str,List[ScoreType]]]:
+    def read_scores(num: int,llg: List[str]) -> List[ScoreType]:
+        try:
+            return cast(List[ScoreType],list(map(float,llg)))
+        except ValueError:
+            return [get_score(sec,num,sc) for sc in llg]
+    return iter_Individual_common(sec,lignes,read_scores,nbpart)
 
 """
 Lit un bloc XXX_score_type et rend la liste des noms de types, un par
@@ -543,6 +606,8 @@ de Source :
     .methodes   Liste des Methode.
     .load()     Charge le fichier (au 1er appel) et rend la liste de Methode
                 constituant le fichier.
+    .iter_methodes()
+                Générateur des Methode constituant le fichier (voir texte).
 
 Les Methode portées par l'instance disposent, en plus des attributs standard,
 des attributs suivants :
@@ -566,6 +631,15 @@ des attributs suivants :
     .Tree       L'arbre sous forme textuelle (str), ou None.
     .Command_line
                 None si non définie.
+
+Le fichier est lu bloc par bloc et ligne par ligne (voir iter_blocs()). Les
+blocs Individual_assignment et Individual_score, dont la taille est
+proportionnelle au nombre d'échantillons, sont contrôlés ligne par ligne et
+stockés sous forme de tableaux (array). Les Methode sont
+ensuite construites et contrôlées une par une par .iter_methodes() : un
+fichier comprenant de nombreuses spartitions peut ainsi être traité sans
+garder toutes les Methode en mémoire. .load() les conserve au contraire
+toutes.
 """
 class Reader_spart(Source):
     type="spart"
@@ -575,253 +649,362 @@ class Reader_spart(Source):
 
     def load(self) -> List[Methode]:
         if not hasattr(self,"methodes"):
-            blocs: Dict[Union[str,Sections],Any] ={}
-            msg_miss=get_text("Bloc '%s' manquant","Missing '%s' block")
-            try:
-                with open(self.fich) as f:
-                    num: Optional[int] =0
-                    vu=False
-                    while True:
-                        assert num is not None
-                        num,titre,lst=read_bloc(f,num)
-                        if lst is None: # fin ou begin/end
-                            if vu:
-                                if titre is None: # fin
-                                    raise SyntaxError(msg_miss%"end")
-                                if titre=="begin":
-                                    raise SyntaxError(msgError(titre,num,
-                                                ("Bloc 'begin spart' mal placé",
-                                                 "Misplaced 'begin spart' block")))
-                                break # "end" rencontré.
-                            if titre is None: # fin
-                                raise SyntaxError(msg_miss%"begin spart")
-                            if titre=="begin": vu=True
-                        else:
-                            assert titre is not None
-                            if vu:
-                                blocs[titre.capitalize()]=lst
-                # A partir d'ici, 'blocs contient tous les blocs lus dans le
-                # fichier :
-                #   cle = le titre du bloc (capitalisé)
-                #   valeur = la liste des lignes, sous la forme de couples
-                #       (num, lg).
-
-                for sec in Sections:
-                    if sec.value in blocs:
-                        blocs[sec]=globals()["read_"+sec.value] \
-                                                (sec.value,blocs[sec.value])
-                    elif sec.oblig:
-                        raise SyntaxError(msg_miss%sec.value)
-
-                # A partir d'ici, 'blocs contient (en plus) les blocs lus et
-                # pour lesquels une fonction de traitement read_XXX() est
-                # définie :
-                #   cle = la constante Sections.XXX
-                #   valeur = le format dépend de la section :
-                #
-                #   Project_name    Le titre (str)
-                #   Date            Le datetime
-                #   N_spartitions   Liste de couples (nom, score)
-                #   N_individuals   Liste des nombres d'échantillons
-                #   N_subsets       Liste de tuple, chaque tuple donnant les
-                #                   scores (ou None) de chaque espèce
-                #   Individual_assignment
-                #                   Un couple (nb_spart, liste), où chaque
-                #                   élément de 'liste est un couple (nom,
-                #                   liste_rangs)
-                #   Individual_score
-                #                   Un couple (nb_spart, liste), où chaque
-                #                   élément de 'liste est un couple (nom,
-                #                   liste_scores)
-                #   Spartition_score_type
-                #   Subset_score_type
-                #   Individual_score_type
-                #                   Liste des types (ou None)
-                #   Tree            Dictionnaire { nom_spart, ligne }
-                #   Command         Dictionnaire { nom_spart, ligne }
-
-                nbpart=len(blocs[Sections.N_spartitions])
-                ko: Optional[Sections]
-                for sec in (Sections.N_individuals,Sections.N_subsets,
-                           Sections.Spart_score_type,Sections.Subset_score_type,
-                           Sections.Ind_score_type):
-                    if sec in blocs and len(blocs[sec])!=nbpart:
-                        ko=sec
-                        break
-                else:
-                    for sec in (Sections.Assignment,Sections.Ind_score):
-                        if sec in blocs:
-                            nb,data=blocs[sec]
-                            if nb!=nbpart:
-                                ko=sec
-                                break
-                            blocs[sec]=data
-                            # On supprime le nombre de spartitions ('nb), qui
-                            # ne sert plus, pour simplifier la suite.
-                    else:
-                        ko=None
-                if ko:
-                    raise SyntaxError(
-                        get_text("Nombre de spartitions incohérent entre "
-                                 "les blocs %s et %s",
-                                 "Inconsistent number of spartitions "
-                                 "between the blocks %s and %s")%
-                                  (Sections.N_spartitions.value,
-                                   ko.value))
-
-                # A partir d'ici, pour les sections Individual_assignment et
-                # Individual_score, la valeur de blocs[sec] est la simple liste
-                # des couples (nom, liste)
-
-                self.methodes=[]
-                self.echantillons=[Echantillon(e)
-                                   for e,_ in blocs[Sections.Assignment]]
-
-                # La boucle ci-après traite chaque méthode une après l'autre.
-                #
-                for rang,((nom,score),subset) in \
-                                    enumerate(zip(blocs[Sections.N_spartitions],
-                                                  blocs[Sections.N_subsets])):
-                    # 'rang est le rang de la méthode dans toutes les listes
-                    # du fichier Spart, à compter de 0.
-                    # 'nom est le nom de la méthode.
-                    # 'score est son score (N_spartitions).
-                    # 'subset est la liste des scores des espèces (N_subsets).
-
-                    le=[(e,ass[rang])
-                        for e,(_,ass) in zip(self.echantillons,
-                                             blocs[Sections.Assignment])
-                        if ass[rang] is not None]
-                    # 'le est la liste des couples (a,b) où 'a est le
-                    # Echantillon et 'b le code-espèce ; elle ne comprend que
-                    # les échantillons pour lesquels le code-espèce est !="?".
-
-                    a,b=len(le),blocs[Sections.N_individuals][rang]
-                    if a!=b:
-                        raise ValueError(
-                                get_text("Méthode %s : nombre d'échantillons (%d) "
-                                         "incohérent avec %s (%d)",
-                                         "Method %s: number of samples (%d) "
-                                         "inconsistent with %s (%d)")%
-                                (nom,a,Sections.N_individuals.value,b))
-                    esp=list(map(itemgetter(1),le))
-                    # 'esp est la liste des codes-espèces, parallèle à
-                    # self.echantillons. set(esp) est le set des codes-espèces
-                    # différents.
-
-                    a,b=len(set(esp)),len(subset)
-                    if a!=b:
-                        raise ValueError(
-                                get_text("Méthode %s : nombre d'espèces (%d) "
-                                         "incohérent avec %s (%d)",
-                                         "Method %s: number of species (%d) "
-                                         "inconsistent with %s (%d)")%
-                                (nom,a,Sections.N_subsets.value,b))
-                        
-                    m=Methode(nom,list(map(itemgetter(0),le)),esp,self)
-                    # Le nombre d'échantillons est forcément >=1 car cela a été
-                    # testé dans read_N_individuals().
-                    m.score=score # type: ignore
-                    def notallnone(lst):
-                        return any(map(lambda e: e is not None,lst))
-
-                    m.Subset_score=subset if notallnone(subset) else None # type: ignore
-
-                    for sec in (Sections.Spart_score_type,
-                               Sections.Subset_score_type,
-                               Sections.Ind_score_type):
-                        setattr(m,sec.value,
-                                blocs[sec][rang] if sec in blocs else None)
-                    for sec in (Sections.Tree,Sections.Command):
-                        setattr(m,sec.value,
-                                blocs[sec].get(nom) if sec in blocs else None)
-
-                    m.Individual_score=None # type: ignore
-                    if Sections.Ind_score in blocs:
-                        d=dict((e,s[rang])
-                               for (e,s) in blocs[Sections.Ind_score])
-                        # d : nom_ech -> score (ou None si "?")
-                        d=dict((ech,d.get(ech.nom)) for ech in m)
-                        # d : Echantillon -> score (ou None si "?" ou si non
-                        # fourni dans Individual_score pour cet échantillon
-                        d=dict((ech,v) for ech,v in d.items() if v is not None)
-                        # d : Echantillon -> score, uniquement si score!=None
-                        if d:
-                            m.Individual_score=d # type: ignore
-
-                    self.methodes.append(m)
-                self.titre=blocs[Sections.Project_name]
-                self.date=blocs[Sections.Date]
-            except Exception as e:
-                raise type(e)(get_text("Ne peut charger le fichier Spart %s",
-                                       "Cannot load the Spart file %s")%
-                              self.fich)
+            self.methodes=list(self.iter_methodes())
         return self.methodes
 
+    """
+    Générateur des Methode du fichier, dans l'ordre du fichier. Si le fichier
+    a déjà été chargé par .load(), rend simplement les Methode de .methodes.
+    Sinon, lit le fichier (voir .__lit()), puis construit et contrôle chaque
+    Methode au moment de la rendre.
+    Génère une exception si erreur.
+    """
+    def iter_methodes(self) -> Iterator[Methode]:
+        if hasattr(self,"methodes"):
+            yield from self.methodes
+            return
+        try:
+            blocs=self.__lit()
+            for rang in range(len(blocs[Sections.N_spartitions])):
+                yield self.__methode(blocs,rang)
+        except Exception as e:
+            raise type(e)(get_text("Ne peut charger le fichier Spart %s",
+                                   "Cannot load the Spart file %s")%
+                          self.fich)
+
+    """
+    Lit le fichier et rend le dictionnaire des blocs : la clé est la constante
+    Sections.XXX, la valeur dépend de la section :
+
+        Project_name    Le titre (str)
+        Date            Le datetime
+        N_spartitions   Liste de couples (nom, score)
+        N_individuals   Liste des nombres d'échantillons
+        N_subsets       Liste de tuple, chaque tuple donnant les scores (ou
+                        None) de chaque espèce
+        Individual_assignment
+                        Un triplet (noms, nb_spart, rangs), où 'noms est la
+                        liste des noms des échantillons et 'rangs l'array
+                        des rangs (-1 si "?"), échantillon par échantillon
+                        et spartition par spartition : le rang de
+                        l'échantillon 'i pour la spartition 'j est
+                        rangs[i*nb_spart+j]
+        Individual_score
+                        Un couple (nb_spart, scores), où 'scores est le
+                        dictionnaire nom -> array des scores de l'échantillon
+                        pour chaque spartition (nan si "?")
+        Spartition_score_type
+        Subset_score_type
+        Individual_score_type
+                        Liste des types (ou None)
+        Tree            Dictionnaire { nom_spart, ligne }
+        Command         Dictionnaire { nom_spart, ligne }
+
+    Affecte au passage .echantillons, .titre et .date.
+    Génère une exception si erreur.
+    """
+    def __lit(self) -> Dict[Sections,Any]:
+        blocs: Dict[Sections,Any] ={}
+        sections=dict((sec.value,sec) for sec in Sections)
+        msg_miss=get_text("Bloc '%s' manquant","Missing '%s' block")
+        with open(self.fich) as f:
+            vu=False
+            for num,titre,lignes in iter_blocs(f):
+                if lignes is None: # begin/end
+                    if vu:
+                        if titre=="begin":
+                            raise SyntaxError(msgError(titre,num,
+                                            ("Bloc 'begin spart' mal placé",
+                                             "Misplaced 'begin spart' block")))
+                        break # "end" rencontré.
+                    if titre=="begin": vu=True
+                elif vu:
+                    sec=sections.get(titre.capitalize())
+                    if sec is None: # Bloc inconnu, ignoré.
+                        continue
+                    nbpart=len(blocs[Sections.N_spartitions]) \
+                           if Sections.N_spartitions in blocs else None
+                    if sec is Sections.Assignment:
+                        noms: List[str] =[]
+                        tab=array('i')
+                        for nom,rangs in iter_Individual_assignment(
+                                                    sec.value,lignes,nbpart):
+                            noms.append(nom)
+                            if None in rangs:
+                                rangs=[(-1 if r is None else r) for r in rangs]
+                            tab.extend(cast(List[int],rangs))
+                            nbpart=len(rangs)
+                        blocs[sec]=(noms,nbpart,tab)
+                    elif sec is Sections.Ind_score:
+                        scores: Dict[str,array] ={}
+                        for nom,lsc in iter_Individual_score(sec.value,lignes,
+                                                             nbpart):
+                            scores[nom]=array('d',(float("nan") if sc is None
+                                                   else sc for sc in lsc))
+                            nbpart=len(lsc)
+                        blocs[sec]=(nbpart,scores)
+                    else:
+                        blocs[sec]=globals()["read_"+sec.value] \
+                                                        (sec.value,list(lignes))
+            else:
+                raise SyntaxError(msg_miss%("end" if vu else "begin spart"))
+
+        for sec in Sections:
+            if sec.oblig and sec not in blocs:
+                raise SyntaxError(msg_miss%sec.value)
+
+        nbpart=len(blocs[Sections.N_spartitions])
+        ko: Optional[Sections]
+        for sec in (Sections.N_individuals,Sections.N_subsets,
+                   Sections.Spart_score_type,Sections.Subset_score_type,
+                   Sections.Ind_score_type):
+            if sec in blocs and len(blocs[sec])!=nbpart:
+                ko=sec
+                break
+        else:
+            if blocs[Sections.Assignment][1]!=nbpart:
+                ko=Sections.Assignment
+            elif Sections.Ind_score in blocs and \
+                 blocs[Sections.Ind_score][0]!=nbpart:
+                ko=Sections.Ind_score
+            else:
+                ko=None
+        if ko:
+            raise SyntaxError(
+                get_text("Nombre de spartitions incohérent entre "
+                         "les blocs %s et %s",
+                         "Inconsistent number of spartitions "
+                         "between the blocks %s and %s")%
+                          (Sections.N_spartitions.value,
+                           ko.value))
+
+        self.echantillons=[Echantillon(e)
+                           for e in blocs[Sections.Assignment][0]]
+        self.titre=blocs[Sections.Project_name]
+        self.date=blocs[Sections.Date]
+        return blocs
+
+    """
+    Construit et rend la Methode de rang 'rang (à compter de 0) dans toutes
+    les listes du fichier Spart. 'blocs est le dictionnaire rendu par
+    .__lit().
+    Génère une exception ValueError si la spartition est incohérente avec les
+    blocs N_individuals ou N_subsets.
+    """
+    def __methode(self,blocs: Dict[Sections,Any],rang: int) -> Methode:
+        nom,score=blocs[Sections.N_spartitions][rang]
+        subset=blocs[Sections.N_subsets][rang]
+        # 'nom est le nom de la méthode.
+        # 'score est son score (N_spartitions).
+        # 'subset est la liste des scores des espèces (N_subsets).
+
+        _,nb,tab=blocs[Sections.Assignment]
+        esp=tab[rang::nb].tolist()
+        echs=self.echantillons
+        if -1 in esp:
+            garde=[r>=0 for r in esp]
+            echs=list(compress(echs,garde))
+            esp=list(compress(esp,garde))
+        # 'echs est la liste des Echantillon de la méthode, et 'esp la liste
+        # parallèle des codes-espèces ; elles ne comprennent que les
+        # échantillons pour lesquels le code-espèce est !="?". set(esp) est le
+        # set des codes-espèces différents.
+
+        a,b=len(esp),blocs[Sections.N_individuals][rang]
+        if a!=b:
+            raise ValueError(
+                    get_text("Méthode %s : nombre d'échantillons (%d) "
+                             "incohérent avec %s (%d)",
+                             "Method %s: number of samples (%d) "
+                             "inconsistent with %s (%d)")%
+                    (nom,a,Sections.N_individuals.value,b))
+
+        a,b=len(set(esp)),len(subset)
+        if a!=b:
+            raise ValueError(
+                    get_text("Méthode %s : nombre d'espèces (%d) "
+                             "incohérent avec %s (%d)",
+                             "Method %s: number of species (%d) "
+                             "inconsistent with %s (%d)")%
+                    (nom,a,Sections.N_subsets.value,b))
+
+        m=Methode(nom,echs,esp,self)
+        # Le nombre d'échantillons est forcément >=1 car cela a été testé dans
+        # read_N_individuals().
+        m.score=score # type: ignore
+        def notallnone(lst):
+            return lst.count(None)<len(lst)
+
+        m.Subset_score=subset if notallnone(subset) else None # type: ignore
+
+        for sec in (Sections.Spart_score_type,
+                   Sections.Subset_score_type,
+                   Sections.Ind_score_type):
+            setattr(m,sec.value,blocs[sec][rang] if sec in blocs else None)
+        for sec in (Sections.Tree,Sections.Command):
+            setattr(m,sec.value,blocs[sec].get(nom) if sec in blocs else None)
+
+        m.Individual_score=None # type: ignore
+        if Sections.Ind_score in blocs:
+            scores=blocs[Sections.Ind_score][1]
+            d={}
+            for ech in m:
+                lsc=scores.get(ech.nom)
+                if lsc is not None and not isnan(lsc[rang]):
+                    d[ech]=lsc[rang]
+            # d : Echantillon -> score, uniquement pour les échantillons dont
+            # le score est fourni dans Individual_score et !="?".
+            if d:
+                m.Individual_score=d # type: ignore
+        return m
+
 """
-Produit le fichier 'fich au format Spart, à partir de l'ensemble des méthodes
-regroupées dans l'Espace 'espace. 'titre est le titre du fichier (section
-Project_name). 'fich peut être un objet file-like déjà ouvert.
-Génère une exception si ne peut ouvrir le fichier, ou si un échantillon a un
-nom non conforme avec la syntaxe Spart.
+Writer_spart_flux(fich,titre,echantillons)
+
+Produit le fichier 'fich au format Spart, spartition par spartition, sans
+passer par un Espace. 'echantillons est la liste des noms des échantillons,
+dans l'ordre du bloc Individual_assignment. 'titre est le titre du fichier
+(section Project_name). 'fich peut être un objet file-like déjà ouvert.
+Génère une exception si un échantillon a un nom non conforme avec la syntaxe
+Spart.
+
+L'instance dispose des méthodes suivantes :
+    .add(nom,codes,**attrs)
+                Ajoute la spartition 'nom. 'codes donne le code espèce de
+                chaque échantillon : séquence parallèle à 'echantillons, ou
+                dictionnaire nom_échantillon -> code ; le code vaut None (ou
+                est absent du dictionnaire) si l'échantillon n'est pas affecté.
+                'attrs donne les attributs facultatifs de la spartition, ceux
+                des Methode de Reader_spart (voir .attributs) ;
+                Individual_score est une séquence ou un dictionnaire comme
+                'codes. Génère une exception si 'codes n'a pas la longueur de
+                'echantillons.
+    .close()    Ecrit le fichier.
+L'instance est aussi un context manager : le fichier est écrit en sortie du
+bloc with, sauf exception.
+
+Chaque spartition est stockée dès .add() sous forme compacte : le tableau
+(array) des codes espèces, renumérotés si besoin. La mémoire occupée est ainsi
+de l'ordre de 4 octets par échantillon et par spartition. Le fichier est
+ensuite écrit ligne par ligne.
 """
-def Writer_spart(fich: Union[TextIO,str],titre: str,espace: Espace):
-    # On travaille entièrement sur les pMethode du Espace, qui prend donc en
-    # compte les éventuels renommages et/ou suppressions d'échantillons, ansi
-    # que les renommages de noms de méthodes.
-    # Pour travailler entièrement sur les Methode réelles, il aurait fallu
-    # faire :
-    # espace=[m.meth for m in espace]
+class Writer_spart_flux:
+    attributs=("score","Subset_score","Individual_score",
+               Sections.Spart_score_type.value,Sections.Subset_score_type.value,
+               Sections.Ind_score_type.value,Sections.Tree.value,
+               Sections.Command.value)
+
+    def __init__(self,fich: Union[TextIO,str],titre: str,
+                 echantillons: Sequence[str]):
+        for nom in echantillons:
+            is_sample_name(None,None,nom)
+        self.fich=fich
+        self.titre=titre
+        self.echantillons=list(echantillons)
+        self.__noms: List[str] =[]
+        self.__codes: List[array] =[]
+        self.__nbind: List[int] =[]
+        self.__nbesp: List[int] =[]
+        self.__attrs: Dict[str,list] =dict((a,[]) for a in self.attributs)
+
+    def __enter__(self) -> Writer_spart_flux:
+        return self
+
+    def __exit__(self,exc_type,*args) -> None:
+        if exc_type is None:
+            self.close()
 
     """
-    Rend la liste des valeurs de l'attribut 'attr pour toutes les méthodes de
-    'espace. Si l'attribut n'existe pas ou vaut None, la valeur est None dans
-    la liste si 'interog vaut False, "?" si 'interog vaut True.
-    Si None (ou "?") pour toutes les méthodes, rend None au lieu de la liste.
+    Rend 'val sous la forme d'une séquence parallèle à .echantillons. 'val
+    est une séquence ou un dictionnaire nom_échantillon -> valeur.
     """
-    def getlstval(attr,interog=True):
-        lst=[getattr(m,attr,None) for m in espace]
-        nb=lst.count(None)
-        return None if nb==len(lst) \
-               else [("?" if v is None else v) for v in lst] if nb and interog \
-               else lst
+    def __parallele(self,nom: str,val: Union[Sequence,Mapping]) -> Sequence:
+        if isinstance(val,Mapping):
+            return [val.get(e) for e in self.echantillons]
+        if len(val)!=len(self.echantillons):
+            raise ValueError(get_text("Méthode %s : nombre d'échantillons (%d) "
+                                      "incohérent (%d attendus)",
+                                      "Method %s: number of samples (%d) "
+                                      "inconsistent (%d expected)")%
+                             (nom,len(val),len(self.echantillons)))
+        return val
+
+    def add(self,nom: str,codes: Union[Sequence,Mapping],**attrs: Any) -> None:
+        for a in attrs:
+            if a not in self.__attrs:
+                raise TypeError("Unexpected attribute <%s>"%a)
+        codes=self.__parallele(nom,codes)
+        cdesp=set(sp for sp in codes if sp is not None)
+        # Dans le fichier Spart, les codes espèces sont obligatoirement des
+        # entiers >=0. Si un code ne l'est pas, tous les codes de la
+        # spartition sont renumérotés à partir de 1 dans l'ordre trié.
+        if all(isinstance(sp,int) and 0<=sp<1<<31 for sp in cdesp):
+            col=array('i',(-1 if sp is None else sp for sp in codes))
+        else:
+            on=dict(zip(sorted(cdesp),range(1,len(cdesp)+1)))
+            col=array('i',(-1 if sp is None else on[sp] for sp in codes))
+        self.__noms.append(nom)
+        self.__codes.append(col)
+        self.__nbind.append(len(codes)-col.count(-1))
+        self.__nbesp.append(len(cdesp))
+        for a,lst in self.__attrs.items():
+            val=attrs.get(a)
+            if a=="Individual_score" and val is not None:
+                val=array('d',(float("nan") if v is None else v
+                               for v in self.__parallele(nom,val)))
+            lst.append(val)
+
+    def close(self) -> None:
+        if isinstance(self.fich,str):
+            cm=open(self.fich,"w")
+        else:
+            from contextlib import nullcontext
+            cm=cast(TextIO,nullcontext(self.fich))
+        with cm as f:
+            self.__ecrit(f)
+
+    def __ecrit(self,f: TextIO) -> None:
+        noms=self.__noms
+
+        """
+        Rend la liste des valeurs de l'attribut 'attr pour toutes les
+        spartitions. Si la valeur vaut None, elle vaut None dans la liste si
+        'interog vaut False, "?" si 'interog vaut True.
+        Si None pour toutes les spartitions, rend None au lieu de la liste.
+        """
+        def getlstval(attr,interog=True):
+            lst=self.__attrs[attr]
+            nb=sum(1 for v in lst if v is None)
+            return None if nb==len(lst) \
+                   else [("?" if v is None else v) for v in lst] \
+                                                        if nb and interog \
+                   else lst
 
-    for pm in espace:
-        for pech in pm:
-            is_sample_name(get_text("Méthode %s","Method %s")%pm.nom,None,
-                           pech.nom)
-    if isinstance(fich,str):
-        cm=open(fich,"w")
-    else:
-        from contextlib import nullcontext
-        cm=cast(TextIO,nullcontext(fich))
-    with cm as f:
         f.write("begin spart;\n")
-        f.write("\n%s = %s;\n"%(Sections.Project_name.value,titre))
+        f.write("\n%s = %s;\n"%(Sections.Project_name.value,self.titre))
         f.write("\n%s = %s;\n"%(Sections.Date.value,
                                 datetime.datetime.now().
                                                 isoformat(timespec="seconds")))
 
         # N_spartitions
-        f.write("\n%s = %d: "%(Sections.N_spartitions.value,len(espace)))
+        f.write("\n%s = %d: "%(Sections.N_spartitions.value,len(noms)))
         lstsc=getlstval("score")
         if lstsc:
-            f.write(" / ".join("%s, %s"%(m.nom,str(s))
-                               for m,s in zip(espace,lstsc)))
+            f.write(" / ".join("%s, %s"%(nom,str(s))
+                               for nom,s in zip(noms,lstsc)))
         else:
-            f.write(" / ".join(m.nom for m in espace))
+            f.write(" / ".join(noms))
         f.write("\n;\n")
 
         # N_individuals
         f.write("\n%s = %s\n;\n"%(Sections.N_individuals.value,
-                              " / ".join(str(len(m)) for m in espace)))
+                              " / ".join(map(str,self.__nbind))))
 
         # N_subsets
         f.write("\n%s = "%Sections.N_subsets.value) # type: ignore
         lstsub=getlstval("Subset_score",False)
         lst=[]
-        for i,pm in enumerate(espace):
-            nb=len(pm.especes)
+        for i,nb in enumerate(self.__nbesp):
             s=str(nb)
             if lstsub:
                 lst_scores=lstsub[i]
@@ -836,40 +1019,12 @@ def Writer_spart(fich: Union[TextIO,str],titre: str,espace: Espace):
         f.write("\n;\n")
 
         # Individual_assignment
-        #
-        # Dans le fichier Spart, les codes espèces sont obligatoirement
-        # numériques. Ci-dessous, on construit un espace parallèle 'espace2
-        # comme suit, constitué de dictionnaire pEchantillon -> code espèce :
-        # - pour les méthodes dont tous les codes espèces sont numériques,
-        #   la pMethode est simplement insérée dans 'espace2.
-        # - pour les méthodes dont au moins 1 code espèce n'est pas numérique,
-        #   on construit d'abord un dictionnaire code_original -> code_numérique
-        #   ('on ci-dessous), puis on réaffecte grâce à lui le code espèce de
-        #   tous les échantillons : on construit un nouveau dictionnaire
-        #   pEchantillon -> code_espèce_numérique. C'est celui-ci qui est
-        #   inséré dans 'espace2 à la place de la pMethode.
-        espace2=[]
-        for pm in espace:
-            cdesp=set()
-            vu=False
-            for ech,sp in pm.items():
-                cdesp.add(sp)
-                if not isinstance(sp,int): vu=True
-            if vu: # Au moins 1 code espèce non numérique.
-                on=dict(zip(sorted(cdesp),range(1,len(cdesp)+1)))
-                espace2.append(dict((ech,on[sp]) for ech,sp in pm.items()))
-            else:
-                espace2.append(pm)
+        cols=self.__codes
         f.write("\n%s =\n"%Sections.Assignment.value) # type: ignore
-        for ech in espace.echantillons:
-            f.write("%s: "%ech.nom)
-            lst=[]
-            for pm,vm in zip(espace,espace2):
-                if pm.all[ech] is None:
-                    lst.append("?")
-                else:
-                    lst.append(str(vm[ech]))
-            f.write(" / ".join(lst))
+        for i,ech in enumerate(self.echantillons):
+            f.write("%s: "%ech)
+            f.write(" / ".join(("?" if c<0 else str(c))
+                               for c in (col[i] for col in cols)))
             f.write("\n")
         f.write(";\n")
 
@@ -877,18 +1032,17 @@ def Writer_spart(fich: Union[TextIO,str],titre: str,espace: Espace):
         lstsc=getlstval("Individual_score",False)
         if lstsc is not None:
             f.write("\n%s =\n"%Sections.Ind_score.value)
-            for ech in espace.echantillons:
+            for i,ech in enumerate(self.echantillons):
                 lst=[]
                 vu=False
-                for pm,scores in zip(espace,lstsc):
-                    e=pm.all[ech]
+                for scores in lstsc:
                     val="?"
-                    if e is not None and scores and e in scores:
-                        val=str(scores[e])
+                    if scores is not None and not isnan(scores[i]):
+                        val=str(scores[i])
                         vu=True
                     lst.append(val)
                 if vu:
-                    f.write("%s: "%ech.nom)
+                    f.write("%s: "%ech)
                     f.write(" / ".join(lst))
                     f.write("\n")
             f.write(";\n")
@@ -904,3 +1058,29 @@ def Writer_spart(fich: Union[TextIO,str],titre: str,espace: Espace):
                 f.write(";\n")
 
         f.write("\nend;\n")
+
+"""
+Produit le fichier 'fich au format Spart, à partir de l'ensemble des méthodes
+regroupées dans l'Espace 'espace. 'titre est le titre du fichier (section
+Project_name). 'fich peut être un objet file-like déjà ouvert.
+Génère une exception si ne peut ouvrir le fichier, ou si un échantillon a un
+nom non conforme avec la syntaxe Spart.
+"""
+def Writer_spart(fich: Union[TextIO,str],titre: str,espace: Espace):
+    # On travaille entièrement sur les pMethode du Espace, qui prend donc en
+    # compte les éventuels renommages et/ou suppressions d'échantillons, ansi
+    # que les renommages de noms de méthodes.
+    # Pour travailler entièrement sur les Methode réelles, il aurait fallu
+    # faire :
+    # espace=[m.meth for m in espace]
+    echs=espace.echantillons
+    w=Writer_spart_flux(fich,titre,[ech.nom for ech in echs])
+    for pm in espace:
+        attrs=dict((a,getattr(pm,a,None)) for a in w.attributs)
+        scores=attrs["Individual_score"]
+        if scores is not None:
+            # Individual_score est indexé par les Echantillon d'origine.
+            attrs["Individual_score"]=[scores.get(pm.all[ech]) for ech in echs]
+        w.add(pm.nom,[(None if pm.all[ech] is None else pm[ech])
+                      for ech in echs],**attrs)
+    w.close()
@@ -7,22 +7,39 @@ import collections
 import os
 import argparse
 import subprocess
+import multiprocessing
+import time
 from subprocess import call
 
 
-from nexus import NexusReader
+from nexus import NexusTreeReader
 from ptp.ptpllh import lh_ratio_test, exp_distribution, species_setting, exponential_mixture, showTree
 from summary import partitionparser
+from ptp.render import render_queue
+
+def run_ptp(job):
+    """ML search on one of many trees, module level so it can be sent to a process pool"""
+    tree, reroot, max_iters, min_br, strategy, pvalue, taxa_order = job
+    """only the search is timed, the likelihood ratio test of count_species()
+    imports scipy on the first tree of every worker"""
+    start = time.time()
+    me = exponential_mixture(tree= tree, max_iters = max_iters, min_br = min_br)
+    me.search(reroot = reroot, strategy = strategy)
+    seconds = time.time() - start
+    num_spe = me.count_species(pv = pvalue, print_log = False)
+    to, par = me.output_species(taxa_order = taxa_order)
+    return par, me.max_setting, seconds, me.strategy, num_spe, me.max_logl
+
 
 class bootstrap_ptp:
     """Run MCMC on multiple trees"""
-    def __init__(self, filename, ftype = "nexus", reroot = False, method = "H1", firstktrees = 0):
+    def __init__(self, filename, ftype = "nexus", reroot = False, method = "H1", firstktrees = 0, processes = 1, tree_burnin = 0, tree_thinning = 1):
         self.method = method
         self.firstktrees = firstktrees
+        self.processes = max(processes, 1)
         if ftype == "nexus":
-            self.nexus = NexusReader(filename)
-            self.nexus.blocks['trees'].detranslate()
-            self.trees = self.nexus.trees.trees
+            """trees are streamed from the file, only the kept ones are stored"""
+            self.trees = list(NexusTreeReader(filename, burnin = tree_burnin, thinning = tree_thinning, limit = firstktrees))
         else:
             self.trees = self.raxmlTreeParser(filename)
 
@@ -65,9 +82,12 @@ class bootstrap_ptp:
     def delimit(self, spe_rate= None, max_iters = None, min_br = None, whiten= None, strategy = None, sprint= None, pvalue= None):
         self.partitions = []
         self.settings = []
+        """one record per tree: timing, strategy that ran, species and logl"""
+        self.treelog = []
         cnt = 1
 
         if len(self.trees) == 1:
+            start = time.time()
             tree = self.trees[0]
             me = None
             if spe_rate <= 0:
@@ -79,6 +99,7 @@ class bootstrap_ptp:
                 me.whitening_search(reroot = self.reroot, strategy = strategy)
             else:
                 me.search(reroot = self.reroot, strategy = strategy)
+            seconds = time.time() - start
 
             if sprint:
                 me.count_species(pv = pvalue)
@@ -89,21 +110,40 @@ class bootstrap_ptp:
             to, par = me.output_species(taxa_order = self.taxa_order)
             self.partitions.append(par)
             self.settings.append(me.max_setting)
+            self.treelog.append((1, me.strategy, seconds, max(par), me.max_logl))
 
         else:
-            for tree in self.trees:
-                print("Running PTP on tree " + repr(cnt) + " ........")
-                cnt = cnt + 1
-                me = exponential_mixture(tree= tree, max_iters = max_iters, min_br = min_br)
-                me.search(reroot = self.reroot, strategy = strategy)
-                me.count_species(pv = pvalue, print_log = False)
-                to, par = me.output_species(taxa_order = self.taxa_order)
-                self.partitions.append(par)
-                self.settings.append(me.max_setting)
-                print("")
+            """trees are searched in a process pool, results come back in input order"""
+            jobs = [(tree, self.reroot, max_iters, min_br, strategy, pvalue, self.taxa_order) for tree in self.trees]
+            pool = None
+            if self.processes > 1 and len(jobs) > 1:
+                pool = multiprocessing.Pool(processes = min(self.processes, len(jobs)))
+                results = pool.imap(run_ptp, jobs, chunksize = 1)
+            else:
+                results = map(run_ptp, jobs)
+            try:
+                for par, setting, seconds, used_strategy, num_spe, logl in results:
+                    print("Running PTP on tree " + repr(cnt) + " ........")
+                    self.partitions.append(par)
+                    self.settings.append(setting)
+                    self.treelog.append((cnt, used_strategy, seconds, num_spe, logl))
+                    cnt = cnt + 1
+                    print("")
+            finally:
+                if pool != None:
+                    pool.close()
+                    pool.join()
         return self.partitions, self.settings
 
 
+    def write_log(self, fout):
+        """Tab separated per tree log"""
+        with open(fout, "w") as f:
+            f.write("tree\tstrategy\tseconds\tspecies\tlogl\n")
+            for tree, strategy, seconds, num_spe, logl in self.treelog:
+                f.write(repr(tree) + "\t" + strategy + "\t" + "{0:.4f}".format(seconds) + "\t" + repr(num_spe) + "\t" + repr(logl) + "\n")
+
+
     def raxmlTreeParser(self, fin):
         f = open(fin)
         lines = f.readlines()
@@ -201,8 +241,9 @@ Version 2.2 released by Jiajie Zhang on 14-02-2014.""",
                         action="store_true")
 
     parser.add_argument("-m", dest = "sstrategy",
-                        help = """Method for generate the starting partition (H0, H1, H2, H3, Brutal) (default H0)""",
-                        choices=["H0", "H1", "H2", "H3", "Brutal"],
+                        help = """Method for generate the starting partition (H0, H1, H2, H3, Brutal, Exact) (default H0).
+                        Brutal and Exact find the ML delimitation, with -sprate Brutal enumerates all delimitations""",
+                        choices=["H0", "H1", "H2", "H3", "Brutal", "Exact"],
                         default= "H0")
 
     parser.add_argument("-pvalue", dest = "pvalue",
@@ -234,7 +275,7 @@ Version 2.2 released by Jiajie Zhang on 14-02-2014.""",
                         default = -1.0)
 
     parser.add_argument("-maxiters", dest = "max_iter",
-                        help = """Set the max number of search if using Brutal search (default 20000).
+                        help = """Set the max number of search if using Brutal search with -sprate (default 20000).
                         The program will calculate how many searches are needed for Brutal search,
                         if the number of actual search is great than this value, the program will use H0 instead""",
                         type = int,
@@ -251,6 +292,28 @@ Version 2.2 released by Jiajie Zhang on 14-02-2014.""",
                         type = int,
                         default = 0)
 
+    parser.add_argument("--treeburnin", dest = "tree_burnin",
+                        help = """Number of trees to skip at the start of a nexus input file,
+                        or a proportion of the trees if below 1 (default 0)""",
+                        type = float,
+                        default = 0)
+
+    parser.add_argument("--treethin", dest = "tree_thinning",
+                        help = """Use every n-th tree of the input file after the tree burn-in (default 1)""",
+                        type = int,
+                        default = 1)
+
+    parser.add_argument("--threads",
+                        help = """Number of processes searching the input trees in parallel (default 1)""",
+                        type = int,
+                        default = 1)
+
+    parser.add_argument("--norender",
+                        help = """Do not draw the tree plots, for runs where only the spart
+                        and text files are needed (default draw them)""",
+                        default = False,
+                        action="store_true")
+
     parser.add_argument("--nmi",
                         help = """Summary mutiple partitions using max NMI, note this is very slow for large number of trees""",
                         default = False,
@@ -277,15 +340,19 @@ def print_run_info(args):
     print("  "+args.output + "_PTPhSuppPart.txt")
     print("  Tree written to:")
     print("  "+args.output + "_PTPhSuppPart.tre")
-    print("  Tree plot written to:")
-    print("  "+args.output + "_PTPhSuppPart.png")
-    print("  "+args.output + "_PTPhSuppPart.svg")
+    if not args.norender:
+        print("  Tree plot written to:")
+        print("  "+args.output + "_PTPhSuppPart.png")
+        print("  "+args.output + "_PTPhSuppPart.svg")
     if args.nmi:
         print("")
         print(" MAX NMI partition (if input contains multiple trees) written to:")
         print("  "+args.output + "_PTPhNMIPart.txt")
     print("  Spart  written to:")
     print("  "+args.output + ".PTPhSuppPart.spart")
+    print("")
+    print(" Per tree search log written to:")
+    print("  "+args.output + "_PTPTreeLog.txt")
 
 
 if __name__ == "__main__":
@@ -325,22 +392,26 @@ if __name__ == "__main__":
         else:
             inputformat = "raxml"
 
-        bsptp = bootstrap_ptp(filename = args.stree, ftype = inputformat, reroot = args.sreroot, method = args.sstrategy, firstktrees = args.num_trees)
+        bsptp = bootstrap_ptp(filename = args.stree, ftype = inputformat, reroot = args.sreroot, method = args.sstrategy, firstktrees = args.num_trees, processes = args.threads, tree_burnin = args.tree_burnin, tree_thinning = args.tree_thinning)
         print(f"printing the {args.outgroups}")
         if args.outgroups!= None and len(args.outgroups) > 0:
             print(args.outgroups)
             bsptp.remove_outgroups(args.outgroups, remove = args.delete)
 
         pars, settings = bsptp.delimit(spe_rate= args.spe_rate, max_iters = args.max_iter, min_br = args.min_brl, whiten= args.whiten, strategy = args.sstrategy, sprint= args.sprint, pvalue= args.pvalue)
+        bsptp.write_log(args.output + "_PTPTreeLog.txt")
 
         pp = partitionparser(taxa_order = bsptp.taxa_order, partitions = pars, scale = args.sscale)
-        pp.summary(fout = args.output, bnmi = args.nmi, sp_setting = settings)
+        """figures are drawn after all numeric results are written"""
+        renderer = render_queue(processes = args.threads, enabled = not args.norender)
+        pp.summary(fout = args.output, bnmi = args.nmi, sp_setting = settings, processes = args.threads, renderer = renderer)
 
         if bsptp.numtrees > 1:
             min_no_p, max_no_p, mean_no_p = pp.hpd_numpartitions()
             print("Estimated number of species is between " + repr(min_no_p) + " and " + repr(max_no_p))
             print("Mean: " + repr(mean_no_p))
 
+        renderer.run()
         print_run_info(args = args)
 
     except parser.newick.NewickError:
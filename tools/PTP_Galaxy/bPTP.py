@@ -3,15 +3,19 @@ from ete3 import Tree
 import sys
 import math
 import random
+import numpy
 import argparse
 import os
+import multiprocessing
+import collections
 
 
-from nexus import NexusReader
+from nexus import NexusTreeReader
 from summary import partitionparser
-from ptp.ptpllh import lh_ratio_test, exp_distribution, species_setting, exponential_mixture
-
-import matplotlib.pyplot as plt
+from ptp.ptpllh import lh_ratio_test, exp_distribution, delimitation_state, exponential_mixture, label_partition
+from ptp.samples import sample_sink
+from ptp.mcmcdiag import chain_diagnostics
+from ptp.render import render_queue
 
 #except ImportError:
 #print("Please install the matplotlib and other dependent package first.")
@@ -19,64 +23,133 @@ import matplotlib.pyplot as plt
 #print(" sudo apt-get install python-setuptools python-numpy python-qt4 python-scipy python-mysqldb python-lxml python-matplotlib")
 #sys.exit()
 
+class logl_cache:
+    """LRU map from the Zobrist key of a delimitation to its logl and its
+    numbers of split and merge candidates, holds at most size entries"""
+    def __init__(self, size = 100000):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry == None:
+            self.misses = self.misses + 1
+        else:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(key)
+        return entry
+
+
+    def put(self, key, entry):
+        if self.size > 0:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last = False)
+
+
+    def hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0.0
+        return float(self.hits) / float(self.hits + self.misses)
+
+
 class ptpmcmc:
     """MCMC on a single tree using PTP model"""
-    def __init__(self, tree, start_config=None, reroot=False, startmethod="H0", min_br=0.0001, seed=1234, thinning=100, sampling=10000, burning=0.1, taxa_order=[]):
+    def __init__(self, tree, start_config=None, reroot=False, startmethod="H0", min_br=0.0001, seed=1234, thinning=100, sampling=10000, burning=0.1, taxa_order=[], cache_size=100000, sample_dir=None):
         if start_config == None:
             me = exponential_mixture(tree= tree)
             me.search(strategy = startmethod, reroot = reroot)
             me.count_species(print_log = False, pv = 0.0)
-            self.tree = me.tree
-            self.current_setting = me.max_setting
-        else:
-            self.current_setting = start_config
-            self.tree = Tree(tree, format = 1)
+            start_config = me.max_setting
+        """the chain runs on the node ids of the array tree the start setting belongs to"""
+        self.tree = start_config.tree
         self.burning = burning
-        self.last_setting = self.current_setting
-        self.current_logl = self.current_setting.get_log_l()
-        self.last_logl = self.last_setting.get_log_l()
         self.min_br = min_br
+        """the chain works on one incremental state, rejected moves are reverted"""
+        self.state = delimitation_state(spe_nodes = start_config.spe_nodes, tree = self.tree, sp_rate = 0, fix_sp_rate = False, minbr = self.min_br)
+        self.move = None
+        self.pending = None
+        self.current_logl = self.state.get_log_l()
+        self.last_logl = self.current_logl
+        """states seen before are looked up, a rejected proposal to one of them never touches the state"""
+        self.cache = logl_cache(size = cache_size)
+        self.cache.put(self.state.key, (self.current_logl, len(self.state.can_split), len(self.state.can_merge)))
         self.rand_nr = random.Random()
         self.rand_nr.seed(seed)
         self.thinning = thinning
         self.sampling = sampling
         if taxa_order == []:
-            self.taxaorder = self.tree.get_leaf_names()
+            self.taxaorder = self.tree.leaf_names
         else:
             self.taxaorder = taxa_order
         self.numtaxa = len(self.taxaorder)
-        self.partitions = []
-        self.llhs = []
+        """samples are streamed to disk, settings are rebuilt later only for the plotted partitions"""
+        self.samples = sample_sink(numtaxa = self.numtaxa, taxa_order = self.taxaorder, min_br = self.min_br, directory = sample_dir)
+        self.samples.add_tree(self.tree)
         self.nsplit = 0
         self.nmerge = 0
+        self.acceptance = 0.0
         """remember the ML partition"""
         self.maxllh = self.current_logl
-        to, spe = self.current_setting.output_species(taxa_order = self.taxaorder)
+        to, spe = self.state.output_species(taxa_order = self.taxaorder)
         self.maxpar = spe
-        self.max_setting = self.current_setting
-        """record all delimitation settings for plotting, this could consume a lot of MEM"""
-        self.settings = []
+        self.max_setting = self.state.to_setting()
+
+
+    def propose(self, is_split, node):
+        """logl and numbers of split and merge candidates after the move, the
+        move is only applied here if the new state is not in the cache. The
+        state keeps exact sums and sorted candidates, so skipping the move on
+        a hit leaves the chain exactly as applying and reverting it would"""
+        self.pending = (is_split, node)
+        if is_split:
+            key = self.state.split_key(node)
+        else:
+            key = self.state.merge_key(node)
+        entry = self.cache.get(key)
+        if entry == None:
+            self.apply()
+            entry = (self.current_logl, len(self.state.can_split), len(self.state.can_merge))
+            self.cache.put(self.state.key, entry)
+        return entry
+
+
+    def apply(self):
+        """Apply the pending move, if propose() did not already"""
+        if self.move == None:
+            is_split, node = self.pending
+            if is_split:
+                self.move = self.state.split(node)
+            else:
+                self.move = self.state.merge(node)
+            self.current_logl = self.state.get_log_l()
 
 
     def split(self, chosen_anode):
+        """returns the new logl and the number of merge candidates"""
         self.nsplit = self.nsplit + 1
-        newspenodes = []
-        for node in self.current_setting.spe_nodes:
-            newspenodes.append(node)
-        newspenodes.extend(chosen_anode.get_children())
-        self.current_setting = species_setting(spe_nodes = newspenodes, root = self.tree, sp_rate = 0, fix_sp_rate = False, minbr = self.min_br)
-        self.current_logl = self.current_setting.get_log_l()
+        logl, nsplit, nmerge = self.propose(True, chosen_anode)
+        return logl, nmerge
 
 
     def merge(self, chosen_anode):
+        """returns the new logl and the number of split candidates"""
         self.nmerge = self.nmerge + 1
-        mnodes = chosen_anode.get_children()
-        newspenodes = []
-        for node in self.current_setting.spe_nodes:
-            if not node in mnodes:
-                newspenodes.append(node)
-        self.current_setting = species_setting(spe_nodes = newspenodes, root = self.tree, sp_rate = 0, fix_sp_rate = False, minbr = self.min_br)
-        self.current_logl = self.current_setting.get_log_l()
+        logl, nsplit, nmerge = self.propose(False, chosen_anode)
+        return logl, nsplit
+
+
+    def record_max(self):
+        self.maxllh = self.current_logl
+        self.max_spe_nodes = sorted(self.state.spe)
+
+
+    def sample(self, logl):
+        self.samples.add(label_partition(self.tree, self.state.get_active_nodes(), self.taxaorder), logl)
 
 
     def mcmc(self):
@@ -84,95 +157,116 @@ class ptpmcmc:
         accepted = 0
         sample_start = int(self.sampling * self.burning)
         printinterval = self.thinning * 100
+        self.max_spe_nodes = None
         while cnt < self.sampling:
             cnt = cnt + 1
             if cnt % printinterval == 0:
                 print("MCMC generation: " + repr(cnt))
-            self.last_setting = self.current_setting
             self.last_logl = self.current_logl
+            self.move = None
             acceptance = 0.0
             """proposal"""
             """First chose to split or merge"""
             rdchoice = self.rand_nr.uniform(0.0,1.0)
             if rdchoice <= 0.5:
                 """split"""
-                xinverse = self.current_setting.get_nodes_can_split()
+                xinverse = len(self.state.can_split)
                 if xinverse > 0:
                     rdidx = self.rand_nr.randint(0, xinverse-1)
-                    chosen_anode = self.current_setting.node_can_split[rdidx]
-                    self.split(chosen_anode)
-                    xpinverse = self.current_setting.get_nodes_can_merge()
+                    chosen_anode = self.state.can_split[rdidx]
+                    newlogl, xpinverse = self.split(chosen_anode)
                     if xpinverse > 0:
-                        newlogl = self.current_logl
                         oldlogl = self.last_logl
                         acceptance = math.exp(newlogl - oldlogl) * float(xinverse)/float(xpinverse)
                         if newlogl > self.maxllh:
-                            self.maxllh = newlogl
-                            to, spe = self.current_setting.output_species(taxa_order = self.taxaorder)
-                            self.maxpar = spe
-                            self.max_setting = self.current_setting
+                            self.apply()
+                            self.record_max()
             else:
                 """merge"""
-                xinverse = self.current_setting.get_nodes_can_merge()
+                xinverse = len(self.state.can_merge)
                 if xinverse > 0:
                     rdidx = self.rand_nr.randint(0, xinverse-1)
-                    chosen_anode = self.current_setting.node_can_merge[rdidx]
-                    self.merge(chosen_anode)
-                    xpinverse = self.current_setting.get_nodes_can_split()
+                    chosen_anode = self.state.can_merge[rdidx]
+                    newlogl, xpinverse = self.merge(chosen_anode)
                     if xpinverse > 0:
-                        newlogl = self.current_logl
                         oldlogl = self.last_logl
                         acceptance = math.exp(newlogl - oldlogl) * float(xinverse)/float(xpinverse)
                         if newlogl > self.maxllh:
-                            self.maxllh = newlogl
-                            to, spe = self.current_setting.output_species(taxa_order = self.taxaorder)
-                            self.maxpar = spe
-                            self.max_setting = self.current_setting
+                            self.apply()
+                            self.record_max()
 
             if acceptance > 1.0:
+                self.apply()
                 if cnt % self.thinning == 0 and cnt >= sample_start:
-                    to, spe = self.current_setting.output_species(taxa_order = self.taxaorder)
-                    self.partitions.append(spe)
-                    self.llhs.append(newlogl)
-                    self.settings.append(self.current_setting)
+                    self.sample(self.current_logl)
                 accepted = accepted + 1
             else:
                 u = self.rand_nr.uniform(0.0,1.0)
                 if (u < acceptance):
+                    self.apply()
                     if cnt % self.thinning == 0 and cnt >= sample_start:
-                        to, spe = self.current_setting.output_species(taxa_order = self.taxaorder)
-                        self.partitions.append(spe)
-                        self.llhs.append(newlogl)
-                        self.settings.append(self.current_setting)
+                        self.sample(self.current_logl)
                     accepted = accepted + 1
                 else:
-                    self.current_setting = self.last_setting
+                    if self.move != None:
+                        self.state.revert(self.move)
                     self.current_logl = self.last_logl
                     if cnt % self.thinning == 0 and cnt >= sample_start:
-                        to, spe = self.current_setting.output_species(taxa_order = self.taxaorder)
-                        self.partitions.append(spe)
-                        self.llhs.append(self.current_logl)
-                        self.settings.append(self.current_setting)
-
-        print("Accptance rate: " + repr(float(accepted)/float(cnt)))
+                        self.sample(self.current_logl)
+
+        if self.max_spe_nodes != None:
+            self.max_setting = self.state.to_setting(spe_nodes = self.max_spe_nodes)
+            to, spe = self.max_setting.output_species(taxa_order = self.taxaorder)
+            self.maxpar = spe
+        self.acceptance = float(accepted)/float(cnt)
+        print("Accptance rate: " + repr(self.acceptance))
         print("Merge: " + repr(self.nmerge))
         print("Split: " + repr(self.nsplit))
-        return self.partitions, self.llhs, self.settings
+        print("Logl cache hits: " + repr(self.cache.hits) + ", misses: " + repr(self.cache.misses) + ", hit rate: " + "{0:.3f}".format(self.cache.hit_rate()))
+        self.samples.flush()
+        return self.samples
+
+
+def chain_seed(seed, tree_idx, chain_idx):
+    """Seed of one chain, the first chain on every tree keeps the given seed
+    so single chain runs give the same samples as before"""
+    if chain_idx == 0:
+        return seed
+    return int(numpy.random.SeedSequence([seed, tree_idx, chain_idx]).generate_state(1)[0])
+
+
+def run_chain(job):
+    """Run one MCMC chain, module level so it can be sent to a process pool"""
+    tree, tree_idx, chain_idx, reroot, method, seed, thinning, sampling, burnin, taxa_order, cache_size, sample_dir = job
+    if chain_idx == 0:
+        print("Running MCMC sampling on tree " + repr(tree_idx + 1) + ":")
+    else:
+        print("Running MCMC sampling on tree " + repr(tree_idx + 1) + ", chain " + repr(chain_idx + 1) + ":")
+    mcptp = ptpmcmc(tree = tree, reroot = reroot, startmethod = method, min_br = 0.0001,
+    seed = seed, thinning = thinning, sampling = sampling, burning = burnin, taxa_order = taxa_order, cache_size = cache_size, sample_dir = sample_dir)
+    samples = mcptp.mcmc()
+    print("")
+    sys.stdout.flush()
+    return samples, mcptp.maxllh, mcptp.maxpar, mcptp.max_setting, mcptp.acceptance
 
 
 class bayesianptp:
     """Run MCMC on multiple trees"""
-    def __init__(self, filename, ftype="nexus", reroot=False, method="H1", seed=1234, thinning=100, sampling=10000, burnin=0.1, firstktrees=0, taxa_order=[]):
+    def __init__(self, filename, ftype="nexus", reroot=False, method="H1", seed=1234, thinning=100, sampling=10000, burnin=0.1, firstktrees=0, taxa_order=[], chains=1, processes=1, cache_size=100000, tree_burnin=0, tree_thinning=1, sample_dir=None):
+        """the sample files are written to sample_dir, the system temp dir if None"""
         self.method = method
+        self.sample_dir = sample_dir
         self.seed = seed
+        self.chains = max(chains, 1)
+        self.processes = max(processes, 1)
+        self.cache_size = cache_size
         self.thinning = thinning
         self.sampling = sampling
         self.burnin = burnin
         self.firstktrees = firstktrees
         if ftype == "nexus":
-            self.nexus = NexusReader(filename)
-            self.nexus.blocks['trees'].detranslate()
-            self.trees = self.nexus.trees.trees
+            """trees are streamed from the file, only the kept ones are stored"""
+            self.trees = list(NexusTreeReader(filename, burnin = tree_burnin, thinning = tree_thinning, limit = firstktrees))
         else:
             self.trees = self.raxmlTreeParser(filename)
 
@@ -223,23 +317,66 @@ class bayesianptp:
 
 
     def delimit(self):
-        self.partitions = []
-        self.llhs = []
-        self.settings = []
-        cnt = 1
-        for tree in self.trees:
-            print("Running MCMC sampling on tree " + repr(cnt) + ":")
-            cnt = cnt + 1
-            mcptp = ptpmcmc(tree = tree, reroot = self.reroot, startmethod = self.method, min_br = 0.0001,
-            seed = self.seed, thinning = self.thinning, sampling = self.sampling, burning = self.burnin, taxa_order = self.taxa_order)
-            pars, lhs, settings = mcptp.mcmc()
-            self.maxhhlpar = mcptp.maxpar
-            self.maxhhlsetting = mcptp.max_setting
-            self.partitions.extend(pars)
-            self.llhs.extend(lhs)
-            self.settings.extend(settings)
-            print("")
-        return self.partitions, self.llhs, self.settings
+        """Run self.chains chains on every tree, in a process pool if more
+        than one process is asked for. Samples are merged in tree then chain
+        order, whatever order the chains finish in"""
+        self.samples = sample_sink(numtaxa = self.numtaxa, taxa_order = self.taxa_order, directory = self.sample_dir)
+        self.diagnostics = []
+        jobs = []
+        for i in range(len(self.trees)):
+            for j in range(self.chains):
+                jobs.append((self.trees[i], i, j, self.reroot, self.method, chain_seed(self.seed, i, j),
+                self.thinning, self.sampling, self.burnin, self.taxa_order, self.cache_size, self.sample_dir))
+        results = []
+        """no sample file is left behind if a chain or the merge fails"""
+        try:
+            if self.processes > 1 and len(jobs) > 1:
+                pool = multiprocessing.Pool(processes = min(self.processes, len(jobs)))
+                try:
+                    results = pool.map(run_chain, jobs, chunksize = 1)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [run_chain(job) for job in jobs]
+
+            for i in range(len(self.trees)):
+                tree_results = results[i * self.chains:(i + 1) * self.chains]
+                best = None
+                llh_traces = []
+                spnum_traces = []
+                for samples, maxllh, maxpar, max_setting, acceptance in tree_results:
+                    llh_traces.append(samples.llhs)
+                    spnum_traces.append(numpy.asarray(samples.get_partitions().max(axis = 1)) if len(samples) > 0 else [])
+                    self.samples.extend(samples)
+                    if best == None or maxllh > best[0]:
+                        best = (maxllh, maxpar, max_setting)
+                self.maxhhlpar = best[1]
+                self.maxhhlsetting = best[2]
+                diag = chain_diagnostics(llh_traces = llh_traces,
+                                         spnum_traces = spnum_traces,
+                                         acceptance = [r[4] for r in tree_results])
+                self.diagnostics.append(diag)
+                if self.chains > 1:
+                    print("MCMC diagnostics on tree " + repr(i + 1) + ":")
+                    for line in diag.summary():
+                        print(line)
+                    print("")
+        except BaseException:
+            for r in results:
+                r[0].remove()
+            self.samples.remove()
+            raise
+        return self.samples.get_partitions(), self.samples.llhs, self.samples.get_settings()
+
+
+    def write_diagnostics(self, fout):
+        with open(fout, "w") as f:
+            for i in range(len(self.diagnostics)):
+                f.write("Tree " + repr(i + 1) + ":\n")
+                for line in self.diagnostics[i].summary():
+                    f.write(line + "\n")
+                f.write("\n")
 
 
     def raxmlTreeParser(self, fin):
@@ -329,11 +466,50 @@ Version 0.51 released by Jiajie Zhang on 17-02-2014.""",
                         type = int,
                         default = 0)
 
+    parser.add_argument("--treeburnin", dest = "tree_burnin",
+                        help = """Number of trees to skip at the start of a nexus input file,
+                        or a proportion of the trees if below 1 (default 0)""",
+                        type = float,
+                        default = 0)
+
+    parser.add_argument("--treethin", dest = "tree_thinning",
+                        help = """Use every n-th tree of the input file after the tree burn-in (default 1)""",
+                        type = int,
+                        default = 1)
+
+    parser.add_argument("--chains",
+                        help = """Number of MCMC chains run on every tree (default 1)""",
+                        type = int,
+                        default = 1)
+
+    parser.add_argument("--threads",
+                        help = """Number of processes running the chains in parallel (default 1)""",
+                        type = int,
+                        default = 1)
+
+    parser.add_argument("--cache",
+                        help = """Number of visited delimitations whose logl is kept in memory,
+                        about 200 bytes each (default 100000, 0 disables the cache)""",
+                        type = int,
+                        default = 100000)
+
     parser.add_argument("--nmi",
                         help = """Summary mutiple partitions using max NMI, this is very slow for large number of trees""",
                         default = False,
                         action="store_true")
 
+    parser.add_argument("--nmi_samples",
+                        help = """Estimate the max NMI partition by comparing every partition with this many
+                        randomly drawn samples instead of all of them (default 0, exact)""",
+                        type = int,
+                        default = 0)
+
+    parser.add_argument("--norender",
+                        help = """Do not draw the tree plots and the LLH plot, for runs where only
+                        the spart and text files are needed (default draw them)""",
+                        default = False,
+                        action="store_true")
+
     parser.add_argument("--scale",
                         help = """No. pixel per unit of branch length""",
                         default = 500,
@@ -351,6 +527,9 @@ def print_run_info(args, num_tree):
     print(" MCMC sampling interval:.........%d" % args.imcmc)
     print(" MCMC burn-in:...................{0:.2f}".format(args.burnin))
     print(" MCMC seed:......................%d" % args.seed)
+    print(" MCMC chains per tree:...........%d" % args.chains)
+    if args.tree_burnin > 0 or args.tree_thinning > 1:
+        print(" Input tree burn-in, thinning:...{0:g}, {1:d}".format(args.tree_burnin, args.tree_thinning))
     print("")
     print(" MCMC samples written to:")
     print("  "+args.output + "_PTPParts.txt")
@@ -358,9 +537,13 @@ def print_run_info(args, num_tree):
     print(" Posterial LLH written to:")
     print("  "+args.output + "_PTP_MCMCllh.txt")
     print("")
-    print(" Posterial LLH plot:")
-    print("  "+args.output + "_PTP_MCMCllh.pdf")
+    print(" MCMC convergence diagnostics written to:")
+    print("  "+args.output + "_PTP_MCMCdiag.txt")
     print("")
+    if not args.norender:
+        print(" Posterial LLH plot:")
+        print("  "+args.output + "_PTP_MCMCllh.pdf")
+        print("")
     print(" Posterial Prob. of partitions written to:")
     print("  "+args.output + "_PTPPartSum.txt")
     print("")
@@ -368,9 +551,10 @@ def print_run_info(args, num_tree):
     print("  "+args.output + "_PTPhSuppPart.txt")
     print("  Tree written to:")
     print("  "+args.output + "_PTPhSuppPart.tre")
-    print("  Tree plot written to:")
-    print("  "+args.output + "_PTPhSuppPart.png")
-    print("  "+args.output + "_PTPhSuppPart.svg")
+    if not args.norender:
+        print("  Tree plot written to:")
+        print("  "+args.output + "_PTPhSuppPart.png")
+        print("  "+args.output + "_PTPhSuppPart.svg")
     print("  Spart  written to:")
     print("  "+args.output + "_PTPhSuppPart.spart")
     if args.nmi:
@@ -383,9 +567,10 @@ def print_run_info(args, num_tree):
         print("  "+args.output + "_PTPMLPart.txt")
         print("  Tree  written to:")
         print("  "+args.output + "_PTPMLPart.tre")
-        print("  Tree plot written to:")
-        print("  "+args.output + "_PTPMLPart.png")
-        print("  "+args.output + "_PTPMLPart.svg")
+        if not args.norender:
+            print("  Tree plot written to:")
+            print("  "+args.output + "_PTPMLPart.png")
+            print("  "+args.output + "_PTPMLPart.svg")
     print("  Spart  written to:")
     print("  "+args.output + "_PTPMLPart.spart")
 
@@ -416,27 +601,44 @@ if __name__ == "__main__":
                         thinning=args.imcmc,
                         sampling=args.nmcmc,
                         burnin=args.burnin,
-                        firstktrees=args.num_trees)
+                        firstktrees=args.num_trees,
+                        tree_burnin=args.tree_burnin,
+                        tree_thinning=args.tree_thinning,
+                        chains=args.chains,
+                        processes=args.threads,
+                        cache_size=args.cache,
+                        sample_dir=os.path.dirname(os.path.abspath(args.output)))
     print(args.outgroups)
 
     if args.outgroups!= None and len(args.outgroups) > 0:
         bbptp.remove_outgroups(args.outgroups, remove=args.delete, output=args.trees + ".NoOutgroups")
 
     pars, llhs, settings = bbptp.delimit()
+    """the sample file is removed whatever happens after the sampling"""
+    try:
+        bbptp.write_diagnostics(args.output + "_PTP_MCMCdiag.txt")
+
+        pp = partitionparser(taxa_order=bbptp.taxa_order, partitions=pars, llhs=llhs, scale=args.scale)
+        """figures are drawn after all numeric results are written"""
+        renderer = render_queue(processes=args.threads, enabled=not args.norender)
+
+        if bbptp.numtrees == 1:
+            pp.summary(fout=args.output,
+                       bnmi=args.nmi,
+                       ML_par=bbptp.get_maxhhl_partition(),
+                       ml_spe_setting=bbptp.maxhhlsetting,
+                       sp_setting=settings,
+                       processes=args.threads,
+                       nmi_samples=args.nmi_samples,
+                       renderer=renderer)
+        else:
+            pp.summary(fout=args.output, bnmi=args.nmi, sp_setting=settings, processes=args.threads, nmi_samples=args.nmi_samples, renderer=renderer)
 
-    pp = partitionparser(taxa_order=bbptp.taxa_order, partitions=pars, llhs=llhs, scale=args.scale)
-
-    if bbptp.numtrees == 1:
-        pp.summary(fout=args.output,
-                   bnmi=args.nmi,
-                   ML_par=bbptp.get_maxhhl_partition(),
-                   ml_spe_setting=bbptp.maxhhlsetting,
-                   sp_setting=settings)
-    else:
-        pp.summary(fout=args.output, bnmi=args.nmi, sp_setting=settings)
-
-    min_no_p, max_no_p, mean_no_p = pp.hpd_numpartitions()
-    print("Estimated number of species is between " + repr(min_no_p) + " and " + repr(max_no_p))
-    print("Mean: " + "{0:.2f}".format(mean_no_p))
-    print("")
-    print_run_info(args, bbptp.numtrees)
+        min_no_p, max_no_p, mean_no_p = pp.hpd_numpartitions()
+        print("Estimated number of species is between " + repr(min_no_p) + " and " + repr(max_no_p))
+        print("Mean: " + "{0:.2f}".format(mean_no_p))
+        print("")
+        renderer.run()
+        print_run_info(args, bbptp.numtrees)
+    finally:
+        bbptp.samples.remove()
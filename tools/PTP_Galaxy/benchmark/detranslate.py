@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+"""Time the detranslation of large translated BEAST-style tree files, the
+one pass tokenizer of TreeHandler against the earlier regex and replace loop"""
+import sys
+import os
+import time
+import argparse
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nexus import NexusTreeReader
+from nexus.reader import TreeHandler
+
+
+def random_newick(ids, rng):
+    """random topology over the ids with BEAST rate comments on every branch"""
+    nodes = list(ids)
+    while len(nodes) > 1:
+        a = nodes.pop(rng.randrange(len(nodes)))
+        b = nodes.pop(rng.randrange(len(nodes)))
+        nodes.append("(%s:[&rate=%.6f]%.6f,%s:[&rate=%.6f]%.6f)" % (a, rng.random(), rng.random(), b, rng.random(), rng.random()))
+    return nodes[0] + ";"
+
+
+def write_trees(fname, numtaxa, numtrees, seed):
+    rng = random.Random(seed)
+    ids = [str(i) for i in range(1, numtaxa + 1)]
+    with open(fname, "w") as f:
+        f.write("#NEXUS\n\nBegin trees;\n\tTranslate\n")
+        f.write(",\n".join(["\t\t%s taxon_%s" % (i, i) for i in ids]) + "\n\t\t;\n")
+        for k in range(numtrees):
+            f.write("tree STATE_%d [&lnP=-%.3f] = [&R] %s\n" % (k * 1000, rng.random() * 1e4, random_newick(ids, rng)))
+        f.write("End;\n")
+
+
+def regex_detranslate(self, tree, translatetable):
+    """the regex based detranslation TreeHandler used before"""
+    for found in self._findall_chunks(tree):
+        if found['taxon'] in translatetable:
+            taxon = translatetable[found['taxon']]
+            if found['comment'] and found['branch']:
+                sub = "%s:%s%s" % (taxon, found['comment'], found['branch'])
+            elif found['comment']:
+                sub = "%s%s" % (taxon, found['comment'])
+            elif found['branch']:
+                sub = "%s:%s" % (taxon, found['branch'])
+            else:
+                sub = taxon
+            sub = "%s%s%s" % (found['start'], sub, found['end'])
+            tree = tree.replace(found['match'], sub)
+    return tree[tree.index("("):]
+
+
+def run(fname):
+    start = time.time()
+    trees = list(NexusTreeReader(fname))
+    return time.time() - start, trees
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the detranslation of NEXUS tree files", prog = "python detranslate.py")
+    parser.add_argument("-n", dest = "sizes", nargs = "+", type = int, default = [100, 500, 1000],
+                        help = "Number of taxa of the random trees")
+    parser.add_argument("-k", dest = "numtrees", type = int, default = 100, help = "Number of trees in every file")
+    parser.add_argument("-s", dest = "seed", type = int, default = 1234, help = "Random seed")
+    args = parser.parse_args()
+    tokenizer = TreeHandler._detranslate_tree
+    print("taxa\ttrees\tregex seconds\ttokenizer seconds\tspeedup\tsame trees")
+    for numtaxa in args.sizes:
+        fd, fname = tempfile.mkstemp(suffix = ".trees")
+        os.close(fd)
+        write_trees(fname, numtaxa, args.numtrees, args.seed)
+        TreeHandler._detranslate_tree = regex_detranslate
+        old_seconds, old_trees = run(fname)
+        TreeHandler._detranslate_tree = tokenizer
+        new_seconds, new_trees = run(fname)
+        os.unlink(fname)
+        print("%d\t%d\t%.3f\t%.3f\t%.1f\t%s" % (numtaxa, args.numtrees, old_seconds, new_seconds, old_seconds / max(new_seconds, 1e-9), old_trees == new_trees))
@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+"""Compare the exact PTP search with H0, and with the enumeration of all
+delimitations on trees small enough for it"""
+import sys
+import os
+import time
+import argparse
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ete3 import Tree
+from ptp.ptpllh import exponential_mixture
+
+
+def random_tree(numtaxa):
+    t = Tree()
+    t.populate(numtaxa, random_branches = True, branch_range = (0.0, 0.2))
+    """short branches in small subtrees, like coalescent branches inside species"""
+    for node in t.traverse():
+        if node.is_leaf() or len(node) < 4:
+            node.dist = node.dist * 0.05
+    return t.write(format = 5)
+
+
+def run(newick, strategy):
+    start = time.time()
+    me = exponential_mixture(tree = newick)
+    if strategy == "Enumerate":
+        me.Enumerate()
+    else:
+        me.search(strategy = strategy, reroot = False)
+    return time.time() - start, me.max_setting.get_log_l(), me.max_setting.count_species()[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the exact PTP search", prog = "python exact_search.py")
+    parser.add_argument("-n", dest = "sizes", nargs = "+", type = int, default = [10, 100, 500, 1000, 2000],
+                        help = "Number of taxa of the random trees")
+    parser.add_argument("-s", dest = "seed", type = int, default = 1234, help = "Random seed")
+    args = parser.parse_args()
+    """ete3 populate() draws from the random module"""
+    random.seed(args.seed)
+    print("taxa\tstrategy\tseconds\tlogl\tspecies")
+    for numtaxa in args.sizes:
+        newick = random_tree(numtaxa)
+        strategies = ["H0", "Exact"]
+        if exponential_mixture(tree = newick).comp_num_comb() <= 20000:
+            strategies.append("Enumerate")
+        for strategy in strategies:
+            seconds, logl, num_spe = run(newick, strategy)
+            print(repr(numtaxa) + "\t" + strategy + "\t" + "{0:.3f}".format(seconds) + "\t" + repr(logl) + "\t" + repr(num_spe))
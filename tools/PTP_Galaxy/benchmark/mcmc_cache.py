@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+"""Check that the bPTP logl cache never changes the chain: for every tree the
+samples and the logl trace must be byte identical for all cache sizes. Also
+reports the time and the hit rate of every cache size. Exits with status 1 if
+any run differs"""
+import sys
+import os
+import io
+import time
+import argparse
+import random
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bPTP import ptpmcmc
+from exact_search import random_tree
+
+
+def run(newick, seed, sampling, thinning, cache_size):
+    """seconds, hit rate, samples as bytes and logl trace of one chain"""
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        mcptp = ptpmcmc(tree = newick, seed = seed, thinning = thinning, sampling = sampling, burning = 0.0, cache_size = cache_size)
+        samples = mcptp.mcmc()
+    seconds = time.time() - start
+    result = (samples.get_partitions().tobytes(), repr(samples.llhs), mcptp.maxpar)
+    rate = mcptp.cache.hit_rate()
+    samples.remove()
+    return seconds, rate, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Check that the bPTP logl cache does not change the samples", prog = "python mcmc_cache.py")
+    parser.add_argument("-n", dest = "sizes", nargs = "+", type = int, default = [20, 100, 300],
+                        help = "Number of taxa of the random trees")
+    parser.add_argument("-c", dest = "caches", nargs = "+", type = int, default = [0, 5, 100000],
+                        help = "Cache sizes to compare, the first one is the reference")
+    parser.add_argument("-i", dest = "sampling", type = int, default = 20000, help = "MCMC generations")
+    parser.add_argument("-t", dest = "thinning", type = int, default = 100, help = "MCMC thinning")
+    parser.add_argument("-s", dest = "seed", type = int, default = 1234, help = "Random seed")
+    args = parser.parse_args()
+    """ete3 populate() draws from the random module"""
+    random.seed(args.seed)
+    failed = False
+    print("taxa\tcache\tseconds\thit rate\tidentical")
+    for numtaxa in args.sizes:
+        newick = random_tree(numtaxa)
+        reference = None
+        for cache_size in args.caches:
+            seconds, rate, result = run(newick, args.seed, args.sampling, args.thinning, cache_size)
+            if reference is None:
+                reference = result
+            same = result == reference
+            failed = failed or not same
+            print(repr(numtaxa) + "\t" + repr(cache_size) + "\t" + "{0:.3f}".format(seconds) + "\t" + "{0:.3f}".format(rate) + "\t" + repr(same))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,49 @@
+#! /usr/bin/env python
+"""Wall clock time of short PTP and bPTP command lines (--help and a minimal
+run without figures) and the heavyweight packages each of them imports"""
+import sys
+import os
+import time
+import argparse
+import subprocess
+import tempfile
+
+TOOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["scipy", "matplotlib", "PyQt5", "ete3.treeview"]
+
+
+def commands(outdir):
+    tree = os.path.join(TOOL_DIR, "test-data", "PTP_examplefile_tree_iTaxoTools_0_1.tre")
+    return [("PTP --help", ["PTP.py", "--help"]),
+            ("bPTP --help", ["bPTP.py", "--help"]),
+            ("PTP run", ["PTP.py", "-t", tree, "-o", os.path.join(outdir, "ptp"), "--norender"]),
+            ("bPTP run", ["bPTP.py", "-t", tree, "-o", os.path.join(outdir, "bptp"), "-s", "1234", "-i", "1000", "--norender"])]
+
+
+def run(cmd):
+    """seconds and the heavy packages imported, from python -X importtime"""
+    start = time.time()
+    p = subprocess.run([sys.executable, "-X", "importtime"] + cmd, cwd = TOOL_DIR, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, universal_newlines = True)
+    seconds = time.time() - start
+    loaded = set()
+    for line in p.stderr.splitlines():
+        if line.startswith("import time:"):
+            module = line.split("|")[-1].strip()
+            if module in HEAVY:
+                loaded.add(module)
+    return seconds, [m for m in HEAVY if m in loaded]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the startup time of PTP and bPTP", prog = "python startup.py")
+    parser.add_argument("-r", dest = "repeats", type = int, default = 5, help = "Runs of every command, the median is reported")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix = "ptp_startup_") as outdir:
+        print("command\tseconds\theavy imports")
+        for name, cmd in commands(outdir):
+            times = []
+            for i in range(args.repeats):
+                seconds, loaded = run(cmd)
+                times.append(seconds)
+            times.sort()
+            print(name + "\t" + "{0:.3f}".format(times[len(times) // 2]) + "\t" + ",".join(loaded))
@@ -21,6 +21,7 @@ WHITESPACE_PATTERN = re.compile(r"""\s+""")
 QUOTED_PATTERN = re.compile(r"""^["'](.*)["']$""")
 MESQUITE_TITLE_PATTERN = re.compile(r"""^TITLE\s+(.*);$""", re.IGNORECASE)
 MESQUITE_LINK_PATTERN = re.compile(r"""^LINK\s+(.*?)\s+=\s+(.*);$""", re.IGNORECASE)
+LABEL_END = frozenset(':);\t\n\r ')
 
 
 class NexusFormatException(Exception):
@@ -265,6 +266,11 @@ class TreeHandler(GenericHandler):
         Takes a `tree` and expands the short format tree with translated
         taxa labels from `translatetable` into a full format tree.
         
+        The tree is rewritten in one pass: [comments] are copied as they
+        are and every label following a `(` or `,` is looked up in the
+        table, so a label is never replaced inside a comment or a longer
+        label.
+        
         :param tree: String containing newick tree
         :type tree: String
         
@@ -273,27 +279,47 @@ class TreeHandler(GenericHandler):
         
         :return: String of detranslated tree
         """
-        for found in self._findall_chunks(tree):
-            if found['taxon'] in translatetable:
-                taxon = translatetable[found['taxon']]
-                if found['comment'] and found['branch']:
-                    # comment and branch
-                    sub = "%s:%s%s" % (taxon, found['comment'], found['branch'])
-                elif found['comment']:
-                    # comment only
-                    sub = "%s%s" % (taxon, found['comment'])
-                elif found['branch']:
-                    # branch only
-                    sub = "%s:%s" % (taxon, found['branch'])
-                else: 
-                    # taxon only
-                    sub = taxon
-                sub = "%s%s%s" % (found['start'], sub, found['end'])
-                if found['match'] not in tree:
-                    raise ValueError("Expected match for %s not in tree" % found['match'])
-                tree = tree.replace(found['match'], sub)
-            
-        return tree[tree.index("("):]
+        tree = tree[tree.index("("):]
+        out = []
+        index = 0
+        while index < len(tree):
+            comment = tree.find('[', index)
+            if comment == -1:
+                comment = len(tree)
+            out.append(self._detranslate_chunk(tree[index:comment], translatetable))
+            if comment == len(tree):
+                break
+            end = tree.find(']', comment)
+            if end == -1:
+                raise NexusFormatException("Unclosed comment in tree %s" % tree[comment:comment + 50])
+            out.append(tree[comment:end + 1])
+            index = end + 1
+        return "".join(out)
+    
+    def _detranslate_chunk(self, chunk, translatetable):
+        """
+        Detranslates a piece of tree without comments. Labels follow a `(`
+        or `,`, so the text before the first of them is left as it is (it
+        is the start of the tree or follows a comment).
+        """
+        pieces = chunk.split(',')
+        for i, piece in enumerate(pieces):
+            tokens = piece.split('(')
+            for j in range(0 if i > 0 else 1, len(tokens)):
+                tokens[j] = self._detranslate_label(tokens[j], translatetable)
+            pieces[i] = '('.join(tokens)
+        return ','.join(pieces)
+    
+    def _detranslate_label(self, token, translatetable):
+        """Replaces the label at the start of `token` (up to :, ), ; or a space)"""
+        start = len(token) - len(token.lstrip())
+        end = start
+        while end < len(token) and token[end] not in LABEL_END:
+            end += 1
+        taxon = translatetable.get(token[start:end])
+        if taxon is None:
+            return token
+        return token[:start] + taxon + token[end:]
         
     def write(self):
         """
@@ -718,5 +744,131 @@ class NexusReader(object):
     
 
 
+class NexusTreeReader(object):
+    """
+    Streams the trees of a nexus file, one detranslated tree at a time.
+
+    Unlike NexusReader, the file is never held in memory: the translate
+    table is read once and every tree is detranslated as it is read.
+
+    :param filename: filename of a nexus file (can be gzipped)
+    :type filename: string
+
+    :param burnin: trees to skip at the start, a number of trees or a
+        fraction of all trees if below 1
+    :type burnin: int or float
+
+    :param thinning: keep every `thinning`-th tree after the burn-in
+    :type thinning: int
+
+    :param limit: stop after this many trees (0 for all)
+    :type limit: int
+
+    >>> for tree in NexusTreeReader('posterior.trees', burnin=0.1, thinning=10): #doctest: +SKIP
+    """
+    TREE_PATTERN = re.compile(r"""^u?tree\s""", re.IGNORECASE)
+    TRANSLATE_PATTERN = re.compile(r"""^translate\b""", re.IGNORECASE)
+
+    def __init__(self, filename, burnin=0, thinning=1, limit=0):
+        if os.path.isfile(filename) == False:
+            raise IOError("Unable To Read File %s" % filename)
+        self.filename = filename
+        self.burnin = burnin
+        self.thinning = max(int(thinning), 1)
+        self.limit = limit
+        self.translators = {}
+        self._handler = TreeHandler()
+
+    def _open(self):
+        if self.filename.endswith('.gz'):
+            import gzip
+            return gzip.open(self.filename, 'rt')
+        return open(self.filename, 'r')
+
+    def _add_translation(self, chunk):
+        """Adds the `id taxon` pairs of a piece of the translate table"""
+        for entry in chunk.split(','):
+            entry = entry.strip().rstrip(';').strip()
+            if len(entry) == 0:
+                continue
+            if len(entry.split(None, 1)) != 2:
+                raise NexusFormatException("Malformed translate entry %s" % entry)
+            taxon_id, taxon = entry.split(None, 1)
+            taxon = taxon.strip().strip("'\"")
+            if taxon_id in self.translators:
+                raise NexusFormatException("Duplicate Taxa ID %s in translate block" % taxon_id)
+            self.translators[taxon_id] = taxon
+
+    def _raw_trees(self):
+        """Yields the tree statements of the trees block, untranslated"""
+        block = None
+        in_translation = False
+        tree = None
+        handle = self._open()
+        try:
+            for line in handle:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                if tree is None and line.startswith('[') and line.endswith(']'):
+                    continue
+                found = BEGIN_PATTERN.findall(line)
+                if found:
+                    block = found[0].lower()
+                    continue
+                if END_PATTERN.match(line):
+                    block = None
+                    continue
+                if block != 'trees':
+                    continue
+                if tree is not None:
+                    tree = tree + line
+                elif in_translation:
+                    self._add_translation(line)
+                    in_translation = not line.endswith(';')
+                    continue
+                elif self.TRANSLATE_PATTERN.match(line):
+                    self.translators = {}
+                    self._add_translation(line[len('translate'):])
+                    in_translation = not line.endswith(';')
+                    continue
+                elif self.TREE_PATTERN.match(line):
+                    tree = line
+                else:
+                    continue
+                if tree.endswith(';'):
+                    yield tree
+                    tree = None
+        finally:
+            handle.close()
+
+    def count(self):
+        """Number of trees in the file, before burn-in and thinning"""
+        ntrees = 0
+        for tree in self._raw_trees():
+            ntrees += 1
+        return ntrees
+
+    def detranslate(self, tree):
+        """Newick string of a tree statement with the taxa ids translated"""
+        if len(self.translators) > 0:
+            return self._handler._detranslate_tree(tree, self.translators)
+        return tree[tree.index("("):]
+
+    def __iter__(self):
+        skip = self.burnin
+        if 0 < skip < 1:
+            skip = self.count() * skip
+        skip = int(skip)
+        kept = 0
+        for i, tree in enumerate(self._raw_trees()):
+            if i < skip or (i - skip) % self.thinning != 0:
+                continue
+            yield self.detranslate(tree)
+            kept += 1
+            if self.limit > 0 and kept >= self.limit:
+                break
+
+
 if __name__ == '__main__':
     pass
@@ -4,7 +4,7 @@ import re
 import warnings
 import unittest
 from copy import deepcopy
-from nexus import NexusReader
+from nexus import NexusReader, NexusTreeReader
 from nexus.reader import GenericHandler, DataHandler, TreeHandler
 
 EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), '../examples')
@@ -622,5 +622,88 @@ class Test_TreeHandler__detranslate_tree(unittest.TestCase):
         assert trans == newtree, "Unable to correctly detranslate a BEAST tree"
 
 
+    def test_no_change_in_comments(self):
+        translatetable = {'1': 'Chris', '2': 'Bruce', '3': 'Tom'}
+        oldtree = "((1:[&range={2,3}]0.1,2:0.2):[&range={1,3}]0.3,3:0.4);"
+        newtree = "((Chris:[&range={2,3}]0.1,Bruce:0.2):[&range={1,3}]0.3,Tom:0.4);"
+        trans = TreeHandler()._detranslate_tree(oldtree, translatetable)
+        assert trans == newtree, "Unable to leave comments untranslated"
+
+    def test_no_change_of_longer_ids(self):
+        translatetable = {'1': 'Chris', '11': 'Bruce', '111': 'Tom'}
+        oldtree = "((111:0.1,11:0.2):0.3,1:0.4);"
+        newtree = "((Tom:0.1,Bruce:0.2):0.3,Chris:0.4);"
+        trans = TreeHandler()._detranslate_tree(oldtree, translatetable)
+        assert trans == newtree, "Unable to tell apart ids sharing a prefix"
+
+    def test_change_with_spaces(self):
+        translatetable = {'0': 'Chris', '1': 'Bruce', '2': 'Tom'}
+        oldtree = "tree a = (( 0 :0.1, 1:0.2):0.3,\n2);"
+        newtree = "(( Chris :0.1, Bruce:0.2):0.3,\nTom);"
+        trans = TreeHandler()._detranslate_tree(oldtree, translatetable)
+        assert trans == newtree, "Unable to detranslate a tree with spaces"
+
+
+
+class Test_NexusTreeReader(unittest.TestCase):
+    """Test the streaming tree reader"""
+    def test_untranslated(self):
+        trees = list(NexusTreeReader(os.path.join(EXAMPLE_DIR, 'example.trees')))
+        assert len(trees) == 3
+        assert trees[0].startswith('(((((((Chris:0.0668822155,Bruce:0.0173144449)')
+        assert trees[2].endswith(';')
+
+    def test_translated(self):
+        reader = NexusTreeReader(os.path.join(EXAMPLE_DIR, 'example-translated.trees'))
+        trees = list(reader)
+        assert len(reader.translators) == 13
+        assert reader.translators['0'] == 'Tom'
+        assert trees == list(NexusTreeReader(os.path.join(EXAMPLE_DIR, 'example.trees')))
+
+    def test_BEAST_format(self):
+        reader = NexusTreeReader(os.path.join(EXAMPLE_DIR, 'example-beast.trees'))
+        trees = list(reader)
+        assert len(trees) == 1
+        assert len(reader.translators) == 38
+        assert trees[0].startswith('((((T20:[&rate=9.363171791537587E-5]1320.9341043566992')
+
+    def test_count(self):
+        reader = NexusTreeReader(os.path.join(EXAMPLE_DIR, 'example.trees'))
+        assert reader.count() == 3
+
+    def test_burnin(self):
+        fname = os.path.join(EXAMPLE_DIR, 'example.trees')
+        trees = list(NexusTreeReader(fname))
+        assert list(NexusTreeReader(fname, burnin=2)) == trees[2:]
+        assert list(NexusTreeReader(fname, burnin=0.5)) == trees[1:]
+        assert list(NexusTreeReader(fname, burnin=5)) == []
+
+    def test_thinning(self):
+        fname = os.path.join(EXAMPLE_DIR, 'example.trees')
+        trees = list(NexusTreeReader(fname))
+        assert list(NexusTreeReader(fname, thinning=2)) == trees[::2]
+        assert list(NexusTreeReader(fname, burnin=1, thinning=2)) == trees[1::2]
+
+    def test_limit(self):
+        fname = os.path.join(EXAMPLE_DIR, 'example.trees')
+        trees = list(NexusTreeReader(fname))
+        assert list(NexusTreeReader(fname, limit=2)) == trees[:2]
+
+    def test_read_gzip_file(self):
+        import gzip
+        from tempfile import NamedTemporaryFile
+        tmp = NamedTemporaryFile(delete=False, suffix=".gz")
+        tmp.close()
+        fname = os.path.join(EXAMPLE_DIR, 'example-translated.trees')
+        with open(fname, 'rb') as f_in:
+            with gzip.open(tmp.name, 'wb') as f_out:
+                f_out.writelines(f_in)
+        assert list(NexusTreeReader(tmp.name)) == list(NexusTreeReader(fname))
+        os.unlink(tmp.name)
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, NexusTreeReader, 'does-not-exist.trees')
+
+
 if __name__ == '__main__':
     unittest.main()
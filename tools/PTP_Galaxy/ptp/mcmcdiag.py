@@ -0,0 +1,73 @@
+import math
+import numpy
+
+
+def ess(trace):
+    """Effective sample size of one chain, autocorrelations are summed over
+    the initial positive sequence (Geyer 1992)"""
+    x = numpy.asarray(trace, dtype = numpy.float64)
+    n = len(x)
+    if n < 4:
+        return float(n)
+    x = x - x.mean()
+    var = numpy.dot(x, x) / n
+    if var <= 0.0:
+        return float(n)
+    """autocorrelation of all lags at once through the FFT"""
+    f = numpy.fft.rfft(x, 2 * n)
+    acf = numpy.fft.irfft(f * numpy.conjugate(f))[:n] / (n * var)
+    tau = -1.0
+    for k in range(0, n - 1, 2):
+        pair = acf[k] + acf[k + 1]
+        if pair <= 0.0:
+            break
+        tau = tau + 2.0 * pair
+    return float(n) / max(tau, 1.0 / n)
+
+
+def psrf(traces):
+    """Potential scale reduction factor (R-hat) of Gelman and Rubin on split
+    chains, so a single chain is checked against its own halves"""
+    halves = []
+    for trace in traces:
+        x = numpy.asarray(trace, dtype = numpy.float64)
+        h = len(x) // 2
+        if h < 2:
+            continue
+        halves.append(x[:h])
+        halves.append(x[len(x) - h:])
+    if len(halves) < 2:
+        return float("nan")
+    n = min(len(x) for x in halves)
+    chains = numpy.array([x[:n] for x in halves])
+    w = chains.var(axis = 1, ddof = 1).mean()
+    b = n * chains.mean(axis = 1).var(ddof = 1)
+    if w <= 0.0:
+        if b <= 0.0:
+            return 1.0
+        return float("inf")
+    var_hat = (n - 1.0) / n * w + b / n
+    return math.sqrt(var_hat / w)
+
+
+class chain_diagnostics:
+    """Convergence summary of the MCMC chains run on one tree"""
+    def __init__(self, llh_traces, spnum_traces, acceptance):
+        self.llh_traces = llh_traces
+        self.spnum_traces = spnum_traces
+        self.acceptance = acceptance
+        self.llh_psrf = psrf(llh_traces)
+        self.spnum_psrf = psrf(spnum_traces)
+        self.llh_ess = sum([ess(trace) for trace in llh_traces])
+        self.spnum_ess = sum([ess(trace) for trace in spnum_traces])
+
+
+    def summary(self):
+        lines = []
+        lines.append(" Chains:.........................%d" % len(self.acceptance))
+        lines.append(" Acceptance rate per chain:......" + ", ".join(["{0:.4f}".format(a) for a in self.acceptance]))
+        lines.append(" PSRF LLH:.......................{0:.4f}".format(self.llh_psrf))
+        lines.append(" PSRF number of species:.........{0:.4f}".format(self.spnum_psrf))
+        lines.append(" ESS LLH:........................{0:.1f}".format(self.llh_ess))
+        lines.append(" ESS number of species:..........{0:.1f}".format(self.spnum_ess))
+        return lines
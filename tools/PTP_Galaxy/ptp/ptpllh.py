@@ -1,11 +1,13 @@
 import math
 import random
 import sys
+import bisect
 
-from scipy import stats
+import numpy
 
-from ete3 import Tree, NodeStyle, TreeStyle, TextFace
-from ete3.treeview.main import  _FaceAreas
+from ete3 import Tree
+
+from ptp.ptree import ptree
 #except ImportError:
 #print("Please install the matplotlib and other dependent package first.")
 #print("If your OS is ubuntu or has apt installed, you can try the following:") 
@@ -15,6 +17,7 @@ from ete3.treeview.main import  _FaceAreas
 
 class lh_ratio_test:
     def __init__(self, null_llh, llh, df):
+        from scipy import stats
         self.lr = 2.0 * (llh - null_llh)
         self.p = 1 - stats.chi2.cdf(self.lr, df)
     
@@ -100,32 +103,102 @@ class exp_distribution:
         fout.close()
 
 
+def exp_sum_log_l(numbr, sumbr, rate = -1):
+    """Log-likelihood of numbr branches summing to sumbr under an exponential
+    distribution, same value as exp_distribution(data, rate).sum_log_l() but
+    computed from the count and the sum only"""
+    if numbr == 0:
+        return 0.0
+    if rate < 0:
+        if sumbr == 0:
+            return float("-inf")
+        rate = float(numbr) / sumbr
+    if rate == 0:
+        return float("-inf")
+    return numbr * math.log(rate) - rate * sumbr
+
+
+def label_partition(tree, active_nodes, taxa_order):
+    """Species label (1 based, in the order of active_nodes) of every taxon in taxa_order"""
+    taxa_pos = tree.taxa_positions(taxa_order)
+    partition = numpy.zeros(len(taxa_order), dtype = numpy.int64)
+    cnt = 1
+    for node in active_nodes:
+        partition[taxa_pos[tree.leaf_start[node]:tree.leaf_end[node]]] = cnt
+        cnt = cnt + 1
+    return partition
+
+
+def partition_setting(tree, partition, taxa_order, minbr = 0.0001):
+    """Inverse of label_partition: rebuild the species_setting of a partition,
+    species are the largest subtrees whose taxa all carry the same label"""
+    labels = numpy.asarray(partition)[tree.taxa_positions(taxa_order)]
+    spe_nodes = []
+    stack = [0]
+    while len(stack) > 0:
+        node = stack.pop()
+        spe_nodes.append(node)
+        span = labels[tree.leaf_start[node]:tree.leaf_end[node]]
+        if span.min() != span.max():
+            stack.extend(reversed(tree.children[node]))
+    setting = species_setting(spe_nodes = spe_nodes, tree = tree, minbr = minbr)
+    setting.get_log_l()
+    return setting
+
+
+class indexed_set:
+    """Set with random access by index, the items are kept sorted so the
+    index of an item only depends on the content of the set and not on the
+    order of the add and discard calls"""
+    def __init__(self):
+        self.items = []
+        self.members = set()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.members
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, idx):
+        return self.items[idx]
+
+    def add(self, item):
+        if item not in self.members:
+            self.members.add(item)
+            bisect.insort(self.items, item)
+
+    def discard(self, item):
+        if item in self.members:
+            self.members.remove(item)
+            del self.items[bisect.bisect_left(self.items, item)]
+
+
 class species_setting:
-    """Store one delimitation"""
-    def __init__(self, spe_nodes, root, sp_rate = 0, fix_sp_rate = False, minbr = 0.0001):
+    """Store one delimitation, spe_nodes are node ids of tree (a ptree)"""
+    def __init__(self, spe_nodes, tree, sp_rate = 0, fix_sp_rate = False, minbr = 0.0001):
         self.min_brl = minbr
         self.spe_rate = sp_rate
         self.fix_spe_rate = fix_sp_rate
         self.spe_nodes = spe_nodes
-        self.root = root
-        self.all_nodes = root.get_descendants()
-        self.all_nodes.append(self.root)
-        self.coa_nodes = []
+        self.tree = tree
         self.logl = 0
         self.spe_list = []
-        for node in self.all_nodes:
-            if not (node in self.spe_nodes):
-                self.coa_nodes.append(node) 
+        self.supports = None
+        spe_set = set(self.spe_nodes)
         
         self.active_nodes = []
         for node in self.spe_nodes:
-            if node.is_leaf():
+            childs = tree.children[node]
+            if len(childs) == 0:
                 self.active_nodes.append(node)
             else:
-                childs = node.get_children()
                 flag = False
                 for child in childs:
-                    if not (child in self.spe_nodes):
+                    if not (child in spe_set):
                         flag = True
                         break
                 if flag:
@@ -137,7 +210,7 @@ class species_setting:
     def get_nodes_can_split(self):
         if self.node_can_split == []:
             for node in self.active_nodes:
-                if not node.is_leaf():
+                if not self.tree.is_leaf(node):
                     self.node_can_split.append(node)
             return len(self.node_can_split)
         else:
@@ -146,10 +219,11 @@ class species_setting:
     
     def get_nodes_can_merge(self):
         if self.node_can_merge == []:
+            active_set = set(self.active_nodes)
             for node in self.spe_nodes:
-                children = node.get_children()
+                children = self.tree.children[node]
                 if len(children) >= 2:
-                    if (children[0] in self.active_nodes) and (children[1] in self.active_nodes):
+                    if (children[0] in active_set) and (children[1] in active_set):
                         self.node_can_merge.append(node)
             return len(self.node_can_merge)
         else:
@@ -160,15 +234,11 @@ class species_setting:
         if self.logl != 0:
             return self.logl
         else:
-            spe_br = []
-            coa_br = []
-            for node in self.spe_nodes:
-                if node.dist > self.min_brl:
-                    spe_br.append(node.dist)
-            
-            for node in self.coa_nodes:
-                if node.dist > self.min_brl:
-                    coa_br.append(node.dist)
+            is_spe = numpy.zeros(self.tree.num_nodes, dtype = bool)
+            is_spe[self.spe_nodes] = True
+            counted = self.tree.dist > self.min_brl
+            spe_br = self.tree.dist[is_spe & counted].tolist()
+            coa_br = self.tree.dist[~is_spe & counted].tolist()
                     
             self.e1 = exp_distribution(coa_br)
             self.e2 = None
@@ -178,7 +248,8 @@ class species_setting:
                 self.e2 = exp_distribution(spe_br)
             self.rate1 = self.e1.rate
             self.rate2 = self.e2.rate
-            logl = self.e1.sum_log_l() + self.e2.sum_log_l()
+            """fsum is exact, so the same delimitation always gets the same logl"""
+            logl = exp_sum_log_l(len(coa_br), math.fsum(coa_br)) + exp_sum_log_l(len(spe_br), math.fsum(spe_br), rate = self.e2.rate)
             self.logl = logl
             return logl
     
@@ -188,42 +259,34 @@ class species_setting:
             return len(self.spe_list), self.spe_list
         else:
             for node in self.active_nodes:
-                one_spe = []
-                if node.is_leaf():
-                    one_spe.append(node.name)
-                else:
-                    one_spe.extend(node.get_leaf_names())
-                self.spe_list.append(one_spe)
+                self.spe_list.append(self.tree.get_leaf_names(node))
             return len(self.spe_list), self.spe_list
     
     
     def output_species(self, taxa_order = []):
         """taxa_order is a list of taxa names, the paritions will be output as the same order"""
         if len(taxa_order) == 0:
-            taxa_order = self.root.get_leaf_names()
-        
-        self.count_species()
+            taxa_order = self.tree.leaf_names
         
-        num_taxa = 0
-        for sp in self.spe_list:
-            for leaf in sp:
-                num_taxa = num_taxa + 1
-        if not len(taxa_order) == num_taxa:
+        if not len(taxa_order) == self.tree.num_leaves:
+            self.count_species()
             print("#taxa_order != num_taxa!")
-            print(repr(num_taxa) + "    " + repr(len(taxa_order)))
+            print(repr(self.tree.num_leaves) + "    " + repr(len(taxa_order)))
             for sp in self.spe_list:
                 print(sp)
             sys.exit()
             return None, None
         else: 
-            partion = [-1] * num_taxa
-            cnt = 1
-            for sp in self.spe_list:
-                for leaf in sp:
-                    idx = taxa_order.index(leaf)
-                    partion[idx] = cnt
-                cnt = cnt + 1
-            return taxa_order, partion
+            return taxa_order, label_partition(self.tree, self.active_nodes, taxa_order).tolist()
+
+
+    def get_ete_tree(self):
+        """ete3 copy of the tree for rendering and newick output, carries the
+        bs feature if add_bayesain_support() was called"""
+        if self.supports is None:
+            return self.tree.to_ete3()
+        else:
+            return self.tree.to_ete3(features = {"bs": self.supports})
 
 
     def whiten_species(self):
@@ -244,6 +307,214 @@ class species_setting:
             return new_spe_list
 
 
+class delimitation_state:
+    """Incremental delimitation used by the searches and the MCMC, keeps the
+    running sums and counts of speciation and coalescent branch lengths so a
+    split or merge updates the log-likelihood in O(children).
+    Nodes are the integer ids of tree (a ptree)"""
+    def __init__(self, spe_nodes, tree, sp_rate = 0, fix_sp_rate = False, minbr = 0.0001):
+        self.min_brl = minbr
+        self.spe_rate = sp_rate
+        self.fix_spe_rate = fix_sp_rate
+        self.tree = tree
+        self.children = tree.children
+        self.up = tree.up
+        self.brl = tree.brl
+        """speciation nodes, a dict is used as an insertion ordered set"""
+        self.spe = dict.fromkeys(spe_nodes)
+        """branch lengths as integers over a common power of two denominator,
+        the running sums are exact and do not depend on the order of the moves"""
+        ratios = [dist.as_integer_ratio() for dist in self.brl]
+        self.den = max([den for num, den in ratios])
+        self.ibrl = [num * (self.den // den) for num, den in ratios]
+        self.spe_sum = 0
+        self.spe_num = 0
+        self.coa_sum = 0
+        self.coa_num = 0
+        for node in range(tree.num_nodes):
+            if self.brl[node] > self.min_brl:
+                if node in self.spe:
+                    self.spe_sum = self.spe_sum + self.ibrl[node]
+                    self.spe_num = self.spe_num + 1
+                else:
+                    self.coa_sum = self.coa_sum + self.ibrl[node]
+                    self.coa_num = self.coa_num + 1
+        self.logl = None
+        """Zobrist key of the speciation nodes, updated with every node added or removed"""
+        self.zobrist = tree.zobrist_keys()
+        self.key = 0
+        for node in self.spe:
+            self.key = self.key ^ self.zobrist[node]
+        self.can_split = indexed_set()
+        self.can_merge = indexed_set()
+        for node in self.spe:
+            self._refresh(node)
+    
+    
+    def _is_active(self, node):
+        if not node in self.spe:
+            return False
+        children = self.children[node]
+        if not children:
+            return True
+        for child in children:
+            if not child in self.spe:
+                return True
+        return False
+    
+    
+    def _refresh(self, node):
+        """Update the split / merge candidacy of one node"""
+        if node == -1:
+            return
+        children = self.children[node]
+        if children and self._is_active(node):
+            self.can_split.add(node)
+        else:
+            self.can_split.discard(node)
+        if node in self.spe and len(children) >= 2 and self._is_active(children[0]) and self._is_active(children[1]):
+            self.can_merge.add(node)
+        else:
+            self.can_merge.discard(node)
+    
+    
+    def _refresh_around(self, node):
+        """A change of node only affects itself, its parent and its grandparent"""
+        self._refresh(node)
+        parent = self.up[node]
+        if parent != -1:
+            self._refresh(parent)
+            self._refresh(self.up[parent])
+    
+    
+    def add_node(self, node):
+        if node in self.spe:
+            return
+        self.spe[node] = None
+        self.key = self.key ^ self.zobrist[node]
+        if self.brl[node] > self.min_brl:
+            dist = self.ibrl[node]
+            self.spe_sum = self.spe_sum + dist
+            self.spe_num = self.spe_num + 1
+            self.coa_sum = self.coa_sum - dist
+            self.coa_num = self.coa_num - 1
+        self.logl = None
+        self._refresh_around(node)
+    
+    
+    def remove_node(self, node):
+        if not node in self.spe:
+            return
+        del self.spe[node]
+        self.key = self.key ^ self.zobrist[node]
+        if self.brl[node] > self.min_brl:
+            dist = self.ibrl[node]
+            self.spe_sum = self.spe_sum - dist
+            self.spe_num = self.spe_num - 1
+            self.coa_sum = self.coa_sum + dist
+            self.coa_num = self.coa_num + 1
+        self.logl = None
+        self._refresh_around(node)
+    
+    
+    def split(self, node):
+        """Add the children of node to the speciation nodes, returns the move for revert()"""
+        saved = (self.spe_sum, self.spe_num, self.coa_sum, self.coa_num, self.logl)
+        added = [child for child in self.children[node] if not child in self.spe]
+        for child in added:
+            self.add_node(child)
+        return (True, added, saved)
+    
+    
+    def merge(self, node):
+        """Remove the children of node from the speciation nodes, returns the move for revert()"""
+        saved = (self.spe_sum, self.spe_num, self.coa_sum, self.coa_num, self.logl)
+        removed = [child for child in self.children[node] if child in self.spe]
+        for child in removed:
+            self.remove_node(child)
+        return (False, removed, saved)
+    
+    
+    def split_key(self, node):
+        """Key of the state split(node) would lead to, without changing anything"""
+        key = self.key
+        for child in self.children[node]:
+            if not child in self.spe:
+                key = key ^ self.zobrist[child]
+        return key
+    
+    
+    def merge_key(self, node):
+        """Key of the state merge(node) would lead to, without changing anything"""
+        key = self.key
+        for child in self.children[node]:
+            if child in self.spe:
+                key = key ^ self.zobrist[child]
+        return key
+    
+    
+    def revert(self, move):
+        """Undo a split or merge, the sums are restored exactly"""
+        added, nodes, saved = move
+        if added:
+            for node in reversed(nodes):
+                self.remove_node(node)
+        else:
+            for node in nodes:
+                self.add_node(node)
+        self.spe_sum, self.spe_num, self.coa_sum, self.coa_num, self.logl = saved
+    
+    
+    def _log_l(self, spe_num, spe_sum, coa_num, coa_sum):
+        """the sums are integers over self.den, the division rounds correctly"""
+        spe_sum = spe_sum / self.den
+        coa_sum = coa_sum / self.den
+        if self.fix_spe_rate:
+            return exp_sum_log_l(coa_num, coa_sum) + exp_sum_log_l(spe_num, spe_sum, rate = self.spe_rate)
+        else:
+            return exp_sum_log_l(coa_num, coa_sum) + exp_sum_log_l(spe_num, spe_sum)
+    
+    
+    def get_log_l(self):
+        if self.logl is None:
+            self.logl = self._log_l(self.spe_num, self.spe_sum, self.coa_num, self.coa_sum)
+        return self.logl
+    
+    
+    def split_log_l(self, node):
+        """Log-likelihood after splitting node, without changing the state"""
+        dsum = 0
+        dnum = 0
+        for child in self.children[node]:
+            if self.brl[child] > self.min_brl and not child in self.spe:
+                dsum = dsum + self.ibrl[child]
+                dnum = dnum + 1
+        return self._log_l(self.spe_num + dnum, self.spe_sum + dsum, self.coa_num - dnum, self.coa_sum - dsum)
+    
+    
+    def get_active_nodes(self):
+        """in node order, so species are numbered the same whatever moves led to the state"""
+        active = []
+        for node in sorted(self.spe):
+            if (not self.children[node]) or (node in self.can_split):
+                active.append(node)
+        return active
+    
+    
+    def output_species(self, taxa_order):
+        """Partition of taxa_order, species are numbered in the order of the active nodes"""
+        return taxa_order, label_partition(self.tree, self.get_active_nodes(), taxa_order).tolist()
+    
+    
+    def to_setting(self, spe_nodes = None):
+        """Materialize a species_setting, optionally with spe_nodes in a given order"""
+        if spe_nodes is None:
+            spe_nodes = list(self.spe)
+        setting = species_setting(spe_nodes = spe_nodes, tree = self.tree, sp_rate = self.spe_rate, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
+        setting.get_log_l()
+        return setting
+
+
 class exponential_mixture:
     """ML search PTP, to use: __init__(), search() and count_species()"""
     def __init__(self, tree, sp_rate = 0, fix_sp_rate = False, max_iters = 20000, min_br = 0.0001):
@@ -251,6 +522,7 @@ class exponential_mixture:
         self.tree = Tree(tree, format = 1)
         self.tree.resolve_polytomy(recursive=True)
         self.tree.dist = 0.0
+        self.ptree = ptree(self.tree)
         self.fix_spe_rate = fix_sp_rate
         self.fix_spe = sp_rate
         self.max_logl = float("-inf") 
@@ -261,16 +533,16 @@ class exponential_mixture:
         self.counter = 0
         self.setting_set = set([])
         self.max_num_search = max_iters
+        """strategy that actually ran, Brutal falls back to H0 on large trees"""
+        self.strategy = None
 
 
     def null_model(self):
-        coa_br = []
-        all_nodes = self.tree.get_descendants()
-        for node in all_nodes:
-            if node.dist > self.min_brl:
-                coa_br.append(node.dist)
-        e1 = exp_distribution(coa_br)
-        self.null_logl = e1.sum_log_l()
+        """all branches except the root are coalescent"""
+        dists = self.ptree.dist[1:]
+        coa_br = dists[dists > self.min_brl]
+        e1 = exp_distribution(coa_br.tolist())
+        self.null_logl = exp_sum_log_l(len(coa_br), math.fsum(coa_br))
         return e1.rate
 
 
@@ -285,42 +557,88 @@ class exponential_mixture:
         rootnode = node_list[0]
         self.tree.set_outgroup(rootnode)
         self.tree.dist = 0.0
+        self.ptree = ptree(self.tree)
 
 
     def comp_num_comb(self):
-        for node in self.tree.traverse(strategy='postorder'):
-            if node.is_leaf():
-                node.add_feature("cnt", 1.0)
-            else:
+        """children come after their parent in preorder, so reversed preorder is a postorder"""
+        cnt = [1.0] * self.ptree.num_nodes
+        for node in range(self.ptree.num_nodes - 1, -1, -1):
+            children = self.ptree.children[node]
+            if len(children) > 0:
                 acum = 1.0
-                for child in node.get_children():
-                    acum = acum * child.cnt
+                for child in children:
+                    acum = acum * cnt[child]
                 acum = acum + 1.0
-                node.add_feature("cnt", acum)
-        return self.tree.cnt
+                cnt[node] = acum
+        return cnt[0]
+
+
+    def new_state(self, spe_nodes):
+        return delimitation_state(spe_nodes = spe_nodes, tree = self.ptree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
+
+
+    def first_nodes(self):
+        first_node_list = []
+        first_node_list.append(0)
+        first_childs = self.ptree.get_children(0)
+        for child in first_childs:
+            first_node_list.append(child)
+        return first_node_list
 
 
-    def next(self, sp_setting):
-        self.setting_set.add(frozenset(sp_setting.spe_nodes))
-        logl = sp_setting.get_log_l()
+    def keep_max(self, setting):
+        """Keep the best setting across heuristics, the logl is recomputed from
+        scratch so identical delimitations found by different heuristics tie"""
+        if setting.get_log_l() > self.max_logl:
+            self.max_logl = setting.get_log_l()
+            self.max_setting = setting
+
+
+    def best_split(self, state, candidates, order):
+        """Best split among candidates, ties go to the node that comes first
+        in the speciation node list (order maps node to its list position)"""
+        best_logl = float("-inf")
+        best_node = None
+        for node in candidates:
+            logl = state.split_log_l(node)
+            if logl > best_logl or (logl == best_logl and best_node is not None and order[node] < order[best_node]):
+                best_logl = logl
+                best_node = node
+        return best_node, best_logl
+
+
+    def batches_to_nodes(self, batches):
+        """New speciation nodes are put in front of the list, so the list is the batches in reverse"""
+        nodes = []
+        for batch in reversed(batches):
+            nodes.extend(batch)
+        return nodes
+
+
+    def push_batch(self, batches, order, batch):
+        depth = len(batches)
+        for i in range(len(batch)):
+            order[batch[i]] = (-depth, i)
+        batches.append(batch)
+
+
+    def next(self, state, batches, order):
+        self.setting_set.add(frozenset(state.spe))
+        logl = state.get_log_l()
         if logl > self.max_logl:
             self.max_logl = logl
-            self.max_setting = sp_setting
-        for node in sp_setting.active_nodes:
-            if node.is_leaf():
+            self.max_setting = state.to_setting(spe_nodes = self.batches_to_nodes(batches))
+        candidates = sorted(state.can_split, key = order.get)
+        for node in candidates:
+            move = state.split(node)
+            if frozenset(state.spe) in self.setting_set:
                 pass
             else:
-                childs = node.get_children()
-                sp_nodes = []
-                for child in childs:
-                    sp_nodes.append(child)
-                for nod in sp_setting.spe_nodes:
-                    sp_nodes.append(nod)
-                new_sp_setting = species_setting(spe_nodes = sp_nodes, root = sp_setting.root, sp_rate = sp_setting.spe_rate, fix_sp_rate = sp_setting.fix_spe_rate, minbr = self.min_brl)
-                if frozenset(sp_nodes) in self.setting_set:
-                    pass
-                else:
-                    self.next(new_sp_setting)
+                self.push_batch(batches, order, self.ptree.get_children(node))
+                self.next(state, batches, order)
+                batches.pop()
+            state.revert(move)
 
 
     def H0(self, reroot = True):
@@ -334,56 +652,43 @@ class exponential_mixture:
             self.re_rooting()
             
         #self.init_tree()
-        sorted_node_list = self.tree.get_descendants()
-        sorted_node_list.sort(key=self.__compare_node)
+        sorted_node_list = self.ptree.get_descendants()
+        sorted_node_list.sort(key=self.ptree.brl.__getitem__)
         sorted_node_list.reverse()
         
-        first_node_list = []
-        first_node_list.append(self.tree)
-        first_childs = self.tree.get_children()
-        for child in first_childs:
-            first_node_list.append(child)
-        first_setting = species_setting(spe_nodes = first_node_list, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-        last_setting = first_setting
-        max_logl = last_setting.get_log_l()
-        max_setting = last_setting
+        first_node_list = self.first_nodes()
+        state = self.new_state(first_node_list)
+        max_logl = state.get_log_l()
+        """speciation nodes are only added, so the max setting is a prefix of added"""
+        added = []
+        max_added = 0
         
         for node in sorted_node_list:
-            if node not in last_setting.spe_nodes:
-                curr_sp_nodes = []
-                for nod in last_setting.spe_nodes:
-                    curr_sp_nodes.append(nod)
-                
-                chosen_branching_node = node.up #find the father of this new node
-                if chosen_branching_node in last_setting.spe_nodes:
-                    for nod in chosen_branching_node.get_children():
-                        if nod not in curr_sp_nodes:
-                            curr_sp_nodes.append(nod)
-                else:
-                    for nod in chosen_branching_node.get_children():
-                        if nod not in curr_sp_nodes:
-                            curr_sp_nodes.append(nod)
-                    while not chosen_branching_node.is_root():
-                        chosen_branching_node = chosen_branching_node.up
-                        for nod in chosen_branching_node.get_children():
-                            if nod not in curr_sp_nodes:
-                                curr_sp_nodes.append(nod)
-                        if chosen_branching_node in last_setting.spe_nodes:
+            if node not in state.spe:
+                chosen_branching_node = self.ptree.up[node] #find the father of this new node
+                for nod in self.ptree.children[chosen_branching_node]:
+                    if nod not in state.spe:
+                        state.add_node(nod)
+                        added.append(nod)
+                if chosen_branching_node not in state.spe:
+                    while not chosen_branching_node == 0:
+                        chosen_branching_node = self.ptree.up[chosen_branching_node]
+                        for nod in self.ptree.children[chosen_branching_node]:
+                            if nod not in state.spe:
+                                state.add_node(nod)
+                                added.append(nod)
+                        if chosen_branching_node in state.spe:
                             break
-                new_setting = species_setting(spe_nodes = curr_sp_nodes, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-                new_logl = new_setting.get_log_l()
+                new_logl = state.get_log_l()
                 if new_logl> max_logl:
                     max_logl = new_logl
-                    max_setting = new_setting 
-                last_setting = new_setting
+                    max_added = len(added)
                 
             else:
                 """node already is a speciation node, do nothing"""
                 pass
         
-        if max_logl > self.max_logl:
-            self.max_logl = max_logl
-            self.max_setting = max_setting
+        self.keep_max(state.to_setting(spe_nodes = first_node_list + added[:max_added]))
 
 
     def H2(self, reroot = True):
@@ -392,169 +697,265 @@ class exponential_mixture:
             self.re_rooting()
             
         #self.init_tree()
-        sorted_node_list = self.tree.get_descendants()
-        sorted_node_list.sort(key=self.__compare_node)
-        sorted_node_list.reverse()
+        state = self.new_state(self.first_nodes())
+        batches = []
+        order = {}
+        self.push_batch(batches, order, self.first_nodes())
+        max_logl = state.get_log_l()
+        max_batches = 1
         
-        first_node_list = []
-        first_node_list.append(self.tree)
-        first_childs = self.tree.get_children()
-        for child in first_childs:
-            first_node_list.append(child)
-        first_setting = species_setting(spe_nodes = first_node_list, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-        last_setting = first_setting
-        max_logl = last_setting.get_log_l()
-        max_setting = last_setting
-        contin_flag = True 
-        
-        
-        while contin_flag:
-            curr_max_logl = float("-inf") 
-            curr_max_setting = None
-            contin_flag = False
-            for node in last_setting.active_nodes:
-                if node.is_leaf():
-                    pass
-                else:
-                    contin_flag = True 
-                    childs = node.get_children()
-                    sp_nodes = []
-                    for child in childs:
-                        sp_nodes.append(child)
-                    for nod in last_setting.spe_nodes:
-                        sp_nodes.append(nod)
-                    new_sp_setting = species_setting(spe_nodes = sp_nodes, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-                    logl = new_sp_setting.get_log_l()
-                    if logl > curr_max_logl:
-                        curr_max_logl = logl
-                        curr_max_setting = new_sp_setting
+        while len(state.can_split) > 0:
+            curr_max_node, curr_max_logl = self.best_split(state, state.can_split, order)
+            if curr_max_node is None:
+                break
             
+            state.split(curr_max_node)
+            self.push_batch(batches, order, self.ptree.get_children(curr_max_node))
             if curr_max_logl > max_logl:
-                max_setting = curr_max_setting
+                max_batches = len(batches)
                 max_logl = curr_max_logl
             
-            last_setting = curr_max_setting
-            
-        if max_logl > self.max_logl:
-            self.max_logl = max_logl
-            self.max_setting = max_setting
+        self.keep_max(state.to_setting(spe_nodes = self.batches_to_nodes(batches[:max_batches])))
 
 
     def H3(self, reroot = True):
         if reroot:
             self.re_rooting()
-        sorted_node_list = self.tree.get_descendants()
-        sorted_node_list.sort(key=self.__compare_node)
+        sorted_node_list = self.ptree.get_descendants()
+        sorted_node_list.sort(key=self.ptree.brl.__getitem__)
         sorted_node_list.reverse()
         sorted_br = []
         for node in sorted_node_list:
-            sorted_br.append(node.dist)
+            sorted_br.append(self.ptree.brl[node])
+        """suffix sums are accumulated from the short end, an all zero tail stays exactly zero"""
+        suffix_br = [0.0] * (len(sorted_br) + 1)
+        for i in range(len(sorted_br) - 1, -1, -1):
+            suffix_br[i] = suffix_br[i + 1] + sorted_br[i]
         maxlogl = float("-inf") 
         maxidx = -1
+        sum_l1 = 0.0
         for i in range(len(sorted_node_list))[1:]:
-            l1 = sorted_br[0:i]
-            l2 = sorted_br[i:]
-            e1 = exp_distribution(l1)
-            e2 = exp_distribution(l2)
-            logl = e1.sum_log_l() + e2.sum_log_l()
+            sum_l1 = sum_l1 + sorted_br[i - 1]
+            logl = exp_sum_log_l(i, sum_l1) + exp_sum_log_l(len(sorted_br) - i, suffix_br[i])
             if logl > maxlogl:
                 maxidx = i
                 maxlogl = logl
         
-        target_nodes = sorted_node_list[0:maxidx]
+        target_nodes = set(sorted_node_list[0:maxidx])
         
-        first_node_list = []
-        first_node_list.append(self.tree)
-        first_childs = self.tree.get_children()
-        for child in first_childs:
-            first_node_list.append(child)
-        first_setting = species_setting(spe_nodes = first_node_list, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-        last_setting = first_setting
-        max_logl = last_setting.get_log_l()
-        max_setting = last_setting
+        state = self.new_state(self.first_nodes())
+        batches = []
+        order = {}
+        self.push_batch(batches, order, self.first_nodes())
+        max_logl = state.get_log_l()
+        max_batches = 1
         contin_flag = True 
         target_node_cnt = 0
         while contin_flag:
-            curr_max_logl = float("-inf") 
-            curr_max_setting = None
-            contin_flag = False
-            unchanged_flag = True
-            for node in last_setting.active_nodes:
-                if node.is_leaf():
-                    pass
-                else:
-                    contin_flag = True 
-                    childs = node.get_children()
-                    sp_nodes = []
-                    flag = False
-                    for child in childs:
-                        if child in target_nodes:
-                            flag = True
-                            #target_nodes.remove(child)
-                    if flag:
-                        unchanged_flag = False
-                        for child in childs:
-                            sp_nodes.append(child)
-                        for nod in last_setting.spe_nodes:
-                            sp_nodes.append(nod)
-                        new_sp_setting = species_setting(spe_nodes = sp_nodes, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-                        logl = new_sp_setting.get_log_l()
-                        if logl > curr_max_logl:
-                            curr_max_logl = logl
-                            curr_max_setting = new_sp_setting
+            contin_flag = len(state.can_split) > 0
+            targets = []
+            for node in state.can_split:
+                for child in self.ptree.children[node]:
+                    if child in target_nodes:
+                        targets.append(node)
+                        break
+            unchanged_flag = len(targets) == 0
             if not unchanged_flag:
                 target_node_cnt = target_node_cnt + 1
+                curr_max_node, curr_max_logl = self.best_split(state, targets, order)
+                if curr_max_node is None:
+                    break
+                state.split(curr_max_node)
+                self.push_batch(batches, order, self.ptree.get_children(curr_max_node))
                 if curr_max_logl > max_logl:
-                    max_setting = curr_max_setting
+                    max_batches = len(batches)
                     max_logl = curr_max_logl
-                last_setting = curr_max_setting
             
             if len(target_nodes) == target_node_cnt:
                 contin_flag = False
-            if contin_flag and unchanged_flag and last_setting!= None:
-                for node in last_setting.active_nodes:
-                    if node.is_leaf():
-                        pass
-                    else:
-                        childs = node.get_children()
-                        sp_nodes = []
-                        for child in childs:
-                            sp_nodes.append(child)
-                        for nod in last_setting.spe_nodes:
-                            sp_nodes.append(nod)
-                        new_sp_setting = species_setting(spe_nodes = sp_nodes, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-                        logl = new_sp_setting.get_log_l()
-                        if logl > curr_max_logl:
-                            curr_max_logl = logl
-                            curr_max_setting = new_sp_setting
+            if contin_flag and unchanged_flag:
+                curr_max_node, curr_max_logl = self.best_split(state, state.can_split, order)
+                if curr_max_node is None:
+                    break
+                state.split(curr_max_node)
+                self.push_batch(batches, order, self.ptree.get_children(curr_max_node))
                 if curr_max_logl > max_logl:
-                    max_setting = curr_max_setting
+                    max_batches = len(batches)
                     max_logl = curr_max_logl
-                last_setting = curr_max_setting
                 
-        if max_logl > self.max_logl:
-            self.max_logl = max_logl
-            self.max_setting = max_setting
+        self.keep_max(state.to_setting(spe_nodes = self.batches_to_nodes(batches[:max_batches])))
 
 
     def Brutal(self, reroot = False):
+        """Global ML delimitation. With a free speciation rate this is the exact
+        search, the enumeration of all delimitations is only needed for a fixed
+        speciation rate"""
+        if not self.fix_spe_rate:
+            self.strategy = "Exact"
+            self.Exact(reroot)
+            """species are numbered as the enumeration numbered them"""
+            self.max_setting = species_setting(spe_nodes = self.enumeration_order(self.max_setting.spe_nodes), tree = self.ptree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
+            self.max_setting.get_log_l()
+        else:
+            self.Enumerate(reroot)
+
+
+    def enumeration_order(self, spe_nodes):
+        """spe_nodes in the order Enumerate lists them when it first reaches
+        this delimitation: its first branch always splits the first splittable
+        node of the list that the delimitation splits, and puts the children in
+        front of the list"""
+        spe = set(spe_nodes)
+        batches = []
+        order = {}
+        self.push_batch(batches, order, self.first_nodes())
+        stack = [[batches[0], 0]]
+        while len(stack) > 0:
+            top = stack[-1]
+            if top[1] == len(top[0]):
+                stack.pop()
+                continue
+            node = top[0][top[1]]
+            top[1] = top[1] + 1
+            children = self.ptree.get_children(node)
+            if node != 0 and len(children) > 0 and children[0] in spe:
+                self.push_batch(batches, order, children)
+                stack.append([children, 0])
+        return self.batches_to_nodes(batches)
+
+
+    def Enumerate(self, reroot = False):
+        """Visit every delimitation, falls back to H0 above max_iters of them"""
         if reroot:
             self.re_rooting()
-        first_node_list = []
-        first_node_list.append(self.tree)
-        first_childs = self.tree.get_children()
-        for child in first_childs:
-            first_node_list.append(child)
+        first_node_list = self.first_nodes()
         num_s = self.comp_num_comb()
         if num_s > self.max_num_search:
             print("Too many search iterations: " + repr(num_s) + ", using H0 instead!!!")
+            self.strategy = "H0"
             self.H0(reroot = False)
         else:
-            first_setting = species_setting(spe_nodes = first_node_list, root = self.tree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl)
-            self.next(first_setting)
+            state = self.new_state(first_node_list)
+            batches = []
+            order = {}
+            self.push_batch(batches, order, first_node_list)
+            self.next(state, batches, order)
+
+
+    def _conv(self, a, b, pick):
+        """Best sum of a[i] + b[j] for every i + j, pick is numpy.minimum or numpy.maximum"""
+        if len(a) < len(b):
+            a, b = b, a
+        fill = numpy.inf if pick is numpy.minimum else -numpy.inf
+        res = numpy.full(len(a) + len(b) - 1, fill)
+        for j in range(len(b)):
+            if numpy.isfinite(b[j]):
+                res[j:j + len(a)] = pick(res[j:j + len(a)], a + b[j])
+        return res
+
+
+    def _subtree_sums(self):
+        """For every node in the speciation set and every number k of counted
+        speciation branches in its subtree, the smallest and the largest sum of
+        those branches over all ways to delimit the subtree"""
+        tree = self.ptree
+        counted = [1 if d > self.min_brl else 0 for d in tree.brl]
+        weight = [d if c else 0.0 for d, c in zip(tree.brl, counted)]
+        mins = [None] * tree.num_nodes
+        maxs = [None] * tree.num_nodes
+        for node in range(tree.num_nodes - 1, -1, -1):
+            children = tree.children[node]
+            c = counted[node]
+            if len(children) == 0:
+                mn = numpy.full(c + 1, numpy.inf)
+                mx = numpy.full(c + 1, -numpy.inf)
+                mn[c] = weight[node]
+                mx[c] = weight[node]
+            else:
+                cmn = mins[children[0]]
+                cmx = maxs[children[0]]
+                for child in children[1:]:
+                    cmn = self._conv(cmn, mins[child], numpy.minimum)
+                    cmx = self._conv(cmx, maxs[child], numpy.maximum)
+                """node expanded: its branch plus the children below"""
+                mn = numpy.full(len(cmn) + c, numpy.inf)
+                mx = numpy.full(len(cmx) + c, -numpy.inf)
+                mn[c:] = cmn + weight[node]
+                mx[c:] = cmx + weight[node]
+                """node is a species, the root is always expanded"""
+                if node != 0:
+                    mn[c] = min(mn[c], weight[node])
+                    mx[c] = max(mx[c], weight[node])
+            mins[node] = mn
+            maxs[node] = mx
+        return mins, maxs, counted, weight
+
+
+    def _rebuild(self, sums, pick, counted, weight, k, target):
+        """Speciation nodes of a delimitation with k counted speciation
+        branches summing to target, following the sums of _subtree_sums"""
+        tree = self.ptree
+        spe_nodes = []
+        stack = [(0, k, target)]
+        while len(stack) > 0:
+            node, k, target = stack.pop()
+            spe_nodes.append(node)
+            children = tree.children[node]
+            c = counted[node]
+            if node != 0 and (len(children) == 0 or (k == c and weight[node] == target)):
+                continue
+            """unfold the convolution of the children one child at a time"""
+            folds = [sums[children[0]]]
+            for child in children[1:]:
+                folds.append(self._conv(folds[-1], sums[child], pick))
+            rest = k - c
+            value = folds[-1][rest]
+            parts = []
+            for i in range(len(children) - 1, 0, -1):
+                child_sums = sums[children[i]]
+                prev = folds[i - 1]
+                for j in range(len(child_sums)):
+                    if 0 <= rest - j < len(prev) and prev[rest - j] + child_sums[j] == value:
+                        parts.append((children[i], j, child_sums[j]))
+                        rest = rest - j
+                        value = prev[rest]
+                        break
+            parts.append((children[0], rest, value))
+            stack.extend(parts)
+        return spe_nodes
+
+
+    def Exact(self, reroot = False):
+        """Exact ML search for a free speciation rate. For a fixed number k of
+        counted speciation branches the logl is convex in their sum s, so the
+        optimum uses the smallest or the largest s reachable with k branches.
+        Those are found for all k by one pass over the tree, O(n^2)"""
+        if reroot:
+            self.re_rooting()
+        if self.fix_spe_rate:
+            self.Enumerate(reroot = False)
+            return
+        mins, maxs, counted, weight = self._subtree_sums()
+        total_num = sum(counted)
+        total_sum = math.fsum(weight)
+        candidates = []
+        for sums, pick in ((mins, numpy.minimum), (maxs, numpy.maximum)):
+            for k in range(len(sums[0])):
+                s = sums[0][k]
+                if numpy.isfinite(s):
+                    logl = exp_sum_log_l(k, s) + exp_sum_log_l(total_num - k, total_sum - s)
+                    candidates.append((logl, k, s, sums, pick))
+        best = max([cand[0] for cand in candidates])
+        """candidates within rounding of the best are rebuilt and compared exactly"""
+        for logl, k, s, sums, pick in sorted(candidates, key = lambda cand: -cand[0]):
+            if logl < best - 1e-9 * max(1.0, abs(best)):
+                break
+            spe_nodes = self._rebuild(sums, pick, counted, weight, k, s)
+            self.keep_max(species_setting(spe_nodes = spe_nodes, tree = self.ptree, sp_rate = self.fix_spe, fix_sp_rate = self.fix_spe_rate, minbr = self.min_brl))
 
 
     def search(self, strategy = "H1", reroot = False):
+        self.strategy = strategy
         if strategy == "H1":
             self.H1(reroot)
         elif strategy == "H2":
@@ -563,7 +964,10 @@ class exponential_mixture:
             self.H3(reroot)
         elif strategy == "Brutal":
             self.Brutal(reroot)
+        elif strategy == "Exact":
+            self.Exact(reroot)
         else:
+            self.strategy = "H0"
             self.H0(reroot)
 
 
@@ -586,7 +990,7 @@ class exponential_mixture:
             return num_sp
         else:
             self.species_list = []
-            self.species_list.append(self.tree.get_leaf_names()) 
+            self.species_list.append(list(self.ptree.leaf_names))
             return 1
 
 
@@ -595,6 +999,7 @@ class exponential_mixture:
         num_sp, self.species_list = self.max_setting.count_species()
         spekeep = self.max_setting.whiten_species()
         self.tree.prune(spekeep)
+        self.ptree = ptree(self.tree)
         self.max_logl = float("-inf") 
         self.max_setting = None
         self.null_logl = 0.0
@@ -617,7 +1022,7 @@ class exponential_mixture:
     def output_species(self, taxa_order = []):
         """taxa_order is a list of taxa names, the paritions will be output as the same order"""
         if len(taxa_order) == 0:
-            taxa_order = self.tree.get_leaf_names()
+            taxa_order = self.ptree.leaf_names
         
         num_taxa = 0
         for sp in self.species_list:
@@ -627,11 +1032,12 @@ class exponential_mixture:
             print("error error, taxa_order != num_taxa!")
             return None, None
         else: 
+            taxa_idx = dict((taxa, i) for i, taxa in enumerate(taxa_order))
             partion = [-1] * num_taxa
             cnt = 1
             for sp in self.species_list:
                 for leaf in sp:
-                    idx = taxa_order.index(leaf)
+                    idx = taxa_idx[leaf]
                     partion[idx] = cnt
                 cnt = cnt + 1
             return taxa_order, partion
@@ -639,7 +1045,10 @@ class exponential_mixture:
 
 def showTree(delimitation, scale = 500, render = False, fout = "", form = "svg", show_support = False):
     """delimitation: species_setting class"""
-    tree = delimitation.root
+    """the treeview (Qt) is only loaded when a tree is drawn"""
+    from ete3 import NodeStyle, TreeStyle, TextFace
+    from ete3.treeview.main import  _FaceAreas
+    tree, ete_nodes = delimitation.get_ete_tree()
     style0 = NodeStyle()
     style0["fgcolor"] = "#000000"
     style0["vt_line_color"] = "#0000aa"
@@ -681,14 +1090,15 @@ def showTree(delimitation, scale = 500, render = False, fout = "", form = "svg",
     style2["hz_line_type"] = 0
     style2["size"] = 0
     
-    for node in delimitation.active_nodes:
+    for node_id in delimitation.active_nodes:
+        node = ete_nodes[node_id]
         node.set_style(style1)
         node.img_style["size"] = 0
         for des in node.get_descendants():
             des.set_style(style2)
             des.img_style["size"] = 0
     
-    for node in delimitation.root.traverse(strategy='preorder'):
+    for node in tree.traverse(strategy='preorder'):
         if show_support and hasattr(node, "bs"):
             if node.bs == 0.0:
                 node.add_face(TextFace("0", fsize = 8), column=0, position = "branch-top")
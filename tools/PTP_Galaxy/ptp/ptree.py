@@ -0,0 +1,149 @@
+import random
+
+import numpy
+
+from ete3 import Tree
+
+
+class ptree:
+    """Compact tree used by the PTP search and the MCMC, built once from a
+    parsed ete3 tree. Nodes are integer ids in preorder, node 0 is the root,
+    the leaves below node i are leaf_names[leaf_start[i]:leaf_end[i]]"""
+    def __init__(self, tree):
+        nodes = list(tree.traverse(strategy = "preorder"))
+        node_id = dict((node, i) for i, node in enumerate(nodes))
+        num_nodes = len(nodes)
+        self.num_nodes = num_nodes
+        self.parent = numpy.full(num_nodes, -1, dtype = numpy.int32)
+        self.first_child = numpy.full(num_nodes, -1, dtype = numpy.int32)
+        self.next_sibling = numpy.full(num_nodes, -1, dtype = numpy.int32)
+        self.child_count = numpy.zeros(num_nodes, dtype = numpy.int32)
+        self.dist = numpy.zeros(num_nodes, dtype = numpy.float64)
+        self.support = numpy.zeros(num_nodes, dtype = numpy.float64)
+        self.leaf_start = numpy.zeros(num_nodes, dtype = numpy.int32)
+        self.leaf_end = numpy.zeros(num_nodes, dtype = numpy.int32)
+        self.names = []
+        self.leaf_names = []
+        for i in range(num_nodes):
+            node = nodes[i]
+            self.dist[i] = node.dist
+            self.support[i] = node.support
+            self.names.append(node.name)
+            if node.up is not None:
+                self.parent[i] = node_id[node.up]
+            children = node.children
+            self.child_count[i] = len(children)
+            if len(children) > 0:
+                self.first_child[i] = node_id[children[0]]
+                for j in range(len(children) - 1):
+                    self.next_sibling[node_id[children[j]]] = node_id[children[j + 1]]
+            else:
+                self.leaf_start[i] = len(self.leaf_names)
+                self.leaf_names.append(node.name)
+        """leaves of a subtree are contiguous in preorder"""
+        for i in range(num_nodes - 1, -1, -1):
+            if self.child_count[i] == 0:
+                self.leaf_end[i] = self.leaf_start[i] + 1
+            else:
+                last = self.first_child[i]
+                while self.next_sibling[last] != -1:
+                    last = self.next_sibling[last]
+                self.leaf_start[i] = self.leaf_start[self.first_child[i]]
+                self.leaf_end[i] = self.leaf_end[last]
+        self.num_leaves = len(self.leaf_names)
+        self._build_lists()
+
+
+    def _build_lists(self):
+        """Python list views of the arrays, element access on lists is much
+        cheaper than on numpy arrays in the per-move code"""
+        self.up = self.parent.tolist()
+        self.brl = self.dist.tolist()
+        first_child = self.first_child.tolist()
+        next_sibling = self.next_sibling.tolist()
+        self.children = []
+        for i in range(self.num_nodes):
+            childs = []
+            child = first_child[i]
+            while child != -1:
+                childs.append(child)
+                child = next_sibling[child]
+            self.children.append(tuple(childs))
+        self._taxa_order = None
+        self._taxa_pos = None
+        self._zobrist = None
+
+
+    def __getstate__(self):
+        """Only the arrays are pickled, the list views are rebuilt on load"""
+        state = self.__dict__.copy()
+        for key in ("up", "brl", "children", "_taxa_order", "_taxa_pos", "_zobrist"):
+            del state[key]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_lists()
+
+
+    def is_leaf(self, node):
+        return len(self.children[node]) == 0
+
+
+    def get_children(self, node):
+        return list(self.children[node])
+
+
+    def get_leaf_names(self, node = 0):
+        return self.leaf_names[self.leaf_start[node]:self.leaf_end[node]]
+
+
+    def get_descendants(self):
+        """Node ids in the same (levelorder) order as ete3 get_descendants()"""
+        descendants = []
+        queue = [0]
+        idx = 0
+        while idx < len(queue):
+            node = queue[idx]
+            idx = idx + 1
+            for child in self.children[node]:
+                descendants.append(child)
+                queue.append(child)
+        return descendants
+
+
+    def taxa_positions(self, taxa_order):
+        """Position in taxa_order of every leaf, in preorder leaf order"""
+        if self._taxa_order is not taxa_order:
+            taxa_idx = dict((taxa, i) for i, taxa in enumerate(taxa_order))
+            self._taxa_pos = numpy.array([taxa_idx[name] for name in self.leaf_names], dtype = numpy.int64)
+            self._taxa_order = taxa_order
+        return self._taxa_pos
+
+
+    def zobrist_keys(self):
+        """A random 64 bit key per node, the XOR of the keys of a set of nodes
+        identifies the set. Same keys for the same tree size, every run"""
+        if self._zobrist is None:
+            rand_nr = random.Random(self.num_nodes)
+            self._zobrist = [rand_nr.getrandbits(64) for i in range(self.num_nodes)]
+        return self._zobrist
+
+
+    def to_ete3(self, features = {}):
+        """Rebuild an ete3 tree, for rendering and newick output only.
+        features: name -> per node id values, added to the ete3 nodes"""
+        nodes = []
+        for i in range(self.num_nodes):
+            if self.up[i] == -1:
+                node = Tree()
+            else:
+                node = nodes[self.up[i]].add_child()
+            node.name = self.names[i]
+            node.dist = self.brl[i]
+            node.support = float(self.support[i])
+            for key in features:
+                node.add_feature(key, features[key][i])
+            nodes.append(node)
+        return nodes[0], nodes
@@ -0,0 +1,65 @@
+import multiprocessing
+
+from ptp.ptpllh import showTree
+
+
+def render_job(job):
+    """Draw one queued figure, module level so it can be sent to a process pool"""
+    kind, args = job
+    if kind == "tree":
+        delimitation, scale, fout, form, show_support = args
+        showTree(delimitation = delimitation, scale = scale, render = True, fout = fout, form = form, show_support = show_support)
+    elif kind == "llh":
+        llhs, fout = args
+        """matplotlib is only loaded when a plot is drawn"""
+        import matplotlib
+        matplotlib.use('agg')
+        import matplotlib.pyplot as plt
+        plt.figure()
+        plt.plot(llhs)
+        plt.ylabel('Log likelihood')
+        plt.xlabel('MCMC iterations after thinning')
+        plt.savefig(fout, bbox_inches = "tight")
+        plt.close()
+    return fout
+
+
+class render_queue:
+    """Figures are queued while the numeric results are written and drawn
+    together by run() in a pool of worker processes, so the ete3/Qt work
+    never runs in the main process. A disabled queue drops every job"""
+    def __init__(self, processes = 1, enabled = True):
+        self.processes = max(processes, 1)
+        self.enabled = enabled
+        self.jobs = []
+
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+    def add_tree(self, delimitation, fout, scale = 500, forms = ["svg", "png"], show_support = True):
+        """delimitation: species_setting, one file fout.form per format"""
+        if self.enabled:
+            for form in forms:
+                self.jobs.append(("tree", (delimitation, scale, fout, form, show_support)))
+
+
+    def add_llh_plot(self, llhs, fout):
+        if self.enabled:
+            self.jobs.append(("llh", (list(llhs), fout)))
+
+
+    def run(self):
+        """Draw all queued figures, returns the files written"""
+        jobs = self.jobs
+        self.jobs = []
+        if len(jobs) == 0:
+            return []
+        pool = multiprocessing.Pool(min(self.processes, len(jobs)))
+        try:
+            fouts = pool.map(render_job, jobs, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+        return fouts
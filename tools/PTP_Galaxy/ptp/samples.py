@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+
+import numpy
+
+from ptp.ptpllh import partition_setting
+
+
+class sample_sink:
+    """MCMC samples kept on disk: every partition is a row of uint32 species
+    labels, rows are buffered and appended to a binary file chunk_size at a
+    time, so memory does not grow with the number of samples. Without a path
+    the file is a new temporary file in directory (the system temp dir if None)"""
+    def __init__(self, numtaxa, taxa_order, path = None, chunk_size = 1024, min_br = 0.0001, directory = None):
+        self.numtaxa = numtaxa
+        self.taxa_order = taxa_order
+        self.chunk_size = chunk_size
+        self.min_br = min_br
+        if path == None:
+            fd, path = tempfile.mkstemp(prefix = "bptp_", suffix = ".parts", dir = directory)
+            os.close(fd)
+        else:
+            open(path, "wb").close()
+        self.path = path
+        self.llhs = []
+        """index in self.trees of the tree every sample was drawn on"""
+        self.tree_idx = []
+        self.trees = []
+        self.num = 0
+        self.buffer = numpy.zeros((chunk_size, numtaxa), dtype = numpy.uint32)
+        self.buffered = 0
+        self._partitions = None
+
+
+    def __len__(self):
+        return self.num
+
+
+    def __getstate__(self):
+        """the memory map is not pickled, it is reopened on demand"""
+        self.flush()
+        state = self.__dict__.copy()
+        state["_partitions"] = None
+        state["buffer"] = None
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buffer = numpy.zeros((self.chunk_size, self.numtaxa), dtype = numpy.uint32)
+
+
+    def add_tree(self, tree):
+        """tree (a ptree) of the samples added next"""
+        self.trees.append(tree)
+
+
+    def add(self, partition, llh):
+        self.buffer[self.buffered] = partition
+        self.buffered = self.buffered + 1
+        self.llhs.append(llh)
+        self.tree_idx.append(len(self.trees) - 1)
+        self.num = self.num + 1
+        if self.buffered == self.chunk_size:
+            self.flush()
+
+
+    def flush(self):
+        if self.buffered > 0:
+            with open(self.path, "ab") as f:
+                f.write(self.buffer[:self.buffered].tobytes())
+            self.buffered = 0
+            self._partitions = None
+
+
+    def extend(self, other):
+        """Append the samples of other and delete its file"""
+        self.flush()
+        other.flush()
+        with open(self.path, "ab") as fout, open(other.path, "rb") as fin:
+            shutil.copyfileobj(fin, fout)
+        offset = len(self.trees)
+        self.trees.extend(other.trees)
+        self.tree_idx.extend([idx + offset for idx in other.tree_idx])
+        self.llhs.extend(other.llhs)
+        self.num = self.num + other.num
+        self._partitions = None
+        other.remove()
+
+
+    def get_partitions(self):
+        """All samples as a read only (num, numtaxa) memory mapped array"""
+        self.flush()
+        if self._partitions is None:
+            if self.num == 0:
+                self._partitions = numpy.zeros((0, self.numtaxa), dtype = numpy.uint32)
+            else:
+                self._partitions = numpy.memmap(self.path, dtype = numpy.uint32, mode = "r", shape = (self.num, self.numtaxa))
+        return self._partitions
+
+
+    def get_setting(self, i):
+        """species_setting of sample i, rebuilt from its partition"""
+        tree = self.trees[self.tree_idx[i]]
+        return partition_setting(tree = tree, partition = self.get_partitions()[i], taxa_order = self.taxa_order, minbr = self.min_br)
+
+
+    def get_settings(self):
+        return lazy_settings(self)
+
+
+    def remove(self):
+        self._partitions = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class lazy_settings:
+    """List like view of the settings of a sample_sink, a setting is only
+    built when it is looked up"""
+    def __init__(self, sink):
+        self.sink = sink
+
+
+    def __len__(self):
+        return len(self.sink)
+
+
+    def __getitem__(self, i):
+        if i < 0:
+            i = i + len(self.sink)
+        if i < 0 or i >= len(self.sink):
+            raise IndexError("sample index out of range")
+        return self.sink.get_setting(i)
@@ -1,150 +1,270 @@
 #! /usr/bin/env python
-import matplotlib
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import sys
 import argparse
 import os
 import numpy
-from ptp.ptpllh import species_setting, showTree
+from ptp.ptpllh import species_setting
+from ptp.render import render_queue
 import datetime
 import re
-
-
-class pnode:
-    def __init__(self, newpartition, lastpnode, all_taxa, pmap, all_partitions, bound, taxa_order, numtrees):
-        #all_taxa: set; newpartition: tuple of idices; lastnode: pnode; pmap: dictionary; all_partitions: list; bound: float
-        self.numtrees = numtrees
+import math
+import multiprocessing
+import time
+
+
+class partition_search:
+    """Branch and bound search for the set of disjoint subsets of pmap covering
+    all taxa with the highest summed support (count * size of every subset).
+    Depth first and non recursive, all state lives on the object. The next
+    taxon to cover is always the lowest unprocessed one, processed taxa are
+    kept as an integer bitset. Every unprocessed taxon can add at most the
+    highest count of a subset holding it, a branch is cut when that cannot
+    reach bound or beat the best cover found so far, or when the same set of
+    taxa was already reached with at least the same support. max_nodes and max_time (seconds)
+    stop the search early, the best cover found so far is returned"""
+    def __init__(self, pmap, taxa_order, bound, numtrees, max_nodes = 0, max_time = 0):
         self.taxa_order = taxa_order
+        self.numtaxa = len(taxa_order)
         self.bound = bound
-        self.all_partitions = all_partitions
-        self.pmap = pmap
-        self.all_taxa = all_taxa
-        self.all_idx = set(range(len(all_taxa)))
-        self.up = lastpnode
-        self.partition = newpartition
-        self.allprocessed_taxa_idx = set([])
-        if not self.up == None:
-            for idx in self.up.allprocessed_taxa_idx:
-                self.allprocessed_taxa_idx.add(idx)
-        for idx in newpartition:
-            self.allprocessed_taxa_idx.add(idx)
-        self.next_partition_list = []
-        self.support = self.pmap.get(self.partition, 0) * len(self.partition)
-        if not self.up == None:
-            self.sumsupport = self.up.sumsupport + self.support
-        else:
-            self.sumsupport = self.support
-        self.isvalid = False
+        self.numtrees = numtrees
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.subsets = list(pmap.keys())
+        self.masks = []
+        self.weights = []
+        """candidate subsets of every taxon, in pmap order"""
+        self.candidates = [[] for i in range(self.numtaxa)]
+        for i in range(len(self.subsets)):
+            subset = self.subsets[i]
+            mask = 0
+            for idx in subset:
+                mask = mask | (1 << idx)
+            self.masks.append(mask)
+            self.weights.append(pmap[subset] * len(subset))
+            for idx in subset:
+                self.candidates[idx].append(i)
+        self.taxon_max = [0] * self.numtaxa
+        for i in range(len(self.subsets)):
+            for idx in self.subsets[i]:
+                self.taxon_max[idx] = max(self.taxon_max[idx], pmap[self.subsets[i]])
+        self.subset_max = [sum([self.taxon_max[idx] for idx in subset]) for subset in self.subsets]
+        self.maxsupport = 0
+        self.best = None
+        self.nodes = 0
+        self.complete = True
+
 
     def search(self):
-        remains = self.all_idx - self.allprocessed_taxa_idx
+        full = (1 << self.numtaxa) - 1
+        started = time.time()
+        seen = {}
+        """stack entries: processed taxa, bound on the support still to come, support, path (subset, parent path)"""
+        stack = [(0, sum(self.taxon_max), 0, None)]
+        while len(stack) > 0:
+            if self.max_nodes > 0 and self.nodes >= self.max_nodes:
+                self.complete = False
+                break
+            if self.max_time > 0 and self.nodes % 1000 == 0 and time.time() - started > self.max_time:
+                self.complete = False
+                break
+            processed, rest, support, path = stack.pop()
+            self.nodes = self.nodes + 1
+            upper = rest + support
+            if upper < self.bound:
+                continue
+            if processed == full:
+                if support > self.maxsupport:
+                    self.maxsupport = support
+                    self.best = path
+                continue
+            if upper <= self.maxsupport or seen.get(processed, -1) >= support:
+                continue
+            seen[processed] = support
+            remains = full & ~processed
+            taxon = (remains & -remains).bit_length() - 1
+            children = []
+            for i in self.candidates[taxon]:
+                mask = self.masks[i]
+                if mask & processed == 0:
+                    children.append((processed | mask, rest - self.subset_max[i], support + self.weights[i], (i, path)))
+            stack.extend(reversed(children))
+        return self.get_species()
+
+
+    def get_species(self):
+        """Species (lists of names) and their support, last chosen subset first"""
+        spes = []
+        support = []
+        if self.best != None:
+            print("Max support value: " + repr(self.maxsupport))
+            path = self.best
+            while path != None:
+                i, path = path
+                spe = []
+                for idx in self.subsets[i]:
+                    spe.append(self.taxa_order[idx])
+                spes.append(spe)
+                support.append(float(self.weights[i]) / float(len(self.subsets[i]) * self.numtrees))
+        else:
+            print("Bestlastnode == None")
+        return spes, support
 
-        if (len(remains) * self.numtrees + self.sumsupport) < self.bound:
-            return []
 
-        if len(remains) > 0:
-            next_taxa_to_include_idx = list(remains)[0]
+def bbsearch(pmap, taxa_order, bound, numtrees, max_nodes = 0, max_time = 0):
+    return partition_search(pmap = pmap, taxa_order = taxa_order, bound = bound, numtrees = numtrees, max_nodes = max_nodes, max_time = max_time).search()
 
-            for par in self.all_partitions:
-                spar = set(par)
-                if (next_taxa_to_include_idx in spar) and (len(spar & self.allprocessed_taxa_idx) == 0):
-                    self.next_partition_list.append(par)
 
-            return self.next_partition_list
-        else:
-            self.isvalid = True
-            return []
-
-    def get_support(self):
-        return float(self.support) / float(len(self.partition) * self.numtrees)
-
-    def __str__(self):
-        return repr(self.partition) + " : "+repr(self.support)
-
-
-def rc_function(newpartition, lastpnode, all_taxa, pmap, all_partitions, bound, taxa_order, numtrees):
-    global maxsupport
-    global bestlastnode
-    nextnode = pnode(newpartition = newpartition, lastpnode = lastpnode, all_taxa = all_taxa, pmap = pmap, all_partitions = all_partitions, bound = bound, taxa_order = taxa_order, numtrees = numtrees)
-    nextpartitions = nextnode.search()
-    if len(nextpartitions) == 0:
-        if nextnode.isvalid:
-            if nextnode.sumsupport > maxsupport:
-                maxsupport = nextnode.sumsupport
-                bestlastnode = nextnode
-    else:
-        for par in nextpartitions:
-            rc_function(newpartition = par, lastpnode = nextnode, all_taxa = all_taxa, pmap = pmap, all_partitions = all_partitions, bound = bound, taxa_order = taxa_order, numtrees = numtrees)
-
-
-def bbsearch(pmap, taxa_order, bound, numtrees):
-    #init
-    global maxsupport
-    global bestlastnode
-    maxsupport = 0
-    bestlastnode = None
-    all_taxa_set = set(taxa_order)
-    all_partitions = pmap.keys()
-    pnode0 = pnode(newpartition = tuple([]), lastpnode = None, all_taxa = all_taxa_set, pmap = pmap, all_partitions = all_partitions, bound = bound, taxa_order = taxa_order, numtrees = numtrees)
-    inipartitions = pnode0.search()
-
-    #search for every cases containing the first taxa name
-    for par in inipartitions:
-        rc_function(newpartition = par , lastpnode = pnode0, all_taxa = all_taxa_set, pmap = pmap, all_partitions = all_partitions, bound = bound, taxa_order = taxa_order, numtrees = numtrees)
-
-    #return the results
-    spes = []
-    support = []
-    if not bestlastnode == None:
-        print("Max support value: " + repr(maxsupport))
-        currnode = bestlastnode
-        while not currnode.up == None:
-            spe = []
-            for idx in currnode.partition:
-                spe.append(taxa_order[idx])
-            spes.append(spe)
-            support.append(currnode.get_support())
-            currnode = currnode.up
-    else:
-        print("Bestlastnode == None")
+def relabel(x):
+    """Labels renumbered 0..k-1 in order of first appearance, and k"""
+    labels, first, inverse = numpy.unique(numpy.asarray(x), return_index = True, return_inverse = True)
+    rank = numpy.argsort(numpy.argsort(first))
+    return rank[inverse.ravel()], len(labels)
+
+
+def entropy(counts, n):
+    p = counts[counts > 0] / float(n)
+    return float(-numpy.sum(p * numpy.log2(p)))
 
-    return spes, support
+
+def _mutual_info(x, kx, xcounts, y, ky, ycounts, n):
+    """Mutual information of two relabeled partitions from one bincount of the contingency table"""
+    table = numpy.bincount(x * ky + y, minlength = kx * ky)
+    cells = numpy.flatnonzero(table)
+    c = table[cells].astype(numpy.float64)
+    return float(numpy.sum(c / n * numpy.log2(c * n / (xcounts[cells // ky] * ycounts[cells % ky]))))
+
+
+def _nmi(I, hx, hy):
+    if (hx + hy) == 0:
+        return 1.0
+    else:
+        return I / ((hx + hy) / 2)
 
 
 def mutual_info(x,y):
     """Mutual information"""
-    N = numpy.double(x.size)
-    I = 0.0
-    eps = numpy.finfo(float).eps
-    for l1 in numpy.unique(x):
-        for l2 in numpy.unique(y):
-            #Find the intersections
-            l1_ids=numpy.nonzero(x==l1)[0]
-            l2_ids=numpy.nonzero(y==l2)[0]
-            pxy=(numpy.double(numpy.intersect1d(l1_ids,l2_ids).size)/N)+eps
-            I+=pxy*numpy.log2(pxy/((l1_ids.size/N)*(l2_ids.size/N)))
-    return I
+    x, kx = relabel(x)
+    y, ky = relabel(y)
+    return _mutual_info(x, kx, numpy.bincount(x), y, ky, numpy.bincount(y), len(x))
 
 
 def nmi(x,y):
     """Normalized mutual information"""
-    x = numpy.array(x)
-    y = numpy.array(y)
-    N = numpy.double(x.size)
-    I = mutual_info(x,y)
-    Hx = 0
-    for l1 in numpy.unique(x):
-        l1_count=numpy.nonzero(x==l1)[0].size
-        Hx+=-(numpy.double(l1_count)/N)*numpy.log2(numpy.double(l1_count)/N)
-    Hy=0
-    for l2 in numpy.unique(y):
-        l2_count=numpy.nonzero(y==l2)[0].size
-        Hy+=-(numpy.double(l2_count)/N)*numpy.log2(numpy.double(l2_count)/N)
-    if (Hx+Hy) == 0:
-        return 1.0
-    else:
-        return I/((Hx+Hy)/2)
+    x, kx = relabel(x)
+    y, ky = relabel(y)
+    xcounts = numpy.bincount(x)
+    ycounts = numpy.bincount(y)
+    n = len(x)
+    I = _mutual_info(x, kx, xcounts, y, ky, ycounts, n)
+    return _nmi(I, entropy(xcounts, n), entropy(ycounts, n))
+
+
+def _nmi_scores(job):
+    """Weighted NMI sums of the pairs (u, v > u) with u % step == offset, run in a worker process"""
+    labels, ks, counts, entropies, weights, n, offset, step = job
+    num = len(labels)
+    scores = numpy.zeros(num, dtype = numpy.float64)
+    for u in range(offset, num, step):
+        for v in range(u + 1, num):
+            I = _mutual_info(labels[u], ks[u], counts[u], labels[v], ks[v], counts[v], n)
+            value = _nmi(I, entropies[u], entropies[v])
+            scores[u] = scores[u] + weights[v] * value
+            scores[v] = scores[v] + weights[u] * value
+    return scores
+
+
+class max_nmi:
+    """Find the sampled partition with the highest sum of NMI to all samples.
+    Partitions equal up to relabeling are evaluated once and weighted by their
+    multiplicity. With samples > 0, every partition is compared against that
+    many randomly drawn samples instead of all of them, and the standard error
+    of the estimate is reported"""
+    def __init__(self, partitions, processes = 1, samples = 0, seed = 1234):
+        self.num = len(partitions)
+        self.processes = max(processes, 1)
+        self.samples = samples
+        self.seed = seed
+        self.labels = []
+        self.ks = []
+        self.weights = []
+        """last sample index of every distinct partition, ties go to the last sample as before"""
+        self.last = []
+        self.uid = numpy.zeros(self.num, dtype = numpy.int64)
+        index = {}
+        for i in range(self.num):
+            x, k = relabel(partitions[i])
+            key = x.tobytes()
+            u = index.get(key, -1)
+            if u == -1:
+                u = len(self.labels)
+                index[key] = u
+                self.labels.append(x)
+                self.ks.append(k)
+                self.weights.append(0)
+                self.last.append(i)
+            self.weights[u] = self.weights[u] + 1
+            self.last[u] = i
+            self.uid[i] = u
+        self.n = len(self.labels[0]) if self.num > 0 else 0
+        self.counts = [numpy.bincount(x).astype(numpy.float64) for x in self.labels]
+        self.entropies = [entropy(c, self.n) for c in self.counts]
+        self.stderr = 0.0
+
+
+    def exact_scores(self):
+        num = len(self.labels)
+        step = min(self.processes, num)
+        jobs = [(self.labels, self.ks, self.counts, self.entropies, self.weights, self.n, offset, step) for offset in range(step)]
+        if step > 1:
+            pool = multiprocessing.Pool(processes = step)
+            try:
+                results = pool.map(_nmi_scores, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_nmi_scores(job) for job in jobs]
+        """nmi of a partition with itself is 1"""
+        scores = numpy.array(self.weights, dtype = numpy.float64)
+        for r in results:
+            scores = scores + r
+        return scores
+
+
+    def sampled_scores(self):
+        rng = numpy.random.default_rng(self.seed)
+        refs = self.uid[rng.integers(0, self.num, size = self.samples)]
+        num = len(self.labels)
+        scores = numpy.zeros(num, dtype = numpy.float64)
+        cache = {}
+        for u in range(num):
+            values = numpy.zeros(len(refs), dtype = numpy.float64)
+            for j in range(len(refs)):
+                v = int(refs[j])
+                if u == v:
+                    values[j] = 1.0
+                    continue
+                key = (min(u, v), max(u, v))
+                if not key in cache:
+                    I = _mutual_info(self.labels[u], self.ks[u], self.counts[u], self.labels[v], self.ks[v], self.counts[v], self.n)
+                    cache[key] = _nmi(I, self.entropies[u], self.entropies[v])
+                values[j] = cache[key]
+            scores[u] = values.mean() * self.num
+            if len(refs) > 1:
+                self.stderr = max(self.stderr, values.std(ddof = 1) / math.sqrt(len(refs)))
+        return scores
+
+
+    def best(self):
+        """Index of the sample with the highest NMI sum"""
+        if self.samples > 0 and self.samples < self.num:
+            scores = self.sampled_scores()
+            print("Max NMI estimated from " + repr(self.samples) + " sampled partitions, max standard error of the mean NMI: " + "{0:.4f}".format(self.stderr))
+        else:
+            scores = self.exact_scores()
+        top = scores.max()
+        candidates = numpy.flatnonzero(scores == top)
+        return max([self.last[u] for u in candidates])
 
 
 def translate2idx(taxon, taxaorder):
@@ -155,15 +275,115 @@ def translate2idx(taxon, taxaorder):
 
 
 def add_bayesain_support(delimitation, pmap, taxaorder, numpar):
-    for node in delimitation.root.traverse(strategy='preorder'):
-        taxa_list = node.get_leaf_names()
-        taxa_idx = translate2idx(taxa_list, taxaorder)
+    """support of every node id, the leaves below a node are a contiguous span of the array tree"""
+    tree = delimitation.tree
+    taxa_pos = tree.taxa_positions(taxaorder)
+    supports = []
+    for node in range(tree.num_nodes):
+        taxa_idx = frozenset(taxa_pos[tree.leaf_start[node]:tree.leaf_end[node]].tolist())
         support = pmap.get(taxa_idx, 0.0) / float(numpar)
-        node.add_feature("bs", support)
-        #node.support = support
+        supports.append(support)
+    delimitation.supports = supports
     return delimitation
 
 
+class partition_support:
+    """Support of the species (subsets of taxa) in a set of sampled partitions.
+    partitions is anything that slices into a 2-D array of labels, one row
+    per sample (a list of lists or a memory mapped label matrix). A subset is
+    hashed as the sum of random 63 bit values of its taxa, so all subsets of
+    a chunk of samples are counted with a few bincounts"""
+    def __init__(self, partitions, numtaxa, chunk_size = 4096):
+        self.partitions = partitions
+        self.numtaxa = numtaxa
+        self.num = len(partitions)
+        self.chunk_size = chunk_size
+        rng = numpy.random.default_rng(20140217)
+        """three 21 bit limbs per taxon, limb sums stay exact in float64 bincounts"""
+        self.limbs = rng.integers(0, 2**21, size = (3, numtaxa)).astype(numpy.float64)
+        self._count()
+
+
+    def _rows(self, start, end):
+        return numpy.asarray(self.partitions[start:end], dtype = numpy.int64)
+
+
+    def _group_hashes(self, rows):
+        """Every (sample, label) group of rows: its row, label, size and hash,
+        ordered by row then label"""
+        numrows = rows.shape[0]
+        width = int(rows.max()) + 1
+        flat = (numpy.arange(numrows, dtype = numpy.int64)[:, None] * width + rows).ravel()
+        sizes = numpy.bincount(flat, minlength = numrows * width)
+        keys = numpy.flatnonzero(sizes)
+        hashes = numpy.zeros(len(keys), dtype = numpy.uint64)
+        for i in range(3):
+            limb_sum = numpy.bincount(flat, weights = numpy.tile(self.limbs[i], numrows), minlength = numrows * width)[keys]
+            hashes = hashes + (limb_sum.astype(numpy.uint64) << numpy.uint64(21 * i))
+        return keys // width, keys % width, sizes[keys], hashes
+
+
+    def _count(self):
+        """Count every subset and remember where it was first seen"""
+        all_hashes = []
+        all_counts = []
+        all_first = []
+        for start in range(0, self.num, self.chunk_size):
+            rows = self._rows(start, start + self.chunk_size)
+            row, label, sizes, hashes = self._group_hashes(rows)
+            uhashes, first, counts = numpy.unique(hashes, return_index = True, return_counts = True)
+            all_hashes.append(uhashes)
+            all_counts.append(counts)
+            all_first.append(numpy.stack([row[first] + start, label[first]], axis = 1))
+        if self.num == 0:
+            self.hashes = numpy.zeros(0, dtype = numpy.uint64)
+            self.counts = numpy.zeros(0, dtype = numpy.int64)
+            self.first = numpy.zeros((0, 2), dtype = numpy.int64)
+            return
+        hashes = numpy.concatenate(all_hashes)
+        self.hashes, first, inverse = numpy.unique(hashes, return_index = True, return_inverse = True)
+        self.counts = numpy.bincount(inverse.ravel(), weights = numpy.concatenate(all_counts)).astype(numpy.int64)
+        self.first = numpy.concatenate(all_first)[first]
+
+
+    def get_pmap(self):
+        """subset (frozenset of taxa indices) -> number of samples containing it,
+        in order of first appearance"""
+        pmap = {}
+        for i in numpy.lexsort((self.first[:, 1], self.first[:, 0])):
+            sample, label = self.first[i]
+            row = numpy.asarray(self.partitions[int(sample)])
+            pmap[frozenset(numpy.flatnonzero(row == label).tolist())] = int(self.counts[i])
+        return pmap
+
+
+    def sample_scores(self):
+        """Sum over taxa of the count of the subset holding the taxon, for every sample"""
+        scores = numpy.zeros(self.num, dtype = numpy.int64)
+        for start in range(0, self.num, self.chunk_size):
+            rows = self._rows(start, start + self.chunk_size)
+            row, label, sizes, hashes = self._group_hashes(rows)
+            counts = self.counts[numpy.searchsorted(self.hashes, hashes)]
+            scores[start:start + rows.shape[0]] = numpy.bincount(row, weights = counts * sizes, minlength = rows.shape[0]).astype(numpy.int64)
+        return scores
+
+
+    def best_sample(self):
+        """First sample with the highest score"""
+        return int(numpy.argmax(self.sample_scores()))
+
+
+    def taxon_support(self, i):
+        """Support of the subset holding each taxon in sample i"""
+        rows = self._rows(i, i + 1)
+        row, label, sizes, hashes = self._group_hashes(rows)
+        counts = self.counts[numpy.searchsorted(self.hashes, hashes)]
+        support = numpy.zeros(self.numtaxa, dtype = numpy.float64)
+        for j in range(len(label)):
+            support[rows[0] == label[j]] = float(counts[j]) / float(self.num)
+        return support.tolist()
+
+
 class partitionparser:
     def __init__(self, pfin = None, lfin = None, taxa_order = None, partitions = [], llhs = [], scale = 500, fileextension=None, ptp_status= None):
         self.taxaorder = taxa_order
@@ -221,15 +441,15 @@ class partitionparser:
 
 
     def hpd_numpartitions(self):
-        pmlist = []
         idxend = self.hpdidx
-        for partition in self.sorted_partitions[:idxend]:
-            pmlist.append(max(partition))
+        pmlist = numpy.asarray(self.sorted_partitions[:idxend]).max(axis = 1)
 
-        return min(pmlist), max(pmlist), numpy.mean(pmlist)
+        return int(pmlist.min()), int(pmlist.max()), numpy.mean(pmlist)
 
 
-    def summary(self, fout = "", region = 1.0, bnmi = False, ML_par = None, ml_spe_setting = None, sp_setting = [], plot = True):
+    def summary(self, fout = "", region = 1.0, bnmi = False, ML_par = None, ml_spe_setting = None, sp_setting = [], plot = True, processes = 1, nmi_samples = 0, renderer = None):
+        """figures go to renderer (a render_queue) and are drawn by the caller,
+        without one they are drawn here once all numeric results are written"""
 
         if region >= 1.0 or region <=0:
             tpartitions = self.partitions
@@ -244,13 +464,11 @@ class partitionparser:
             """
             fo_partsum = open(fout + "_PTPPartSum.txt", "w")
             fo_parts   = open(fout + "_PTPParts.txt", "w")
-            pmap = {}
-            idxpars = []
-            for partition in tpartitions:
-                pars = self._convert2idx(partition)
-                idxpars.append(pars)
-                for par in pars:
-                    pmap[par]= pmap.get(par, 0) + 1
+            own_renderer = renderer == None
+            if own_renderer:
+                renderer = render_queue(processes = processes)
+            psupport = partition_support(partitions = tpartitions, numtaxa = self.numtaxa)
+            pmap = psupport.get_pmap()
 
             """Output partition summary"""
             # kv: (-kv[1], kv[0])
@@ -262,69 +480,54 @@ class partitionparser:
                 fo_partsum.write(onespe + ": " + "{0:.3f}".format(float(value)/float(len(tpartitions))) + "\n")
             fo_partsum.close()
 
-            """Output all partitions"""
-            output = "#taxaorder:"+self._print_list(self.taxaorder)
-            for i in range(len(tpartitions)):
-                partition = tpartitions[i]
-                output= output + self._print_list(partition)
-            fo_parts.write(output)
+            """Output all partitions, written line by line as tpartitions can be a memory mapped sample file"""
+            fo_parts.write("#taxaorder:"+self._print_list(self.taxaorder))
+            for partition in tpartitions:
+                fo_parts.write(self._print_list(partition))
             fo_parts.close()
 
             """Output the best partition found"""
-            bestpar = self.combine_simple_heuristic(tpartitions = tpartitions, pmap = pmap, idxpars = idxpars, fo = fout + "_PTPhSuppPart", sp_setting = sp_setting, plot = plot)
-            self.combine_simple_heuristic_spart(tpartitions = tpartitions, pmap = pmap, idxpars = idxpars, fo = fout + "_PTPhSuppPart.spart", sp_setting = sp_setting, plot = plot)
+            bestpar = self.combine_simple_heuristic(tpartitions = tpartitions, psupport = psupport, fo = fout + "_PTPhSuppPart", sp_setting = sp_setting, plot = plot, pmap = pmap, renderer = renderer)
+            self.combine_simple_heuristic_spart(tpartitions = tpartitions, psupport = psupport, fo = fout + "_PTPhSuppPart.spart", sp_setting = sp_setting, plot = plot)
 
             if bnmi:
-                self.combine_max_NMI(tpartitions = tpartitions, pmap = pmap, fo = fout + "_PTPhNMIPart.txt")
-                self.combine_max_NMI_spart(tpartitions = tpartitions, pmap = pmap, fo = fout + "_PTPhNMIPart.spart")
+                nmipar = max_nmi(partitions = tpartitions, processes = processes, samples = nmi_samples).best()
+                self.combine_max_NMI(tpartitions = tpartitions, pmap = pmap, fo = fout + "_PTPhNMIPart.txt", bestidx = nmipar)
+                self.combine_max_NMI_spart(tpartitions = tpartitions, pmap = pmap, fo = fout + "_PTPhNMIPart.spart", bestidx = nmipar)
 
             if ML_par != None:
-                self.combine_max_LLH(bestpar = ML_par, tpartitions = tpartitions, pmap = pmap, fo = fout + "_PTPMLPart", spe_setting = ml_spe_setting, plot = plot)
+                self.combine_max_LLH(bestpar = ML_par, tpartitions = tpartitions, pmap = pmap, fo = fout + "_PTPMLPart", spe_setting = ml_spe_setting, plot = plot, renderer = renderer)
                 self.combine_max_LLH_spart(bestpar = ML_par, tpartitions = tpartitions, pmap = pmap, fo = fout + "_PTPMLPart.spart", spe_setting = ml_spe_setting, plot = plot)
 
             """MCMC LLH"""
             if (region >= 1.0 or region <=0) and len(tllhs)>0:
-                plt.plot(tllhs)
-                plt.ylabel('Log likelihood')
-                plt.xlabel('MCMC iterations after thinning')
-                plt.savefig(fout + "_PTP_MCMCllh.pdf", bbox_inches = "tight")
+                renderer.add_llh_plot(llhs = tllhs, fout = fout + "_PTP_MCMCllh.pdf")
                 with open(fout + "_PTP_MCMCllh.txt", "w") as f:
                     for llh in tllhs:
                         f.write(repr(llh) + "\n")
+
+            if own_renderer:
+                renderer.run()
             return bestpar
         else:
             return None
 
 
-    def combine_simple_heuristic(self, tpartitions, pmap, idxpars, fo, sp_setting = [], plot = True):
-        maxw = 0
-        bestpar = None
-        bestsupport = None
-
-        for i in range(len(tpartitions)):
-            partition = tpartitions[i]
-            pars = idxpars[i]
-            support = [0.0] * self.numtaxa
-            sumw = 0.0
-            for par in pars:
-                w = pmap.get(par, 0.0)
-                for idx in par:
-                    support[idx] = float(w)/float(len(tpartitions))
-                    sumw = sumw + w
-            if sumw > maxw:
-                maxw = sumw
-                bestpar = i
-                bestsupport = support
+    def combine_simple_heuristic(self, tpartitions, psupport, fo, sp_setting = [], plot = True, pmap = None, renderer = None):
+        """the partition whose taxa sit in the best supported subsets"""
+        bestpar = psupport.best_sample()
+        bestsupport = psupport.taxon_support(bestpar)
 
         self.meansupport = numpy.mean(bestsupport)
         spes, support = self._partition2names(tpartitions[bestpar], bestsupport)
         spe_setting = sp_setting[bestpar]
 
         if plot:
+            if pmap == None:
+                pmap = psupport.get_pmap()
             spe_setting = add_bayesain_support(delimitation = spe_setting, pmap = pmap, taxaorder =self.taxaorder, numpar = len(tpartitions))
-            spe_setting.root.write(features = ["bs"], outfile = fo + ".tre", format = 0)
-            showTree(delimitation = spe_setting, scale = self.scale, render = True, fout = fo, form = "svg", show_support = True)
-            showTree(delimitation = spe_setting, scale = self.scale, render = True, fout = fo, form = "png", show_support = True)
+            spe_setting.get_ete_tree()[0].write(features = ["bs"], outfile = fo + ".tre", format = 0)
+            self._render(spe_setting, fo, renderer)
 
         fo_bestpar = open(fo +".txt", "w")
         fo_bestpar.write("# Most supported partition found by simple heuristic search\n")
@@ -337,25 +540,10 @@ class partitionparser:
 
         return tpartitions[bestpar]
 
-    def combine_simple_heuristic_spart(self, tpartitions, pmap, idxpars, fo, sp_setting = [], plot = False):
-        maxw = 0
-        bestpar = None
-        bestsupport = None
-
-        for i in range(len(tpartitions)):
-            partition = tpartitions[i]
-            pars = idxpars[i]
-            support = [0.0] * self.numtaxa
-            sumw = 0.0
-            for par in pars:
-                w = pmap.get(par, 0.0)
-                for idx in par:
-                    support[idx] = float(w)/float(len(tpartitions))
-                    sumw = sumw + w
-            if sumw > maxw:
-                maxw = sumw
-                bestpar = i
-                bestsupport = support
+    def combine_simple_heuristic_spart(self, tpartitions, psupport, fo, sp_setting = [], plot = False):
+        """the partition whose taxa sit in the best supported subsets"""
+        bestpar = psupport.best_sample()
+        bestsupport = psupport.taxon_support(bestpar)
 
         self.meansupport = numpy.mean(bestsupport)
         spes, support = self._partition2names(tpartitions[bestpar], bestsupport)
@@ -420,16 +608,10 @@ class partitionparser:
         fo_bestpar.close()
 
 
-    def combine_max_NMI_spart(self, tpartitions, pmap, fo):
-        bestpar = None
-        hnmi = 0.0
-        for parx in tpartitions:
-            sumnmi = 0
-            for pary in tpartitions:
-                sumnmi += nmi(parx, pary)
-            if sumnmi >= hnmi:
-                bestpar = parx
-                hnmi = sumnmi
+    def combine_max_NMI_spart(self, tpartitions, pmap, fo, bestidx = None):
+        if bestidx == None:
+            bestidx = max_nmi(partitions = tpartitions).best()
+        bestpar = tpartitions[bestidx]
 
         idxpar = self._convert2idx(bestpar)
         bestsupport = [0.0] * self.numtaxa
@@ -444,7 +626,7 @@ class partitionparser:
 
 
         fo_bestpar = open(fo, "w")
-        file= re.sub(r'[^A-Za-z0-9_]', '_', file)
+        file= re.sub(r'[^A-Za-z0-9_]', '_', fo)
         fo_bestpar.write("begin spart;\n\n")
         fo_bestpar.write(f"Project_name = {file};\n")
         fo_bestpar.write(f'Date = {datetime.datetime.now().astimezone().isoformat()};\n')
@@ -501,16 +683,10 @@ class partitionparser:
 
 
 
-    def combine_max_NMI(self, tpartitions, pmap, fo):
-        bestpar = None
-        hnmi = 0.0
-        for parx in tpartitions:
-            sumnmi = 0
-            for pary in tpartitions:
-                sumnmi += nmi(parx, pary)
-            if sumnmi >= hnmi:
-                bestpar = parx
-                hnmi = sumnmi
+    def combine_max_NMI(self, tpartitions, pmap, fo, bestidx = None):
+        if bestidx == None:
+            bestidx = max_nmi(partitions = tpartitions).best()
+        bestpar = tpartitions[bestidx]
 
         idxpar = self._convert2idx(bestpar)
         bestsupport = [0.0] * self.numtaxa
@@ -531,7 +707,7 @@ class partitionparser:
         fo_bestpar.close()
 
 
-    def combine_max_LLH(self, bestpar, tpartitions, pmap, fo, spe_setting = None,  plot = True):
+    def combine_max_LLH(self, bestpar, tpartitions, pmap, fo, spe_setting = None,  plot = True, renderer = None):
         idxpar = self._convert2idx(bestpar)
         bestsupport = [0.0] * self.numtaxa
         for par in idxpar:
@@ -544,9 +720,8 @@ class partitionparser:
 
         if spe_setting != None and plot:
             spe_setting = add_bayesain_support(delimitation = spe_setting, pmap = pmap, taxaorder =self.taxaorder, numpar = len(tpartitions))
-            spe_setting.root.write(features = ["bs"], outfile = fo + ".tre", format = 0)
-            showTree(delimitation = spe_setting, scale = self.scale, render = True, fout = fo, form = "svg", show_support = True)
-            showTree(delimitation = spe_setting, scale = self.scale, render = True, fout = fo, form = "png", show_support = True)
+            spe_setting.get_ete_tree()[0].write(features = ["bs"], outfile = fo + ".tre", format = 0)
+            self._render(spe_setting, fo, renderer)
 
         fo_bestpar = open(fo +".txt", "w")
         fo_bestpar.write("# Max likilhood partition \n")
@@ -642,6 +817,16 @@ class partitionparser:
             #         ll.append(xx)
 
 
+    def _render(self, spe_setting, fo, renderer = None):
+        """queue the SVG and PNG tree plots, drawn right away without a renderer"""
+        if renderer == None:
+            queue = render_queue()
+            queue.add_tree(delimitation = spe_setting, fout = fo, scale = self.scale)
+            queue.run()
+        else:
+            renderer.add_tree(delimitation = spe_setting, fout = fo, scale = self.scale)
+
+
     def _print_list(self, l):
         ss = ""
         for e in l: